@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+
+## Reports the memory per ngram of the NgramIndex against the tuple keyed dicts the
+## models used before, and times a batch lookup with both. Use it to size models of
+## higher orders.
+##
+##   $ source setup
+##   $ python -m benchmarks.ngram_index -k 1 2 3 4
+
+import sys
+import time
+import argparse
+import contextlib
+import io
+
+import numpy as np
+
+from markov.model_laplace import MarkovModelLaplace
+from markov.scoring import batchTransitionIds
+from corpus import CorpusReader
+
+
+def dictBytes(ngramHash):
+    # the dict and its tuples, the word strings are shared with wordHash and not counted
+    return sys.getsizeof(ngramHash) + sum(sys.getsizeof(ngram) for ngram in ngramHash)
+
+
+def dictTransitionRows(tokenLists, order, ngramHash):
+    rows = []
+    for tokens in tokenLists:
+        ngrams = [tuple(tokens[i:i+order]) for i in range(len(tokens)-order)]
+        rows.append(np.fromiter((ngramHash.get(ngram, -1) for ngram in ngrams), dtype=np.int64, count=len(ngrams)))
+    return np.concatenate(rows)
+
+
+################ CLI App ##################
+def main():
+    parser = argparse.ArgumentParser(prog="ngram_index", description="reports the memory and lookup speed of the ngram index")
+
+    parser.add_argument('--order','-k',metavar='int', dest='orders',
+                        type=int, nargs='+', default=[1, 2, 3],
+                        help='orders of the markov model. default: 1 2 3')
+
+    parser.add_argument('--corpus', '-c', dest='corpus',
+                        type=str, nargs='?', default='data/corpora/original/posrev.txt',
+                        help='corpus to train on')
+
+    parser.add_argument('--test', '-t', dest='test',
+                        type=str, nargs='?', default='data/corpora/original/negrev.txt',
+                        help='reviews to look up')
+
+    args = parser.parse_args()
+
+    print("%2s | %9s | %6s | %10s | %10s | %9s | %9s" % ("k", "ngrams", "bits", "dict B/ng", "index B/ng", "dict", "index"))
+    for order in args.orders:
+        model = MarkovModelLaplace(order)
+        with contextlib.redirect_stdout(io.StringIO()): # swallow the progress output
+            model.trainOnCorpus(args.corpus)
+        index = model.ngramHash
+        ngramDict = dict(index.items())
+
+        tokenLists = [model._tokenize(review) for review in CorpusReader(args.test).reviews()]
+
+        tic = time.time()
+        dictRows = dictTransitionRows(tokenLists, order, ngramDict)
+        dictTime = time.time() - tic
+
+        tic = time.time()
+        rows, cols, segments = batchTransitionIds(tokenLists, order, index, model.wordHash)
+        indexTime = time.time() - tic
+
+        if not np.array_equal(rows, dictRows):
+            print("%2d | lookups differ!" % order)
+            return 1
+
+        print("%2d | %9d | %6d | %10.1f | %10.1f | %7.2f s | %7.2f s" % (order, len(index), order*index.bits,
+              dictBytes(ngramDict)/max(len(index), 1), index.bytesPerNgram(), dictTime, indexTime))
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
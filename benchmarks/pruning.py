@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+
+## Reports the size versus accuracy trade-off of pruning: trains a classifier on the
+## training split, prunes copies of it with every min count and relative entropy
+## threshold, and tests them on the test split.
+##
+##   $ source setup
+##   $ python -m benchmarks.pruning -k 1 2 -m 1 2 3 -e 0 1e-8 1e-7
+
+import os
+import sys
+import copy
+import time
+import argparse
+import contextlib
+import io
+import tempfile
+
+import numpy as np
+
+from markov import MarkovClassifier
+from markov.tokenizer import TOKENIZERS
+from corpus import CorpusReader
+
+SPLIT = 'data/corpora/simple_divide/'
+
+
+def transitions(classifier):
+    models = [classifier.pos_model, classifier.neg_model]
+    models = [model for backoff in models for model in getattr(backoff, 'models', [backoff])]
+    return sum(model.transCountMatrix.nnz for model in models)
+
+
+def fileSize(classifier):
+    with tempfile.TemporaryDirectory() as directory:
+        filepath = os.path.join(directory, 'model')
+        with contextlib.redirect_stdout(io.StringIO()):
+            classifier.saveToFile(filepath)
+        return os.path.getsize(filepath)
+
+
+def accuracy(classifier, posTokens, negTokens):
+    tic = time.time()
+    posLabels, _ = classifier.classify_many_tokens(posTokens)
+    negLabels, _ = classifier.classify_many_tokens(negTokens)
+    toc = time.time()
+    correct = np.count_nonzero(posLabels > 0) + np.count_nonzero(negLabels < 0)
+    return correct / (len(posLabels) + len(negLabels)), toc - tic
+
+
+################ CLI App ##################
+def main():
+    parser = argparse.ArgumentParser(prog="pruning", description="reports the size and accuracy of pruned classifiers")
+
+    parser.add_argument('--order','-k',metavar='int', dest='orders',
+                        type=int, nargs='+', default=[1, 2],
+                        help='orders of the markov model. default: 1 2')
+
+    parser.add_argument('--smoothing','-s', dest='smoothing',
+                        type=str, nargs='?', default='laplace', choices=['laplace', 'backoff', 'sgts'],
+                        help='smoothing technique. default: laplace')
+
+    parser.add_argument('--tokenizer', '-t', dest='tokenizer',
+                        type=str, nargs='?', default='regex', choices=sorted(TOKENIZERS),
+                        help='tokenizer for the reviews. default: regex')
+
+    parser.add_argument('--min-count', '-m', metavar='int', dest='min_counts',
+                        type=int, nargs='+', default=[1, 2, 3],
+                        help='min counts to prune with. default: 1 2 3')
+
+    parser.add_argument('--threshold', '-e', metavar='float', dest='thresholds',
+                        type=float, nargs='+', default=[0, 1e-9, 1e-8, 1e-7],
+                        help='relative entropy thresholds to prune with. default: 0 1e-9 1e-8 1e-7')
+
+    parser.add_argument('--split', dest='split',
+                        type=str, nargs='?', default=SPLIT,
+                        help='directory with the {pos,neg}rev_{train,test}.txt corpora. default: ' + SPLIT)
+
+    args = parser.parse_args()
+
+    print("%2s | %5s | %8s | %11s | %9s | %8s | %8s | %7s" % ("k", "min", "entropy", "transitions", "bytes", "size", "accuracy", "time"))
+    for order in args.orders:
+        classifier = MarkovClassifier(order, args.smoothing, args.tokenizer)
+        with contextlib.redirect_stdout(io.StringIO()): # swallow the progress output
+            classifier.trainOnCorpora(os.path.join(args.split, 'posrev_train.txt'), os.path.join(args.split, 'negrev_train.txt'))
+        tokenizer = classifier.getTokenizer()
+        posTokens = [tokenizer.tokenize(review) for review in CorpusReader(os.path.join(args.split, 'posrev_test.txt')).reviews()]
+        negTokens = [tokenizer.tokenize(review) for review in CorpusReader(os.path.join(args.split, 'negrev_test.txt')).reviews()]
+        fullSize = fileSize(classifier)
+
+        for minCount in args.min_counts:
+            for threshold in args.thresholds:
+                pruned = copy.deepcopy(classifier)
+                with contextlib.redirect_stdout(io.StringIO()):
+                    pruned.prune(minCount, threshold)
+                size = fileSize(pruned)
+                correct, seconds = accuracy(pruned, posTokens, negTokens)
+                print("%2d | %5d | %8.0e | %11d | %9d | %7.1f%% | %7.2f%% | %5.2f s" % (order, minCount, threshold,
+                      transitions(pruned), size, 100*size/fullSize, 100*correct, seconds))
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+
+## Scaling curves of training, saving and loading on the synthetic corpora of
+## generator.py, 1, 10, 100 (or 1000) times the size of the bundled corpora, written as
+## JSON with one row per scale for plotting time and memory against corpus size:
+##
+##   $ source setup
+##   $ python -m benchmarks.scaling -s 1 10 100 -k 2 -o bench/scaling.json
+##
+## Missing corpora are generated first, with generator.py into --corpus-dir. Every
+## scale is trained in a fresh process, so the peak RSS is that of its own training.
+## With --shards the shards are tokenized and counted in worker processes, the peak
+## RSS is then that of merging them and the worker peak that of the largest worker.
+## Training includes reading and tokenizing the corpora, like trainer.py without the
+## token cache. The synthetic reviews are space separated, so the whitespace
+## tokenizer reads them as they were written.
+
+import os
+import io
+import sys
+import json
+import time
+import tempfile
+import argparse
+import resource
+import subprocess
+import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from markov import MarkovClassifier
+from markov.modelfile import saveClassifier
+from benchmarks.suite import best, peakRss, environment, SMOOTHINGS, FORMAT_VERSION
+from generator import corpusPath, OUTPUT
+
+def countsModel(model):
+    # the model holding the transition counts, for backoff its highest order
+    return model.models[model.k] if hasattr(model, 'models') else model
+
+@contextlib.contextmanager
+def silencedStdout():
+    # swallows the progress of every review, also the one printed by the worker
+    # processes of the shards, which write to the inherited file descriptor
+    sys.stdout.flush()
+    saved = os.dup(1)
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            yield
+    finally:
+        os.dup2(saved, 1)
+        os.close(saved)
+        os.close(devnull)
+
+def benchmarkScale(posfile, negfile, smoothing, order, repeat, shards):
+    # runs in a fresh worker process for every scale
+    def train():
+        classifier = MarkovClassifier(order, smoothing, 'whitespace')
+        with silencedStdout():
+            classifier.trainOnCorpora(posfile, negfile, workers=shards, shards=shards)
+        return classifier
+    result = {}
+    result['train_seconds'], classifier = best(train, repeat)
+    result['peak_rss_bytes'] = peakRss()
+    if shards > 1:
+        result['peak_worker_rss_bytes'] = peakRss(resource.RUSAGE_CHILDREN)
+
+    models = [countsModel(classifier.pos_model), countsModel(classifier.neg_model)]
+    result['reviews'] = sum(sum(1 for _ in open(file)) for file in [posfile, negfile])
+    result['train_reviews_per_second'] = result['reviews'] / result['train_seconds']
+    result['corpus_bytes'] = os.path.getsize(posfile) + os.path.getsize(negfile)
+    result['vocabulary'] = len(set(models[0].wordHash) | set(models[1].wordHash))
+    result['ngrams'] = sum(len(model.ngramHash) for model in models)
+    result['transitions'] = sum(model.transCountMatrix.nnz for model in models)
+    result['count_dtype'] = str(np.result_type(*[model.transCountMatrix.dtype for model in models]))
+
+    with tempfile.TemporaryDirectory() as directory:
+        filepath = os.path.join(directory, 'model')
+        result['save_seconds'], result['file_bytes'] = best(lambda: saveClassifier(classifier, filepath), repeat)
+        with contextlib.redirect_stdout(io.StringIO()):
+            result['load_seconds'], _ = best(lambda: MarkovClassifier.loadFromFile(filepath), repeat)
+    return result
+
+def generateMissing(scales, corpusDir, method):
+    missing = [scale for scale in scales if not all(os.path.exists(corpusPath(corpusDir, sentiment, scale)) for sentiment in ['pos', 'neg'])]
+    if missing:
+        print("generating the corpora of scales %s..." % ' '.join(map(str, missing)))
+        command = [sys.executable, 'generator.py', '-m', method, '-o', corpusDir, '-s'] + [str(scale) for scale in missing]
+        if subprocess.run(command).returncode != 0:
+            raise Exception('could not generate the corpora')
+
+def formatRow(scale, row):
+    workerRss = "%10.1f" % (row['peak_worker_rss_bytes'] / 2**20) if 'peak_worker_rss_bytes' in row else "%10s" % "-"
+    return "%5d | %9d | %9d | %10d | %8.2f | %8.0f | %8.1f | %s | %10d | %8.3f" % (scale, row['reviews'], row['vocabulary'], row['transitions'],
+           row['train_seconds'], row['train_reviews_per_second'], row['peak_rss_bytes'] / 2**20, workerRss, row['file_bytes'], row['load_seconds'])
+
+
+################ CLI App ##################
+def main():
+    parser = argparse.ArgumentParser(prog="scaling", description="benchmarks training on synthetic corpora of growing size")
+
+    parser.add_argument('--scale', '-s', metavar='int', dest='scales',
+                        type=int, nargs='+', default=[1, 10, 100],
+                        help='sizes of the corpora, in multiples of the bundled corpora. default: 1 10 100')
+
+    parser.add_argument('--smoothing', dest='smoothing',
+                        type=str, nargs='?', default='laplace', choices=SMOOTHINGS,
+                        help='smoothing technique. default: laplace')
+
+    parser.add_argument('--order', '-k', metavar='int', dest='order',
+                        type=int, nargs='?', default=2,
+                        help='order of the markov model. default: 2')
+
+    parser.add_argument('--shards', metavar='int', dest='shards',
+                        type=int, nargs='?', default=1,
+                        help='count the corpora in this many shards, in as many processes, see trainer.py --shards. default: 1')
+
+    parser.add_argument('--repeat', '-r', metavar='int', dest='repeat',
+                        type=int, nargs='?', default=1,
+                        help='run every measurement this many times and keep the fastest. default: 1')
+
+    parser.add_argument('--method', '-m', dest='method',
+                        type=str, nargs='?', default='markov', choices=['markov', 'resample'],
+                        help='how generator.py writes missing corpora. default: markov')
+
+    parser.add_argument('--corpus-dir', dest='corpus_dir',
+                        type=str, nargs='?', default=OUTPUT,
+                        help='directory of the synthetic corpora. default: ' + OUTPUT)
+
+    parser.add_argument('--output', '-o', dest='output',
+                        type=str, nargs='?', default=None,
+                        help='write the results to this JSON file')
+
+    args = parser.parse_args()
+
+    if min(args.scales) < 1 or args.shards < 1:
+        print("scales and shards must be positive")
+        return 1
+
+    scales = sorted(set(args.scales))
+    generateMissing(scales, args.corpus_dir, args.method)
+
+    print("%s, k = %d, %d shard(s)" % (args.smoothing, args.order, args.shards))
+    print("%5s | %9s | %9s | %10s | %8s | %8s | %8s | %10s | %10s | %8s" % ("scale", "reviews", "words", "transits",
+          "train s", "reviews/s", "peak MiB", "worker MiB", "bytes", "load s"))
+    results = {}
+    for scale in scales:
+        task = (corpusPath(args.corpus_dir, 'pos', scale), corpusPath(args.corpus_dir, 'neg', scale),
+                args.smoothing, args.order, args.repeat, args.shards)
+        # a new process for every scale. Unlike the daemonic workers of a Pool, it may
+        # start the worker processes of --shards
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+            results[scale] = pool.submit(benchmarkScale, *task).result()
+        print(formatRow(scale, results[scale]))
+
+    if args.output:
+        report = {
+            'version': FORMAT_VERSION,
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'environment': environment(),
+            'settings': {'smoothing': args.smoothing, 'order': args.order, 'shards': args.shards,
+                         'repeat': args.repeat, 'method': args.method, 'corpus_dir': args.corpus_dir},
+            'results': [dict(results[scale], scale=scale) for scale in scales],
+        }
+        directory = os.path.dirname(args.output)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        print("results written to \"%s\"" % args.output)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
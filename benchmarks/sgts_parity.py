@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+
+## Checks that the array based libs/sgts gives the same probabilities as the
+## original dict based implementation, and times both.
+##
+##   $ source setup
+##   $ python -m benchmarks.sgts_parity -k 1 -c data/corpora/simple_divide/posrev_test.txt
+
+import sys
+import time
+import argparse
+import contextlib
+import io
+
+import numpy as np
+from scipy import linalg
+from numpy import c_, exp, log, sqrt
+
+from libs import sgts
+from markov.model_laplace import MarkovModelLaplace
+
+
+def legacyCountOfCountsTable(counts):
+    countsOfCounts = {}
+    for c in counts.values():
+        countsOfCounts[c] = 0
+        for species, speciesCount in counts.items():
+            if speciesCount == c:
+                countsOfCounts[c] += 1
+    return countsOfCounts
+
+def legacySimpleGoodTuringProbs(counts, confidenceLevel=1.96):
+    # libs/sgts.simpleGoodTuringProbs as it was before the array rewrite (minus the printing)
+    if 0 in counts.values():
+        raise ValueError('Species must not have 0 count.')
+    totalCounts = float(sum(counts.values()))
+    countsOfCounts = legacyCountOfCountsTable(counts)
+    sortedCounts = sorted(countsOfCounts.keys())
+
+    if 1 in countsOfCounts:
+        p0 = countsOfCounts[1] / totalCounts
+    else:
+        p0 = 1 / totalCounts
+
+    Z = {}
+    for (jIdx, j) in enumerate(sortedCounts):
+        i = 0 if jIdx == 0 else sortedCounts[jIdx-1]
+        k = 2*j - i if jIdx == len(sortedCounts)-1 else sortedCounts[jIdx+1]
+        Z[j] = 2*countsOfCounts[j] / float(k-i)
+
+    rs = list(Z.keys())
+    zs = list(Z.values())
+    a, b = linalg.lstsq(c_[log(rs), (1,)*len(rs)], log(zs))[0]
+
+    rSmoothed = {}
+    useY = False
+    for r in sortedCounts:
+        y = float(r+1) * exp(a*log(r+1) + b) / exp(a*log(r) + b)
+        if r+1 not in countsOfCounts:
+            useY = True
+        if useY:
+            rSmoothed[r] = y
+            continue
+        x = (float(r+1) * countsOfCounts[r+1]) / countsOfCounts[r]
+        Nr = float(countsOfCounts[r])
+        Nr1 = float(countsOfCounts[r+1])
+        t = confidenceLevel * sqrt(float(r+1)**2 * (Nr1 / Nr**2) * (1. + (Nr1 / Nr)))
+        if abs(x - y) > t:
+            rSmoothed[r] = x
+        useY = True
+        rSmoothed[r] = y
+
+    sgtProbs = {}
+    smoothTot = 0.0
+    for r, rSmooth in rSmoothed.items():
+        smoothTot += countsOfCounts[r] * rSmooth
+    for species, spCount in counts.items():
+        sgtProbs[species] = (1.0 - p0) * (rSmoothed[spCount] / smoothTot)
+
+    return sgtProbs, p0
+
+
+################ CLI App ##################
+def main():
+    parser = argparse.ArgumentParser(prog="sgts_parity", description="checks the array based sgts against the original")
+
+    parser.add_argument('--order','-k',metavar='int', dest='order',
+                        type=int, nargs='?', default=1, const=1,
+                        help='order of the markov model whose rows are smoothed. default: 1')
+
+    parser.add_argument('--corpus', '-c', dest='corpus',
+                        type=str, nargs='?', default='data/corpora/simple_divide/posrev_test.txt',
+                        help='corpus to count transitions on')
+
+    args = parser.parse_args()
+
+    model = MarkovModelLaplace(args.order)
+    with contextlib.redirect_stdout(io.StringIO()): # swallow the progress output
+        model.trainOnCorpus(args.corpus)
+    counts = model.transCountMatrix
+    rows = [counts.data[counts.indptr[r]:counts.indptr[r+1]].tolist() for r in range(counts.shape[0])]
+
+    tic = time.time()
+    legacy = [legacySimpleGoodTuringProbs(dict(enumerate(row))) for row in rows]
+    legacyTime = time.time() - tic
+
+    tic = time.time()
+    probs, p0s = sgts.simpleGoodTuringBatch(counts.data, counts.indptr)
+    batchTime = time.time() - tic
+
+    maxDiff = 0.0
+    for r, (legacyProbs, legacyP0) in enumerate(legacy):
+        rowProbs = probs[counts.indptr[r]:counts.indptr[r+1]]
+        single, singleP0 = sgts.simpleGoodTuringProbsArray(rows[r])
+        expected = np.array([legacyProbs[i] for i in range(len(rows[r]))])
+
+        for got, gotP0 in [(rowProbs, p0s[r]), (single, singleP0)]:
+            if not (np.allclose(got, expected, rtol=1e-9, atol=0) and np.isclose(gotP0, legacyP0, rtol=1e-12, atol=0)):
+                print("row %d differs: %s / %s vs %s / %s" % (r, got, gotP0, expected, legacyP0))
+                return 1
+        nonzero = expected != 0
+        if nonzero.any():
+            maxDiff = max(maxDiff, np.max(np.abs(rowProbs[nonzero] - expected[nonzero]) / expected[nonzero]))
+
+    print("%d rows, %d nonzeros: max relative difference %.2e" % (counts.shape[0], counts.nnz, maxDiff))
+    print("legacy: %.2f s, batch: %.2f s, speedup: %.1fx" % (legacyTime, batchTime, legacyTime/batchTime))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
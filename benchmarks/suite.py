@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+
+## Performance benchmarks of training, saving, loading and classifying on the bundled
+## corpora, written as JSON, and a compare mode that flags slowdowns against a stored
+## baseline:
+##
+##   $ source setup
+##   $ python -m benchmarks.suite run -o bench/baseline.json
+##   ... change something ...
+##   $ python -m benchmarks.suite run -o bench/current.json
+##   $ python -m benchmarks.suite compare bench/baseline.json bench/current.json
+##
+## Every configuration (corpus, smoothing, order) runs in a fresh process, one after
+## the other, so the peak RSS is its own and no configuration warms up the caches of
+## the next. Times are the minimum of at least --repeat runs, fast ones are
+## repeated for MIN_SECONDS. Reviews are tokenized before
+## training, training and classifying are measured without tokenizing and the
+## tokenizer is measured on its own.
+
+import os
+import io
+import sys
+import json
+import time
+import platform
+import tempfile
+import argparse
+import resource
+import subprocess
+import contextlib
+import multiprocessing
+
+import numpy as np
+import scipy
+
+from markov import MarkovClassifier
+from markov.modelfile import saveClassifier
+from markov.tokenizer import TOKENIZERS, getTokenizer
+from corpus import CorpusReader
+
+FORMAT_VERSION = 1
+
+CORPORA = 'data/corpora/'
+
+# the corpus to train on and the corpus to classify, as pos and neg files
+DATASETS = {
+    'original': (['original/posrev.txt', 'original/negrev.txt'], ['original/posrev.txt', 'original/negrev.txt']),
+    'simple_divide': (['simple_divide/posrev_train.txt', 'simple_divide/negrev_train.txt'],
+                      ['simple_divide/posrev_test.txt', 'simple_divide/negrev_test.txt']),
+    'training_3fold': (['training_3fold/posAB.txt', 'training_3fold/negAB.txt'],
+                       ['testing_3fold/posC.txt', 'testing_3fold/negC.txt']),
+}
+
+SMOOTHINGS = ['laplace', 'backoff', 'sgts']
+
+# whether a larger value of a metric is better or worse. accuracy has to stay the same.
+LOWER_IS_BETTER = ['tokenize_seconds', 'train_seconds', 'save_seconds', 'load_seconds',
+                   'file_bytes', 'peak_rss_bytes', 'classify_single_ms', 'classify_batch_seconds']
+HIGHER_IS_BETTER = ['tokenize_reviews_per_second', 'train_reviews_per_second', 'classify_batch_reviews_per_second']
+EXACT = ['accuracy']
+
+
+def readReviews(files):
+    return [list(CorpusReader(os.path.join(CORPORA, file)).reviews()) for file in files]
+
+MIN_SECONDS = 0.5 # fast measurements are repeated until they took this long in total
+
+def best(function, repeat):
+    # the minimum run time of function in seconds over at least repeat runs, and its last result
+    times = []
+    while len(times) < repeat or (sum(times) < MIN_SECONDS and len(times) < 1000):
+        tic = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - tic)
+    return min(times), result
+
+def peakRss(who=resource.RUSAGE_SELF):
+    # ru_maxrss is in kilobytes on linux and in bytes on macOS. For RUSAGE_CHILDREN it is
+    # the peak of the largest child process that has ended
+    rss = resource.getrusage(who).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+def benchmarkTokenizer(dataset, tokenizer, repeat):
+    trainFiles, _ = DATASETS[dataset]
+    reviews = [review for file in readReviews(trainFiles) for review in file]
+    tokenize = getTokenizer(tokenizer).tokenize
+    seconds, _ = best(lambda: [tokenize(review) for review in reviews], repeat)
+    return {
+        'reviews': len(reviews),
+        'tokenize_seconds': seconds,
+        'tokenize_reviews_per_second': len(reviews) / seconds,
+        'peak_rss_bytes': peakRss(),
+    }
+
+def benchmarkClassifier(dataset, smoothing, order, tokenizer, repeat, sample):
+    trainFiles, testFiles = DATASETS[dataset]
+    tokenize = getTokenizer(tokenizer).tokenize
+    posTrain, negTrain = [[tokenize(review) for review in reviews] for reviews in readReviews(trainFiles)]
+    posTest, negTest = readReviews(testFiles)
+    posTestTokens = [tokenize(review) for review in posTest]
+    negTestTokens = [tokenize(review) for review in negTest]
+    numTrain = len(posTrain) + len(negTrain)
+    numTest = len(posTest) + len(negTest)
+    result = {'train_reviews': numTrain, 'test_reviews': numTest}
+
+    def train():
+        classifier = MarkovClassifier(order, smoothing, tokenizer)
+        with contextlib.redirect_stdout(io.StringIO()): # swallow the progress of every review
+            classifier.updateOnTokens(posTrain, negTrain)
+        return classifier
+    result['train_seconds'], classifier = best(train, repeat)
+    result['train_reviews_per_second'] = numTrain / result['train_seconds']
+
+    with tempfile.TemporaryDirectory() as directory:
+        filepath = os.path.join(directory, 'model')
+        result['save_seconds'], result['file_bytes'] = best(lambda: saveClassifier(classifier, filepath), repeat)
+        with contextlib.redirect_stdout(io.StringIO()):
+            result['load_seconds'], loaded = best(lambda: MarkovClassifier.loadFromFile(filepath), repeat)
+
+        try:
+            def classifyBatch():
+                posLabels, _ = loaded.classify_many_tokens(posTestTokens)
+                negLabels, _ = loaded.classify_many_tokens(negTestTokens)
+                return np.count_nonzero(posLabels > 0) + np.count_nonzero(negLabels < 0)
+            result['classify_batch_seconds'], correct = best(classifyBatch, repeat)
+            result['classify_batch_reviews_per_second'] = numTest / result['classify_batch_seconds']
+            result['accuracy'] = correct / numTest
+
+            # the mean latency of classifying raw reviews one by one, including tokenizing, like classifier.py does
+            reviews = posTest[:sample//2] + negTest[:sample - sample//2]
+            seconds, _ = best(lambda: [loaded.classify(review) for review in reviews], repeat)
+            result['classify_single_ms'] = 1000 * seconds / len(reviews)
+        except Exception as e:
+            result['error'] = str(e)
+
+    result['peak_rss_bytes'] = peakRss()
+    return result
+
+def _runTask(task):
+    # runs in a fresh worker process for every task
+    kind, args = task
+    if kind == 'tokenize':
+        return benchmarkTokenizer(*args)
+    return benchmarkClassifier(*args)
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'scipy': scipy.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpus': os.cpu_count(),
+        'commit': commit,
+    }
+
+def run(args):
+    tasks = []
+    for dataset in args.datasets:
+        tasks.append(('%s/tokenize/%s' % (dataset, args.tokenizer), ('tokenize', (dataset, args.tokenizer, args.repeat))))
+        for smoothing in args.smoothings:
+            for order in args.orders:
+                tasks.append(('%s/%s/k%d' % (dataset, smoothing, order),
+                              ('classifier', (dataset, smoothing, order, args.tokenizer, args.repeat, args.sample))))
+
+    results = {}
+    # maxtasksperchild=1: every task gets a new process
+    with multiprocessing.get_context('spawn').Pool(1, maxtasksperchild=1) as pool:
+        for (name, task) in tasks:
+            tic = time.time()
+            results[name] = pool.apply(_runTask, (task,))
+            print("%-36s %6.1f s%s" % (name, time.time() - tic, "  (%s)" % results[name]['error'] if 'error' in results[name] else ""))
+
+    report = {
+        'version': FORMAT_VERSION,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'environment': environment(),
+        'settings': {'tokenizer': args.tokenizer, 'repeat': args.repeat, 'sample': args.sample},
+        'results': results,
+    }
+    directory = os.path.dirname(args.output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print("results written to \"%s\"" % args.output)
+    return 0
+
+def compare(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    for report in [baseline, current]:
+        if report.get('version') != FORMAT_VERSION:
+            print("unsupported benchmark file version %s" % report.get('version'))
+            return 1
+    if baseline['settings'] != current['settings']:
+        print("warning: the settings differ, %s vs %s" % (baseline['settings'], current['settings']))
+    machine = lambda report: {key: value for key, value in report['environment'].items() if key != 'commit'}
+    if machine(baseline) != machine(current):
+        print("warning: run in different environments, times may not compare")
+
+    regressions = 0
+    print("%-36s %-34s %14s %14s %8s" % ("benchmark", "metric", "baseline", "current", "change"))
+    for name in sorted(set(baseline['results']) | set(current['results'])):
+        if name not in current['results'] or name not in baseline['results']:
+            print("%-36s %s" % (name, "only in the current run" if name in current['results'] else "missing in the current run"))
+            continue
+        old, new = baseline['results'][name], current['results'][name]
+        for metric in LOWER_IS_BETTER + HIGHER_IS_BETTER + EXACT:
+            if metric not in old or metric not in new:
+                continue
+            change = new[metric] / old[metric] - 1 if old[metric] else 0.0
+            if metric in EXACT:
+                flag = "CHANGED" if new[metric] != old[metric] else ""
+            elif metric in LOWER_IS_BETTER:
+                flag = "SLOWER" if change > args.tolerance else ("FASTER" if change < -args.tolerance else "")
+            else:
+                flag = "SLOWER" if change < -args.tolerance else ("FASTER" if change > args.tolerance else "")
+            if 'bytes' in metric and flag:
+                flag = {'SLOWER': 'LARGER', 'FASTER': 'SMALLER'}[flag]
+            if flag in ["SLOWER", "LARGER", "CHANGED"]:
+                regressions += 1
+            if flag or args.all:
+                print("%-36s %-34s %14.6g %14.6g %+7.1f%% %s" % (name, metric, old[metric], new[metric], 100*change, flag))
+
+    print()
+    if regressions:
+        print("%d regressions beyond %.0f%%" % (regressions, 100*args.tolerance))
+        return 1
+    print("no regressions beyond %.0f%%" % (100*args.tolerance))
+    return 0
+
+
+################ CLI App ##################
+def main():
+    parser = argparse.ArgumentParser(prog="suite", description="benchmarks training, saving, loading and classifying and compares the results")
+    commands = parser.add_subparsers(dest='command')
+
+    runParser = commands.add_parser('run', help='run the benchmarks and write the results as JSON')
+
+    runParser.add_argument('--output', '-o', dest='output',
+                           type=str, nargs='?', required=True,
+                           help='write the results to this JSON file')
+
+    runParser.add_argument('--dataset', '-d', dest='datasets',
+                           type=str, nargs='+', default=sorted(DATASETS), choices=sorted(DATASETS),
+                           help='corpora to benchmark on. default: all')
+
+    runParser.add_argument('--smoothing','-s', dest='smoothings',
+                           type=str, nargs='+', default=SMOOTHINGS, choices=SMOOTHINGS,
+                           help='smoothing techniques. default: ' + ' '.join(SMOOTHINGS))
+
+    runParser.add_argument('--order','-k',metavar='int', dest='orders',
+                           type=int, nargs='+', default=[0, 1, 2],
+                           help='orders of the markov model. default: 0 1 2')
+
+    runParser.add_argument('--tokenizer', '-t', dest='tokenizer',
+                           type=str, nargs='?', default='regex', choices=sorted(TOKENIZERS),
+                           help='tokenizer for the reviews. default: regex')
+
+    runParser.add_argument('--repeat', '-r', metavar='int', dest='repeat',
+                           type=int, nargs='?', default=3,
+                           help='run every measurement this many times and keep the fastest. default: 3')
+
+    runParser.add_argument('--sample', metavar='int', dest='sample',
+                           type=int, nargs='?', default=200,
+                           help='number of reviews to measure the single review latency on. default: 200')
+
+    compareParser = commands.add_parser('compare', help='compare the results of two runs')
+
+    compareParser.add_argument('baseline', type=str,
+                               help='the JSON file of the baseline run')
+
+    compareParser.add_argument('current', type=str,
+                               help='the JSON file of the run to check')
+
+    compareParser.add_argument('--tolerance', metavar='float', dest='tolerance',
+                               type=float, nargs='?', default=0.2,
+                               help='relative change that is flagged. raise it on machines with noisy timings. default: 0.2')
+
+    compareParser.add_argument('--all', dest='all', action='store_true',
+                               help='print all metrics, not only the flagged ones')
+
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        return run(args)
+    elif args.command == 'compare':
+        return compare(args)
+    parser.print_help()
+    return 1
+
+if __name__ == '__main__':
+    sys.exit(main())
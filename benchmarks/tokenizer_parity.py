@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+
+## Reports every review of a corpus where a tokenizer gives other tokens than
+## nltk.word_tokenize, and times both.
+##
+##   $ source setup
+##   $ python -m benchmarks.tokenizer_parity -t regex -c data/corpora/original/posrev.txt
+
+import sys
+import time
+import argparse
+import difflib
+
+from corpus import CorpusReader
+from markov.tokenizer import TOKENIZERS, getTokenizer
+
+
+def timeTokenizer(tokenizer, reviews):
+    tic = time.time()
+    tokenLists = [tokenizer.tokenize(review) for review in reviews]
+    return tokenLists, time.time() - tic
+
+
+def tokenDiffs(expected, tokens):
+    # the (expected, got) token runs that differ
+    matcher = difflib.SequenceMatcher(None, expected, tokens, autojunk=False)
+    return [(expected[i1:i2], tokens[j1:j2]) for op, i1, i2, j1, j2 in matcher.get_opcodes() if op != 'equal']
+
+
+################ CLI App ##################
+def main():
+    parser = argparse.ArgumentParser(prog="tokenizer_parity", description="compares a tokenizer with nltk.word_tokenize")
+
+    parser.add_argument('--tokenizer', '-t', dest='tokenizer',
+                        type=str, nargs='?', default='regex', choices=sorted(TOKENIZERS),
+                        help='tokenizer to compare. default: regex')
+
+    parser.add_argument('--corpus', '-c', dest='corpora',
+                        type=str, nargs='+',
+                        default=['data/corpora/original/posrev.txt', 'data/corpora/original/negrev.txt'],
+                        help='corpora to tokenize')
+
+    parser.add_argument('--show', '-s', metavar='int', dest='show',
+                        type=int, nargs='?', default=20, const=20,
+                        help='number of differing reviews to print. default: 20')
+
+    args = parser.parse_args()
+
+    tokenizer = getTokenizer(args.tokenizer)
+    reference = getTokenizer('nltk')
+
+    shown = 0
+    for reviewfile in args.corpora:
+        reviews = list(CorpusReader(reviewfile).reviews())
+        expectedLists, nltkTime = timeTokenizer(reference, reviews)
+        tokenLists, tokenizerTime = timeTokenizer(tokenizer, reviews)
+
+        differing = 0
+        differingTokens = 0
+        for revno, (expected, tokens) in enumerate(zip(expectedLists, tokenLists)):
+            if expected == tokens:
+                continue
+            differing += 1
+            diffs = tokenDiffs(expected, tokens)
+            differingTokens += sum(len(expectedRun) for expectedRun, _ in diffs)
+            if shown < args.show:
+                shown += 1
+                print("%s:%d" % (reviewfile, revno+1))
+                for expectedRun, tokensRun in diffs:
+                    print("    nltk: %-40s %s: %s" % (expectedRun, args.tokenizer, tokensRun))
+
+        numTokens = sum(len(expected) for expected in expectedLists)
+        print("%s: %d of %d reviews differ, %d of %d nltk tokens. nltk %.2f s, %s %.2f s (%.1fx)" % (
+              reviewfile, differing, len(reviews), differingTokens, numTokens,
+              nltkTime, args.tokenizer, tokenizerTime, nltkTime/max(tokenizerTime, 1e-9)))
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+
+## Compares the old two-pass lil_matrix training of MarkovModelLaplace with the
+## single-pass TransitionCounter training.
+##
+##   $ source setup
+##   $ python -m benchmarks.train_laplace -k 0 1 2
+
+import sys
+import time
+import argparse
+import contextlib
+import io
+
+import numpy as np
+from scipy.sparse import csr_matrix, lil_matrix
+import nltk
+
+from corpus import CorpusReader
+from markov.model_laplace import MarkovModelLaplace, PAD_TOKEN
+
+
+def legacyTrainOnCorpus(model, reviewfile):
+    # the training code as it was before the single-pass rewrite
+    reader = CorpusReader(reviewfile)
+    model.ngramHash = {} # the tuple keyed dict the models had back then
+
+    ngramCounter = 0
+    wordCounter = 0
+
+    for review in reader.reviews():
+        tokens = model._tokenize(review)
+
+        if (model.k == 0):
+            model.ngramHash[(PAD_TOKEN,)] = 0
+            ngramCounter = 1
+        else:
+            ngrams = nltk.ngrams(tokens, model.k)
+
+            for ngram in ngrams:
+                if ngram not in model.ngramHash:
+                    model.ngramHash[ngram] = ngramCounter
+                    ngramCounter += 1
+
+        for token in tokens:
+            if token not in model.wordHash:
+                model.wordHash[token] = wordCounter
+                wordCounter += 1
+
+    model.transCountMatrix = lil_matrix((ngramCounter, wordCounter), dtype=np.uint16)
+
+    for review in reader.reviews():
+        tokens = model._tokenize(review)
+        words = tokens[model.k:]
+
+        if model.k == 0:
+            for word in words:
+                col = model.wordHash[word]
+                model.transCountMatrix[0, col] += 1
+        else:
+            ngrams = list(nltk.ngrams(tokens, model.k))
+
+            for i, word in enumerate(words):
+                row = model.ngramHash[ngrams[i]]
+                col = model.wordHash[word]
+                model.transCountMatrix[row, col] += 1
+
+    model.transCountMatrix = csr_matrix(model.transCountMatrix)
+
+
+def timeTraining(train, order, reviewfile):
+    model = MarkovModelLaplace(order)
+    tic = time.time()
+    with contextlib.redirect_stdout(io.StringIO()): # swallow the progress output
+        train(model, reviewfile)
+    toc = time.time()
+    return model, toc-tic
+
+
+def sameModel(a, b):
+    return (a.ngramHash == b.ngramHash and a.wordHash == b.wordHash
+            and (a.transCountMatrix != b.transCountMatrix).nnz == 0)
+
+
+################ CLI App ##################
+def main():
+    parser = argparse.ArgumentParser(prog="train_laplace", description="benchmarks laplace model training")
+
+    parser.add_argument('--order','-k',metavar='int', dest='orders',
+                        type=int, nargs='+', default=[0, 1, 2],
+                        help='orders of the markov model to benchmark. default: 0 1 2')
+
+    parser.add_argument('--corpus', '-c', dest='corpora',
+                        type=str, nargs='+',
+                        default=['data/corpora/original/posrev.txt', 'data/corpora/original/negrev.txt'],
+                        help='corpora to train on')
+
+    args = parser.parse_args()
+
+    print("%-40s %2s | %9s | %9s | %7s" % ("corpus", "k", "legacy", "1-pass", "speedup"))
+    for reviewfile in args.corpora:
+        for order in args.orders:
+            legacy, legacyTime = timeTraining(legacyTrainOnCorpus, order, reviewfile)
+            model, modelTime = timeTraining(MarkovModelLaplace.trainOnCorpus, order, reviewfile)
+
+            if not sameModel(legacy, model):
+                print("%-40s %2d | models differ!" % (reviewfile, order))
+                return 1
+
+            print("%-40s %2d | %7.2f s | %7.2f s | %6.1fx" % (reviewfile, order, legacyTime, modelTime, legacyTime/modelTime))
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
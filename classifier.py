@@ -4,6 +4,7 @@ import sys
 import traceback
 import argparse
 from markov import MarkovClassifier
+from constants import SENTIMENT
 
 ################ CLI App ##################
 def main():
@@ -13,6 +14,13 @@ def main():
                         type=str, nargs='?', required=True,
                         help='load trained model from this file')
 
+    parser.add_argument('--debug', '-d', dest='debug', action='store_true',
+                        help='classify one review per line as it comes in and print debug info')
+
+    parser.add_argument('--batch-size', '-b', metavar='int', dest='batch_size',
+                        type=int, nargs='?', default=1000, const=1000,
+                        help='number of reviews classified at once. default: 1000')
+
     args = parser.parse_args()
 
     if not args.file:
@@ -27,6 +35,19 @@ def main():
         traceback.print_exc()
         return 1
 
+    if not args.debug:
+        # classify everything on stdin, batch by batch
+        try:
+            labels, scores = markov_classifier.classify_many(sys.stdin, batch_size=args.batch_size)
+        except Exception as e:
+            print("Error while classifying")
+            print("%s" % (e))
+            traceback.print_exc()
+            return 1
+        for label in labels:
+            print(SENTIMENT(label).name)
+        return 0
+
     while(True):
         review = sys.stdin.readline()
         if not review:
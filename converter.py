@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+
+import sys
+import traceback
+import argparse
+from markov import MarkovClassifier
+
+################ CLI App ##################
+def main():
+    parser = argparse.ArgumentParser(prog="converter", description="converts an old pickled model file to the binary model format")
+
+    parser.add_argument('--input', '-i', dest='input',
+                        type=str, nargs='?', required=True,
+                        help='pickled model file to convert')
+
+    parser.add_argument('--output', '-o', dest='output',
+                        type=str, nargs='?', required=True,
+                        help='save the converted model to this file')
+
+    args = parser.parse_args()
+
+    if not args.input:
+        print("no input file given")
+        return 1
+
+    if not args.output:
+        print("no output file given")
+        return 1
+
+    try:
+        markov_classifier = MarkovClassifier.loadFromPickleFile(args.input)
+    except Exception as e:
+        print("Error loading Markov Classifier")
+        print("%s" % (e))
+        traceback.print_exc()
+        return 1
+    try:
+        markov_classifier.saveToFile(args.output)
+    except Exception as e:
+        print("Error saving Markov Classifier")
+        print("%s" % (e))
+        traceback.print_exc()
+        return 1
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1 +1,2 @@
 from .reader import *
+from .tokencache import *
@@ -1,10 +1,36 @@
+import os
+import locale
 
 class CorpusReader():
-    def __init__(self, filename):
+    # Reads the reviews of a corpus, one per line. With shards > 1 it only reads the
+    # lines of shard number shard: the file is cut into shards of equal bytes, and
+    # every line belongs to the shard its first byte is in.
+    def __init__(self, filename, shard=0, shards=1):
+        if not 0 <= shard < shards:
+            raise Exception('no shard %d of %d' % (shard, shards))
         self.filename = filename
+        self.shard = shard
+        self.shards = shards
 
     def reviews(self):
+        if self.shards > 1:
+            yield from self._shardReviews()
+            return
         with open(self.filename, 'r') as f:
             for line in f:
                 yield line.rstrip('\n')
 
+    def _shardReviews(self):
+        size = os.path.getsize(self.filename)
+        start = size * self.shard // self.shards
+        end = size * (self.shard+1) // self.shards
+        encoding = locale.getpreferredencoding(False) # what open() reads the whole file with
+        with open(self.filename, 'rb') as f:
+            if start > 0:
+                f.seek(start-1)
+                f.readline() # the rest of the line before the shard
+            while f.tell() < end:
+                line = f.readline()
+                if not line:
+                    break
+                yield line.decode(encoding).replace('\r\n', '\n').rstrip('\n')
@@ -0,0 +1,119 @@
+import os
+import glob
+import hashlib
+
+import numpy as np
+
+from storage import writeArrayFile, readArrayFile, isArrayFile
+from .reader import CorpusReader
+
+## An on-disk cache of tokenized corpora.
+##
+## A tokenized corpus is stored as the token ids of all reviews in one array, the
+## offset of every review in it and the vocabulary as one newline separated utf-8
+## blob, in an array file that is memory mapped when loaded.
+## The cache file is named after the corpus, the tokenizer and the hash of the
+## corpus contents, so editing the corpus or changing the tokenizer (its name or
+## version, see Tokenizer.identity) gives a new file. Cache files of older versions of a corpus are removed.
+
+FORMAT = 'tokenized-corpus'
+FORMAT_VERSION = 1
+
+WORD_SEPARATOR = "\n" # tokens never contain whitespace
+
+def fileHash(filename):
+    digest = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class TokenizedCorpus():
+
+    def __init__(self, words, tokens, offsets):
+        self.words = words      # the word of every token id
+        self.tokens = tokens    # the token ids of all reviews
+        self.offsets = offsets  # review i has the tokens tokens[offsets[i]:offsets[i+1]]
+        self._wordArray = None
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    @staticmethod
+    def fromCorpus(reviewfile, tokenizer):
+        wordIds = {}
+        tokens = []
+        offsets = [0]
+        for review in CorpusReader(reviewfile).reviews():
+            tokens.extend(wordIds.setdefault(token, len(wordIds)) for token in tokenizer.tokenize(review))
+            offsets.append(len(tokens))
+
+        words = [None]*len(wordIds)
+        for word, wordId in wordIds.items():
+            words[wordId] = word
+        return TokenizedCorpus(words, np.array(tokens, dtype=np.int32), np.array(offsets, dtype=np.int64))
+
+    def tokenLists(self, start=0, end=None):
+        # yields the tokens of the reviews start..end as lists of strings
+        end = len(self) if end is None else end
+        if self._wordArray is None:
+            self._wordArray = np.array(self.words, dtype=object)
+        offsets = self.offsets[start:end+1].tolist()
+        allTokens = self._wordArray[self.tokens[offsets[0]:offsets[-1]]].tolist()
+        base = offsets[0]
+        for first, last in zip(offsets[:-1], offsets[1:]):
+            yield allTokens[first-base:last-base]
+
+    def save(self, filepath, meta):
+        meta = dict(meta, format=FORMAT, version=FORMAT_VERSION)
+        arrays = {
+            'vocabulary': np.frombuffer(WORD_SEPARATOR.join(self.words).encode('utf-8'), dtype=np.uint8),
+            'tokens': self.tokens,
+            'offsets': self.offsets,
+        }
+        writeArrayFile(filepath, meta, arrays) # atomically, so parallel runs never read half a file
+
+    @staticmethod
+    def load(filepath):
+        # returns the meta data and the corpus
+        meta, arrays = readArrayFile(filepath)
+        if meta.get('format') != FORMAT or meta.get('version') != FORMAT_VERSION:
+            raise Exception('not a tokenized corpus file: %s' % filepath)
+        blob = arrays['vocabulary']
+        words = bytes(blob).decode('utf-8').split(WORD_SEPARATOR) if len(blob) else []
+        return meta, TokenizedCorpus(words, arrays['tokens'], arrays['offsets'])
+
+
+def _cacheName(reviewfile, tokenizer):
+    # the corpus file name and a hash of its full path, so equally named corpora don't collide
+    pathHash = hashlib.sha1(os.path.abspath(reviewfile).encode('utf-8')).hexdigest()[:8]
+    return '%s.%s.%s' % (os.path.basename(reviewfile), pathHash, tokenizer.identity())
+
+def loadTokenizedCorpus(reviewfile, tokenizer, cacheDir):
+    # the tokenized corpus from the cache in cacheDir, tokenizes and caches it on a miss
+    contentHash = fileHash(reviewfile)
+    name = _cacheName(reviewfile, tokenizer)
+    filepath = os.path.join(cacheDir, '%s.%s.tokens' % (name, contentHash[:16]))
+
+    if os.path.exists(filepath) and isArrayFile(filepath):
+        meta, corpus = TokenizedCorpus.load(filepath)
+        if meta['hash'] == contentHash and meta['tokenizer'] == tokenizer.identity():
+            print("loaded %d tokenized reviews from cache file \"%s\"" % (len(corpus), filepath))
+            return corpus
+
+    corpus = TokenizedCorpus.fromCorpus(reviewfile, tokenizer)
+    os.makedirs(cacheDir, exist_ok=True)
+    for stale in glob.glob(os.path.join(glob.escape(cacheDir), glob.escape(name) + '.*.tokens')):
+        os.remove(stale) # the corpus has changed
+    corpus.save(filepath, {'corpus': reviewfile, 'hash': contentHash, 'tokenizer': tokenizer.identity()})
+    print("cached %d tokenized reviews in \"%s\"" % (len(corpus), filepath))
+    return corpus
+
+def corpusTokenLists(reviewfile, tokenizer, cacheDir=None):
+    # yields the tokens of every review of the corpus, through the cache if there is a cacheDir
+    if cacheDir is None:
+        for review in CorpusReader(reviewfile).reviews():
+            yield tokenizer.tokenize(review)
+    else:
+        yield from loadTokenizedCorpus(reviewfile, tokenizer, cacheDir).tokenLists()
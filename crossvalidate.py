@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+
+import io
+import sys
+import time
+import traceback
+import argparse
+import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from markov import MarkovClassifier
+from markov.tokenizer import TOKENIZERS
+from markov.evaluation import classifyTokens, addOutcome, newResults, printResults
+from corpus import corpusTokenLists
+from constants import SENTIMENT
+
+## k-fold cross validation by adding counts: every fold is counted once, and the model
+## tested on fold i is the merge of the counts of all other folds, in order. That is the
+## same model as trained on the concatenation of the other folds, so
+##
+##   $ ./crossvalidate.py -k 1 -s laplace
+##
+## gives the results of training on training_3fold/posAB.txt and testing on
+## testing_3fold/posC.txt and so on, but counts every review once instead of k-1 times.
+
+FOLDS = 'data/corpora/testing_3fold/'
+
+_folds = [] # the classifiers trained on each fold, shared with the worker processes
+
+def _initWorker(folds):
+    # forked workers inherit _folds, the others get them pickled
+    if not _folds:
+        _folds.extend(folds)
+
+def foldClassifier(folds, test):
+    # the classifier trained on all folds but test
+    first = next(i for i in range(len(folds)) if i != test)
+    classifier = MarkovClassifier(folds[first].k, folds[first].smoothing, folds[first].tokenizer)
+    for i, fold in enumerate(folds):
+        if i != test:
+            classifier.merge(fold)
+    return classifier
+
+def evaluateFold(test, posfile, negfile, batch_size, cacheDir, folds=None):
+    # merges the classifier for fold test (of folds, or of _folds in a worker) and classifies
+    # its held out reviews. Returns the outcome of classifyTokens for the positive and the
+    # negative reviews.
+    with contextlib.redirect_stdout(io.StringIO()):
+        classifier = foldClassifier(_folds if folds is None else folds, test)
+        tokenizer = classifier.getTokenizer()
+        posTokens = corpusTokenLists(posfile, tokenizer, cacheDir)
+        negTokens = corpusTokenLists(negfile, tokenizer, cacheDir)
+    return classifyTokens(classifier, posTokens, batch_size), classifyTokens(classifier, negTokens, batch_size)
+
+def crossValidate(order, smoothing, tokenizer, posfiles, negfiles, jobs=1, batch_size=1000, cacheDir=None):
+    # counts every fold, then tests every fold against the merge of the others in jobs
+    # worker processes. Returns a list of (results, pos_counter, neg_counter) per fold.
+    tic = time.time()
+    trained = []
+    for i, (posfile, negfile) in enumerate(zip(posfiles, negfiles)):
+        print("counting fold %d: %s, %s" % (i+1, posfile, negfile))
+        fold = MarkovClassifier(order, smoothing, tokenizer)
+        with contextlib.redirect_stdout(io.StringIO()): # swallow the progress of every review
+            fold.trainOnCorpora(posfile, negfile, min(jobs, 2), cacheDir)
+        trained.append(fold)
+    print("done. counted %d folds in %.2f s" % (len(trained), time.time() - tic))
+
+    tic = time.time()
+    args = [(test, posfile, negfile, batch_size, cacheDir) for test, (posfile, negfile) in enumerate(zip(posfiles, negfiles))]
+    _folds[:] = trained # replaces the folds of an earlier call, before the workers fork
+    if jobs > 1:
+        context = multiprocessing.get_context('fork') if 'fork' in multiprocessing.get_all_start_methods() else None
+        with ProcessPoolExecutor(max_workers=min(jobs, len(args)), mp_context=context, initializer=_initWorker, initargs=(trained,)) as pool:
+            outcomes = list(pool.map(evaluateFold, *zip(*args)))
+    else:
+        outcomes = [evaluateFold(*foldArgs, folds=trained) for foldArgs in args]
+    print("done. tested %d folds in %.2f s" % (len(outcomes), time.time() - tic))
+
+    folds = []
+    for posOutcome, negOutcome in outcomes:
+        results = newResults()
+        pos_totals, neg_totals = [0, None], [0, None]
+        addOutcome(results[SENTIMENT.POSITIVE], pos_totals, posOutcome)
+        addOutcome(results[SENTIMENT.NEGATIVE], neg_totals, negOutcome)
+        folds.append((results, pos_totals[0], neg_totals[0]))
+    return folds
+
+def accuracy(results, pos_counter, neg_counter):
+    correct = results[SENTIMENT.POSITIVE][SENTIMENT.POSITIVE] + results[SENTIMENT.NEGATIVE][SENTIMENT.NEGATIVE]
+    return correct / (pos_counter + neg_counter)
+
+
+################ CLI App ##################
+def main():
+    parser = argparse.ArgumentParser(prog="crossvalidate", description="k-fold cross validation, counting every fold once")
+
+    parser.add_argument('--order','-k',metavar='int', dest='order',
+                        type=int, nargs='?', default=0,
+                        help='order of the markov model. default: 0')
+
+    parser.add_argument('--smoothing','-s', dest='smoothing',
+                        type=str, nargs='?', default='laplace', choices=['laplace', 'backoff', 'sgts'],
+                        help='smoothing technique. default: laplace')
+
+    parser.add_argument('--tokenizer', '-t', dest='tokenizer',
+                        type=str, nargs='?', default='nltk', choices=sorted(TOKENIZERS),
+                        help='tokenizer for the reviews. default: nltk')
+
+    parser.add_argument('--pos', '-p', dest='pos',
+                        type=str, nargs='+', default=[FOLDS + 'pos%s.txt' % fold for fold in 'ABC'],
+                        help='the folds of positive reviews. default: ' + FOLDS + 'pos{A,B,C}.txt')
+
+    parser.add_argument('--neg', '-n', dest='neg',
+                        type=str, nargs='+', default=[FOLDS + 'neg%s.txt' % fold for fold in 'ABC'],
+                        help='the folds of negative reviews, in the order of --pos. default: ' + FOLDS + 'neg{A,B,C}.txt')
+
+    parser.add_argument('--batch-size', '-b', metavar='int', dest='batch_size',
+                        type=int, nargs='?', default=1000, const=1000,
+                        help='number of reviews classified at once. default: 1000')
+
+    parser.add_argument('--jobs', '-j', metavar='int', dest='jobs',
+                        type=int, nargs='?', default=1, const=2,
+                        help='number of worker processes testing the folds. default: 1')
+
+    parser.add_argument('--cache-dir', dest='cache_dir',
+                        type=str, nargs='?', default='cache/tokens',
+                        help='directory to cache the tokenized folds in. default: cache/tokens')
+
+    parser.add_argument('--no-cache', dest='no_cache', action='store_true',
+                        help='tokenize the folds again instead of using the cache')
+
+    args = parser.parse_args()
+    cacheDir = None if args.no_cache else args.cache_dir
+
+    if len(args.pos) != len(args.neg):
+        print("as many positive as negative folds needed")
+        return 1
+    if len(args.pos) < 2:
+        print("at least two folds needed")
+        return 1
+    if args.jobs < 1:
+        print("at least one job needed")
+        return 1
+
+    try:
+        folds = crossValidate(args.order, args.smoothing, args.tokenizer, args.pos, args.neg, args.jobs, args.batch_size, cacheDir)
+    except Exception as e:
+        print("Error while cross validating")
+        print("%s" % (e))
+        traceback.print_exc()
+        return 1
+
+    total = newResults()
+    pos_total, neg_total = 0, 0
+    for i, (results, pos_counter, neg_counter) in enumerate(folds):
+        print("")
+        print("========= FOLD %d: %s, %s ==========" % (i+1, args.pos[i], args.neg[i]))
+        printResults(results, pos_counter, neg_counter)
+        for sentiment in total:
+            for classified in total[sentiment]:
+                total[sentiment][classified] += results[sentiment][classified]
+        pos_total += pos_counter
+        neg_total += neg_counter
+
+    print("")
+    print("========= ALL %d FOLDS ==========" % len(folds))
+    printResults(total, pos_total, neg_total)
+    for i, fold in enumerate(folds):
+        print("fold %d accuracy: %.4f" % (i+1, accuracy(*fold)))
+    print("mean accuracy:   %.4f" % (sum(accuracy(*fold) for fold in folds) / len(folds)))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+
+import os
+import io
+import sys
+import time
+import traceback
+import argparse
+import contextlib
+
+from markov import MarkovClassifier
+from markov.generator import ChainSampler, ReviewResampler, fitVocabulary, generateReviews
+from markov.tokenizer import TOKENIZERS, getTokenizer
+from corpus import CorpusReader, corpusTokenLists
+
+## Writes synthetic positive and negative corpora of 10, 100, 1000 times the size of the
+## source corpora, for testing how training and classifying scale, see markov/generator.py.
+## The reviews are space separated tokens, one per line, so every tokenizer (and the
+## fastest, whitespace) reads them the same:
+##
+##   $ ./generator.py --scale 10 100
+##   $ ./trainer.py -k 2 -s laplace -t whitespace -p data/corpora/synthetic/pos_x10.txt -n data/corpora/synthetic/neg_x10.txt -f savefiles/x10
+##
+## Both classes coin their synthetic words from the same lexicon, so the frequent
+## synthetic words are shared by them like the frequent rare words of real reviews.
+
+SOURCE = 'data/corpora/original/'
+
+OUTPUT = 'data/corpora/synthetic'
+
+def corpusPath(directory, sentiment, scale):
+    # the file of the synthetic corpus of sentiment 'pos' or 'neg' at scale
+    return os.path.join(directory, '%s_x%d.txt' % (sentiment, scale))
+
+def sourceModels(args, cacheDir):
+    # the positive and the negative model to sample from
+    if args.file:
+        classifier = MarkovClassifier.loadFromFile(args.file)
+    else:
+        classifier = MarkovClassifier(args.order, 'laplace', args.tokenizer)
+        print("training a laplace model of order %d on the source corpora..." % args.order)
+        with contextlib.redirect_stdout(io.StringIO()): # swallow the progress of every review
+            classifier.trainOnCorpora(args.pos, args.neg, cacheDir=cacheDir)
+    if classifier.isCompiled() or getattr(classifier, 'joint_model', None) is not None:
+        raise Exception('a joint or compiled classifier has no separate counts to sample from')
+    models = [classifier.pos_model, classifier.neg_model]
+    return [model.models[model.k] if hasattr(model, 'models') else model for model in models] # backoff: its highest order
+
+def writeCorpus(filepath, sampler, numReviews, rareCount, seed):
+    vocabulary = fitVocabulary(sampler.wordCounts, rareCount, seed)
+    numTokens = 0
+    with open(filepath + '.tmp', 'w') as f:
+        for review in generateReviews(sampler, vocabulary, numReviews, rareCount, seed):
+            f.write(review)
+            f.write('\n')
+            numTokens += review.count(' ') + 1 if review else 0
+    os.replace(filepath + '.tmp', filepath)
+    return numTokens, vocabulary
+
+
+################ CLI App ##################
+def main():
+    parser = argparse.ArgumentParser(prog="generator", description="writes synthetic corpora of many times the size of the source corpora")
+
+    parser.add_argument('--method', '-m', dest='method',
+                        type=str, nargs='?', default='markov', choices=['markov', 'resample'],
+                        help='sample the reviews from the transitions of a markov model, or resample the reviews of the source corpora. default: markov')
+
+    parser.add_argument('--file', '-f', dest='file',
+                        type=str, nargs='?', default=None,
+                        help='sample from the models of this trained classifier. default: train a laplace model on the source corpora')
+
+    parser.add_argument('--order', '-k', metavar='int', dest='order',
+                        type=int, nargs='?', default=2,
+                        help='order of the laplace model trained on the source corpora. default: 2')
+
+    parser.add_argument('--pos', '-p', dest='pos',
+                        type=str, nargs='?', default=SOURCE + 'posrev.txt',
+                        help='source corpus with positive reviews. default: ' + SOURCE + 'posrev.txt')
+
+    parser.add_argument('--neg', '-n', dest='neg',
+                        type=str, nargs='?', default=SOURCE + 'negrev.txt',
+                        help='source corpus with negative reviews. default: ' + SOURCE + 'negrev.txt')
+
+    parser.add_argument('--tokenizer', '-t', dest='tokenizer',
+                        type=str, nargs='?', default='regex', choices=sorted(TOKENIZERS),
+                        help='tokenizer for the source corpora. default: regex')
+
+    parser.add_argument('--scale', '-s', metavar='int', dest='scales',
+                        type=int, nargs='+', default=[10, 100, 1000],
+                        help='sizes of the synthetic corpora, in multiples of the number of source reviews. default: 10 100 1000')
+
+    parser.add_argument('--rare-count', metavar='int', dest='rare_count',
+                        type=int, nargs='?', default=1,
+                        help='source words seen at most this many times are replaced by synthetic words. default: 1')
+
+    parser.add_argument('--seed', metavar='int', dest='seed',
+                        type=int, nargs='?', default=0,
+                        help='seed of the random numbers, the same seed writes the same corpora. default: 0')
+
+    parser.add_argument('--output-dir', '-o', dest='output_dir',
+                        type=str, nargs='?', default=OUTPUT,
+                        help='directory to write {pos,neg}_x<scale>.txt to. default: ' + OUTPUT)
+
+    parser.add_argument('--cache-dir', dest='cache_dir',
+                        type=str, nargs='?', default='cache/tokens',
+                        help='directory to cache the tokenized source corpora in. default: cache/tokens')
+
+    parser.add_argument('--no-cache', dest='no_cache', action='store_true',
+                        help='tokenize the source corpora again instead of using the cache')
+
+    args = parser.parse_args()
+    cacheDir = None if args.no_cache else args.cache_dir
+
+    if min(args.scales) < 1:
+        print("scales must be positive")
+        return 1
+    if args.file and args.method != 'markov':
+        print("a model file can only be sampled with --method markov")
+        return 1
+
+    try:
+        if args.method == 'markov':
+            samplers = [ChainSampler(model) for model in sourceModels(args, cacheDir)]
+        else:
+            samplers = [ReviewResampler(corpusTokenLists(file, getTokenizer(args.tokenizer), cacheDir)) for file in [args.pos, args.neg]]
+        numSource = [sum(1 for _ in CorpusReader(file).reviews()) for file in [args.pos, args.neg]]
+
+        os.makedirs(args.output_dir, exist_ok=True)
+        for scale in args.scales:
+            for sentiment, sampler, numReviews in zip(['pos', 'neg'], samplers, numSource):
+                filepath = corpusPath(args.output_dir, sentiment, scale)
+                print("writing %d reviews to \"%s\"..." % (scale * numReviews, filepath))
+                tic = time.time()
+                numTokens, vocabulary = writeCorpus(filepath, sampler, scale * numReviews, args.rare_count, args.seed + scale)
+                print("done. %d tokens, %d synthetic words (discount %.2f), %d bytes in %.1f s" % (numTokens, len(vocabulary),
+                      vocabulary.discount, os.path.getsize(filepath), time.time() - tic))
+    except Exception as e:
+        print("Error while generating")
+        print("%s" % (e))
+        traceback.print_exc()
+        return 1
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,189 +1,80 @@
-from markov.classifier import MarkovClassifier
-import numpy as np
-import math
-
-NUM_SCORES = 20
-
-
-def getHighScore(model):
-    rowHash = {}
-    for ngram, r in model.ngramHash.items():
-        rowHash[r] = ngram
-
-    colHash = {}
-    for word, c in model.wordHash.items():
-        colHash[c] = word
-
-    ones = 0
-    twices = 0
-    total = 0
-    unique = 0
-
-    rows, cols = model.transCountMatrix.nonzero()
-    for i in range(0,len(rows)):
-        r = rows[i]
-        c = cols[i]
-        count = model.transCountMatrix[r, c]
-        if count > 0:
-            if count == 1:
-                ones += 1
-                if ones <= NUM_SCORES:
-                    ngram = rowHash[r]
-                    word = colHash[c]
-                    print("%20s -> %20s: %4d" % (ngram, word, count))
-            if count == 2:
-                twices += 1
-                if twices <= NUM_SCORES:
-                    ngram = rowHash[r]
-                    word = colHash[c]
-                    print("%20s -> %20s: %4d" % (ngram, word, count))
-
-            total += count
-            unique += 1
-    print("ONES  : %d" % ones)
-    print("TWICES: %d" % twices)
-    print("TOTAL : %d" % total)
-    print("UNIQUE: %d" % unique)
-
-    backup = []
-    for place in range(0,NUM_SCORES):
-        cols = model.transCountMatrix.shape[1]
-        elem = np.argmax(model.transCountMatrix.todense())
-        #print(model.transCountMatrix.max())
-        row = int(math.floor(elem / cols))
-        col = elem % cols
-
-        count = model.transCountMatrix[row, col]
-        if count == 1:
-            break
-        ngram = rowHash[row]
-        word = colHash[col]
-
-        backup.append({
-            'r': row,
-            'c':col,
-            'count': count,
-            'ngram': ngram,
-            'word': word,
-        })
-
-        # for next max find
-        model.transCountMatrix[row, col] = 0
-    return backup
-
-def printStats(backup, model):
-    for item in backup:
-        debugInfo = {}
-        prob = model.getTransitionProb(item['ngram'], item['word'], debugInfo)
-        print("%20s -> %20s: %4d, %.4f" % (item['ngram'], item['word'], item['count'], prob))
-
-
-    # this data is for 0-order (positive) Markov models
-    word = "21st"
-    debugInfo = {}
-    model.getTransitionProb("", word, debugInfo)
-    print("%20s -> %20s: %4d, %.4e" % ("", word, debugInfo['count'], debugInfo['prob']))
-    word = "jean-claud"
-    debugInfo = {}
-    model.getTransitionProb("", word, debugInfo)
-    print("%20s -> %20s: %4d, %.4e" % ("", word, debugInfo['count'], debugInfo['prob']))
-
-    # this data is for 0-order (negative) Markov models
-    word = "graphic"
-    debugInfo = {}
-    model.getTransitionProb("", word, debugInfo)
-    print("%20s -> %20s: %4d, %.4e" % ("", word, debugInfo['count'], debugInfo['prob']))
-    word = "laddish"
-    debugInfo = {}
-    model.getTransitionProb("", word, debugInfo)
-    print("%20s -> %20s: %4d, %.4e" % ("", word, debugInfo['count'], debugInfo['prob']))
-
-
-    word = "?????????"
-    debugInfo = {}
-    model.getTransitionProb("", word, debugInfo)
-    print("%20s -> %20s: %4d, %.4e" % ("", word, debugInfo['count'], debugInfo['prob']))
-
-
-
-
-
-print("========= k0 laplace ==========")
-mc = MarkovClassifier.loadFromFile('savefiles/k0laplaceAB')
-print("POS MODEL")
-posbak = getHighScore(mc.pos_model)
-print()
-print("NEG MODEL")
-negbak = getHighScore(mc.neg_model)
-print()
-
-
-mc = MarkovClassifier.loadFromFile('savefiles/k0laplaceAB')
-print("POS MODEL")
-printStats(posbak, mc.pos_model)
-print("NEG MODEL")
-printStats(negbak, mc.neg_model)
-
-
-
-print("============ k0 sgts ============")
-mc = MarkovClassifier.loadFromFile('savefiles/k0sgtsAB')
-print("POS MODEL")
-posbak = getHighScore(mc.pos_model)
-print()
-print("NEG MODEL")
-negbak = getHighScore(mc.neg_model)
-print()
-
-
-mc = MarkovClassifier.loadFromFile('savefiles/k0sgtsAB')
-print("POS MODEL")
-printStats(posbak, mc.pos_model)
-print("NEG MODEL")
-printStats(negbak, mc.neg_model)
-
-#debuginfo = {}
-#mc.pos_model.getTransitionProb(("_",), ".", debuginfo)
-#print(debuginfo)
-"""
-from markov.model_laplace import MarkovModelLaplace
-
-pos = MarkovModelLaplace(0)
-pos.trainOnCorpus('data/corpora/training_3fold/posAB.txt')
-
-sum = 0
-for word, col in pos.wordHash.items():
-    count = pos.transCountMatrix[0,col]
-    sum += count
-    print(count)
-
-print(sum)
-
-print("==============================")
-
-sum = 0
-for col in range(0, pos.transCountMatrix.shape[1]):
-    count = pos.transCountMatrix[0,col]
-    sum += count
-    print(count)
-
-print(sum)
+#!/usr/bin/env python3
 
-print("==============================")
+import sys
+import traceback
+import argparse
 
-
-sum = 0
-rows, cols = pos.transCountMatrix.nonzero()
-for i in range(0,len(rows)):
-    col = cols[i]
-    count = pos.transCountMatrix[0,col]
-    sum += count
-    print(count)
-
-print(sum)
-
-print("==============================")
-
-print(pos.transCountMatrix.sum(axis=1)[0])
-print(pos.transCountMatrix.todense().sum(axis=1)[0])
-"""
+from markov.classifier import MarkovClassifier
+from markov.modelstats import ModelStatistics
+
+## Prints the most frequent transitions of the models of a classifier and statistics
+## of their counts. The classifier is only read, see markov/modelstats.py.
+
+def printHighScore(model, num):
+    stats = ModelStatistics(model)
+
+    print("%40s -> %20s: %6s, %10s" % ("ngram", "word", "count", "P"))
+    for item in stats.topTransitions(num):
+        prob = model.getTransitionProb(item['ngram'], item['word'])
+        print("%40s -> %20s: %6d, %.4e" % (item['ngram'], item['word'], item['count'], prob))
+    print()
+
+    print("ONES  : %d" % stats.singletons())
+    print("TWICES: %d" % stats.doubletons())
+    print("TOTAL : %d" % stats.total())
+    print("UNIQUE: %d" % stats.unique())
+    print("ROW ENTROPY: %.3f bits (weighted mean)" % stats.meanRowEntropy())
+    print()
+
+    print("count | transitions")
+    counts, numTransitions = stats.countsOfCounts()
+    for count, n in list(zip(counts.tolist(), numTransitions.tolist()))[:num]:
+        print("%5d | %d" % (count, n))
+    if len(counts) > num:
+        print("  ... | %d more counts up to %d" % (len(counts) - num, counts[-1]))
+
+
+################ CLI App ##################
+def main():
+    parser = argparse.ArgumentParser(prog="highscore", description="prints the most frequent transitions and count statistics of a trained model")
+
+    parser.add_argument('--file', '-f', dest='file',
+                        type=str, nargs='?', required=True,
+                        help='load trained model from this file')
+
+    parser.add_argument('--num', '-n', metavar='int', dest='num',
+                        type=int, nargs='?', default=20,
+                        help='number of transitions and counts of counts to print. default: 20')
+
+    parser.add_argument('--order', '-k', metavar='int', dest='order',
+                        type=int, nargs='?', default=None,
+                        help='the order of the model to print of a backoff classifier. default: its highest')
+
+    args = parser.parse_args()
+
+    if not args.file:
+        print("no load file given")
+        return 1
+
+    try:
+        markov_classifier = MarkovClassifier.loadFromFile(args.file)
+        if markov_classifier.isCompiled() or getattr(markov_classifier, 'joint_model', None) is not None:
+            print("a joint or compiled classifier has no separate counts")
+            return 1
+
+        for name, model in [("POS", markov_classifier.pos_model), ("NEG", markov_classifier.neg_model)]:
+            if hasattr(model, 'models'): # backoff
+                model = model.models[model.k if args.order is None else args.order]
+            print()
+            print("========= %s MODEL (k=%d) ==========" % (name, model.k))
+            printHighScore(model, args.num)
+    except Exception as e:
+        print("Error reading Markov Classifier")
+        print("%s" % (e))
+        traceback.print_exc()
+        return 1
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
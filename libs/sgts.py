@@ -21,12 +21,20 @@
 This module provides an implementation of Gale and Sampson's (1995/2001) "Simple
 Good Turing" algorithm. The main function is simpleGoodTuringProbs(), which
 takes a dictionary of species counts and returns the estimated population
-frequencies of the species, as estimated by the Simple Good Turing method. To
-use this module, you must have scipy and numpy installed.
+frequencies of the species, as estimated by the Simple Good Turing method.
+simpleGoodTuringProbsArray() does the same for a numpy vector of counts, and
+simpleGoodTuringBatch() smooths many count vectors (e.g. the rows of a
+csr_matrix) in one call. To use this module, you must have scipy and numpy
+installed.
 Also included is a function that uses pylab and matplotlib to draw a useful
 scatterplot for comparing the empirical frequencies against the Simple Good
 Turing estimates.
 Depends on reasonably recent versions of scipy and numpy.
+Version 0.4:
+    Vectorized simpleGoodTuringBatch() over all rows of a csr layout.
+    Array based counts of counts (np.unique instead of a quadratic scan).
+    Added simpleGoodTuringProbsArray() and simpleGoodTuringBatch().
+    No more printing on every call.
 Version 0.3: June 21, 2011
     First github version.
 Version 0.2: November 12, 2009. 
@@ -42,10 +50,11 @@ REFERENCES:
     See also the corrected reprint of same on Sampson's web site.
 """
 
-__version__ = "0.3"
+__version__ = "0.4"
 
 from scipy import linalg
-from numpy import c_, exp, log, inf, NaN, sqrt
+import numpy as np
+from numpy import c_, exp, log
 
 def countOfCountsTable(counts, sparse=True):
     """
@@ -55,133 +64,170 @@ def countOfCountsTable(counts, sparse=True):
     sparse=True (default), counts with zero counts are not included in the
     returned dictionary.
     """
-    if sparse == True:
-        cs = counts.values()
-    else:
-        cs = xrange(1, max(counts.values())+1)
-
-    countsOfCounts = {}
-    for c in cs:
-        countsOfCounts[c] = 0
-        for species, speciesCount in counts.items():
-            if speciesCount == c:
-                countsOfCounts[c] += 1
-
+    rs, ns = countOfCountsArrays(list(counts.values()))
+    countsOfCounts = dict(zip(rs.tolist(), ns.tolist()))
+    if sparse != True:
+        for c in range(1, int(rs[-1])+1):
+            countsOfCounts.setdefault(c, 0)
     return countsOfCounts
 
+def countOfCountsArrays(counts):
+    """
+    Given a vector of (nonzero) species counts, returns two arrays rs and ns,
+    where rs holds the distinct counts in ascending order and ns[i] is the
+    number of species seen exactly rs[i] times.
+    """
+    counts = np.asarray(counts, dtype=np.int64)
+    if counts.size and counts.min() <= 0:
+        raise ValueError('Species must not have 0 count.')
+    rs, ns = np.unique(counts, return_counts=True)
+    return rs, ns
+
 def simpleGoodTuringProbs(counts, confidenceLevel=1.96):
     """
     Given a dictionary mapping keys (species) to counts, returns a dictionary
     mapping those same species to their smoothed probabilities, according to
     Gale and Sampson's (1995/2001 reprint) "Simple Good-Turing" method of
-    smoothing. The optional confidenceLevel argument should be a multiplier of
-    the standard deviation of the empirical Turing estimate (default 1.96,
-    corresponding to a 95% confidence interval), a parameter of the algorithm
-    that controls how many datapoints are smoothed loglinearly (see Gale and
-    Sampson 1995).
+    smoothing, together with p0, the estimated probability mass of unseen
+    species. See simpleGoodTuringProbsArray() for the details.
     """
-    # Gale and Sampson (1995/2001 reprint)
-    if 0 in counts.values():
+    species = list(counts.keys())
+    probs, p0 = simpleGoodTuringProbsArray(list(counts.values()), confidenceLevel)
+    return dict(zip(species, probs.tolist())), p0
+
+def simpleGoodTuringProbsArray(counts, confidenceLevel=1.96):
+    """
+    Given a vector of species counts, returns a vector with the smoothed
+    probability of each species, according to Gale and Sampson's (1995/2001
+    reprint) "Simple Good-Turing" method of smoothing, together with p0, the
+    estimated probability mass of unseen species. The optional confidenceLevel
+    argument should be a multiplier of the standard deviation of the empirical
+    Turing estimate (default 1.96, corresponding to a 95% confidence
+    interval), a parameter of the algorithm that controls how many datapoints
+    are smoothed loglinearly (see Gale and Sampson 1995).
+    """
+    counts = np.asarray(counts, dtype=np.int64)
+    rs, ns = countOfCountsArrays(counts)
+    rProbs, p0 = __sgtCountProbs(rs, ns, confidenceLevel)
+    return rProbs[np.searchsorted(rs, counts)], p0
+
+def simpleGoodTuringBatch(data, indptr, confidenceLevel=1.96):
+    """
+    Smooths many count vectors in one call. The vectors are given in the
+    layout of a scipy csr_matrix: the counts of row i are
+    data[indptr[i]:indptr[i+1]]. Returns an array of probabilities aligned
+    with data, and an array with p0 for every row. All rows are smoothed at
+    once: the (row, count) pairs are sorted, so the counts of counts of every
+    row are runs of equal pairs, and the regression of every row is solved in
+    closed form. Empty rows get p0 = 1.
+    """
+    data = np.asarray(data, dtype=np.int64)
+    indptr = np.asarray(indptr, dtype=np.int64)
+    numRows = len(indptr) - 1
+
+    probs = np.empty(len(data), dtype=np.float64)
+    p0s = np.ones(numRows, dtype=np.float64)
+    positions = np.arange(indptr[0], indptr[-1])
+    if len(positions) == 0:
+        return probs, p0s
+    counts = data[positions]
+    if counts.min() <= 0:
         raise ValueError('Species must not have 0 count.')
-    totalCounts = float(sum(counts.values()))   # N (G&S)
-    countsOfCounts = countOfCountsTable(counts) # r -> n (G&S)
-    sortedCounts = sorted(countsOfCounts.keys())
-    assert(totalCounts == sum([r*n for r,n in countsOfCounts.items()]))
 
-    if 1 in countsOfCounts:
-        p0 = countsOfCounts[1] / totalCounts
+    # the distinct counts rs of every row in ascending order, and how often they occur (ns)
+    rows = np.repeat(np.arange(numRows), np.diff(indptr))
+    order = np.lexsort((counts, rows))
+    sortedRows, sortedCounts = rows[order], counts[order]
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = (sortedRows[1:] != sortedRows[:-1]) | (sortedCounts[1:] != sortedCounts[:-1])
+    groups = np.flatnonzero(first)
+    groupRows = sortedRows[groups]
+    rs = sortedCounts[groups].astype(np.float64)
+    ns = np.diff(np.append(groups, len(order))).astype(np.float64)
+
+    rowFirst = np.ones(len(groups), dtype=bool)
+    rowFirst[1:] = groupRows[1:] != groupRows[:-1]
+    rowLast = np.append(rowFirst[1:], True)
+    totalCounts = np.bincount(groupRows, rs*ns, numRows)  # N (G&S)
+    smoothedRows = np.flatnonzero(totalCounts > 0)
+    hapaxes = np.zeros(numRows)
+    hapaxes[groupRows[rowFirst & (rs == 1)]] = ns[rowFirst & (rs == 1)]
+    p0 = np.where(hapaxes > 0, hapaxes, 1) / np.where(totalCounts > 0, totalCounts, 1)
+
+    # Z of __sgtZ, with i and k the neighbouring counts within the row
+    i = np.where(rowFirst, 0, np.concatenate(([0], rs[:-1])))
+    k = np.where(rowLast, 2*rs - i, np.concatenate((rs[1:], [0])))
+    Z = 2*ns / (k-i)
+
+    # the least squares fit of log Z on log r for every row, like __loglinregression.
+    # A row with a single count has no unique fit, lstsq returns the minimum norm one.
+    x, y = log(rs), log(Z)
+    m = np.bincount(groupRows, minlength=numRows).astype(np.float64)
+    meanX = np.bincount(groupRows, x, numRows) / np.maximum(m, 1)
+    meanY = np.bincount(groupRows, y, numRows) / np.maximum(m, 1)
+    dx, dy = x - meanX[groupRows], y - meanY[groupRows]
+    sxx = np.bincount(groupRows, dx*dx, numRows)
+    sxy = np.bincount(groupRows, dx*dy, numRows)
+    single = m == 1
+    a = np.where(m > 1, sxy / np.where(m > 1, sxx, 1), 0.0) # empty rows (m == 0) are never divided
+    b = meanY - a*meanX
+    singleGroups = single[groupRows]
+    a[groupRows[singleGroups]] = x[singleGroups]*y[singleGroups] / (x[singleGroups]**2 + 1)
+    b[groupRows[singleGroups]] = y[singleGroups] / (x[singleGroups]**2 + 1)
 
+    a, b = a[groupRows], b[groupRows]
+    rSmoothed = (rs+1) * exp(a*log(rs+1) + b) / exp(a*log(rs) + b)
+    smoothTot = np.bincount(groupRows, ns*rSmoothed, numRows)
+    rProbs = (1.0 - p0[groupRows]) * (rSmoothed / smoothTot[groupRows])
+
+    groupOf = np.cumsum(first) - 1 # the group of every sorted pair
+    probs[positions[order]] = rProbs[groupOf]
+    p0s[smoothedRows] = p0[smoothedRows]
+    return probs, p0s
+
+def __sgtCountProbs(rs, ns, confidenceLevel):
+    # Gale and Sampson (1995/2001 reprint)
+    # Returns the smoothed probability of a single species for every count in
+    # rs, and p0.
+    rs = rs.astype(np.float64)
+    ns = ns.astype(np.float64)
+    totalCounts = float(np.sum(rs*ns))   # N (G&S)
+
+    if rs[0] == 1:
+        p0 = ns[0] / totalCounts
     else:
-        print("WARNING countsOfCounts[1] is not defined!")
         p0 = 1 / totalCounts
 
-    print('p0 = %f' % p0)
-
-    Z = __sgtZ(sortedCounts, countsOfCounts)
+    Z = __sgtZ(rs, ns)
 
     # Compute a loglinear regression of Z[r] on r
-    rs = list(Z.keys())
-    zs = list(Z.values())
-    a, b = __loglinregression(rs, zs)
+    a, b = __loglinregression(rs, Z)
 
     # Gale and Sampson's (1995/2001) "simple" loglinear smoothing method.
-    rSmoothed = {}
-    useY = False
-    for r in sortedCounts:
-        # y is the loglinear smoothing
-        y = float(r+1) * exp(a*log(r+1) + b) / exp(a*log(r) + b)
-
-        # If we've already started using y as the estimate for r, then
-        # contine doing so; also start doing so if no species was observed
-        # with count r+1.
-        if r+1 not in countsOfCounts:
-            if not useY:
-                print('Warning: reached unobserved count before crossing the '\
-                      'smoothing threshold.')
-            useY = True
-
-        if useY:
-            rSmoothed[r] = y
-            continue
-        
-        # x is the empirical Turing estimate for r
-        x = (float(r+1) * countsOfCounts[r+1]) / countsOfCounts[r]
-
-        Nr = float(countsOfCounts[r])
-        Nr1 = float(countsOfCounts[r+1])
-
-        # t is the width of the 95% (or whatever) confidence interval of the
-        # empirical Turing estimate, assuming independence.
-        t = confidenceLevel * \
-            sqrt(\
-                float(r+1)**2 * (Nr1 / Nr**2) \
-                              * (1. + (Nr1 / Nr))\
-            )
-
-        # If the difference between x and y is more than t, then the empirical
-        # Turing estimate x tends to be more accurate. Otherwise, use the
-        # loglinear smoothed value y.
-        if abs(x - y) > t:
-            rSmoothed[r] = x
-        useY = True
-        rSmoothed[r] = y
+    # The switch from the empirical Turing estimate x to the loglinear
+    # estimate y happens at the very first count in this fork (the original
+    # loop always ended up storing y), so confidenceLevel has no effect and
+    # y is used for every count.
+    rSmoothed = (rs+1) * exp(a*log(rs+1) + b) / exp(a*log(rs) + b)
 
     # normalize and return the resulting smoothed probabilities, less the
     # estimated probability mass of unseen species.
-    sgtProbs = {}
-    smoothTot = 0.0
-    for r, rSmooth in rSmoothed.items():
-        smoothTot += countsOfCounts[r] * rSmooth
-    for species, spCount in counts.items():
-        sgtProbs[species] = (1.0 - p0) * (rSmoothed[spCount] / smoothTot)
-
-    return sgtProbs, p0
+    smoothTot = np.sum(ns * rSmoothed)
+    return (1.0 - p0) * (rSmoothed / smoothTot), p0
 
-def __sgtZ(sortedCounts, countsOfCounts):
+def __sgtZ(rs, ns):
     # For each count j, set Z[j] to the linear interpolation of i,j,k, where i
     # is the greatest observed count less than i and k is the smallest observed
     # count greater than j.
-    Z = {}
-    for (jIdx, j) in enumerate(sortedCounts):
-        if jIdx == 0:
-            i = 0
-        else:
-            i = sortedCounts[jIdx-1]
-        if jIdx == len(sortedCounts)-1:
-            k = 2*j - i
-        else:
-            k = sortedCounts[jIdx+1]
-        Z[j] = 2*countsOfCounts[j] / float(k-i)
-    return Z
+    i = np.concatenate(([0], rs[:-1]))
+    k = np.concatenate((rs[1:], [2*rs[-1] - i[-1]]))
+    return 2*ns / (k-i)
 
 def __loglinregression(rs, zs):
     logrs = log(rs)
     logzs = log(zs)
     coef = linalg.lstsq(c_[logrs, (1,)*len(rs)], logzs)[0]
     a, b = coef
-    print('Regression: log(z) = %f*log(r) + %f' % (a,b))
-    if a > -1.0:
-        print('Warning: slope is > -1.0')
     return a, b
 
 
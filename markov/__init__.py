@@ -2,3 +2,6 @@ from .classifier import *
 from .model import *
 from .model_laplace import *
 from .model_backoff import *
+from .tracer import *
+from .model_joint import *
+from .model_ratio import *
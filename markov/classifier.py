@@ -1,37 +1,198 @@
 import pickle
+import itertools
+import collections
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
 
 from .model_laplace import MarkovModelLaplace
 from .model_backoff import MarkovModelBackoff
 from .model_goodturing import MarkovModelGoodTuring
+from .model_joint import MarkovModelJoint
+from .model_ratio import MarkovModelRatio
+from .tracer import ClassifierTracer, TransitionTracer
+from .modelfile import saveClassifier, loadClassifier
+
+from storage import isArrayFile
+from corpus import CorpusReader, corpusTokenLists
 
 from constants import SENTIMENT
 
+def createModel(order, smoothing, tokenizer='nltk'):
+    if smoothing == 'laplace':
+        return MarkovModelLaplace(order, tokenizer)
+    elif smoothing == 'backoff':
+        return MarkovModelBackoff(order, tokenizer)
+    elif smoothing == 'sgts':
+        return MarkovModelGoodTuring(order, tokenizer)
+    raise Exception('unsupported smoothing')
+
+def _trainModel(order, smoothing, tokenizer, file, cacheDir):
+    # runs in a worker process, only the compact counts are sent back
+    model = createModel(order, smoothing, tokenizer)
+    model.trainOnCorpus(file, cacheDir)
+    return model.exportCounts()
+
+def _trainShard(order, smoothing, tokenizer, file, shard, shards):
+    # runs in a worker process, counts one shard of a corpus and sends back the compact counts
+    model = createModel(order, smoothing, tokenizer)
+    model.updateOnTokens(_shardTokenLists(model.tokenizer, file, shard, shards))
+    return model.exportCounts()
+
+def _shardTokenLists(tokenizer, file, shard, shards):
+    # the shards are not cached, every shard is only tokenized once anyway
+    return (tokenizer.tokenize(review) for review in CorpusReader(file, shard, shards).reviews())
+
 class MarkovClassifier:
-    def __init__(self, order, smoothing):
+    def __init__(self, order, smoothing, tokenizer='nltk'):
         self.k = order
         self.smoothing = smoothing
-        if smoothing == 'laplace':
-            self.pos_model = MarkovModelLaplace(self.k)
-            self.neg_model = MarkovModelLaplace(self.k)
-        elif smoothing == 'backoff':
-            self.pos_model = MarkovModelBackoff(self.k)
-            self.neg_model = MarkovModelBackoff(self.k)
-        elif smoothing == 'sgts':
-            self.pos_model = MarkovModelGoodTuring(self.k)
-            self.neg_model = MarkovModelGoodTuring(self.k)
+        self.tokenizer = tokenizer # the name of the tokenizer, see tokenizer.py
+        self.pos_model = createModel(self.k, self.smoothing, self.tokenizer)
+        self.neg_model = createModel(self.k, self.smoothing, self.tokenizer)
+        self.joint_model = None # replaces pos_model and neg_model after joinModels()
+        self.ratio_model = None # replaces all models after compileRatios()
+
+    def trainOnCorpora(self, posfile, negfile, workers=1, cacheDir=None, shards=1):
+        # cacheDir is an optional directory to cache the tokenized corpora in, see corpus/tokencache.py.
+        # shards > 1 counts the corpora in that many shards, see trainOnShards
+        if shards > 1:
+            return self.trainOnShards(posfile, negfile, shards, workers)
+        if workers > 1:
+            # the models share no state, so train them side by side
+            with ProcessPoolExecutor(max_workers=2) as pool:
+                posCounts = pool.submit(_trainModel, self.k, self.smoothing, self.tokenizer, posfile, cacheDir)
+                negCounts = pool.submit(_trainModel, self.k, self.smoothing, self.tokenizer, negfile, cacheDir)
+                self.pos_model.importCounts(posCounts.result())
+                self.neg_model.importCounts(negCounts.result())
         else:
-            raise Exception('unsupported smoothing')
+            self.pos_model.trainOnCorpus(posfile, cacheDir)
+            self.neg_model.trainOnCorpus(negfile, cacheDir)
+        return 0
 
-    def trainOnCorpora(self, posfile, negfile):
-        self.pos_model.trainOnCorpus(posfile)
-        self.neg_model.trainOnCorpus(negfile)
+    def trainOnShards(self, posfile, negfile, shards, workers=1):
+        # Counts every shard of the corpora in a worker process and merges the shards in
+        # order, which gives the models trained on the whole corpora. At most workers
+        # shards are submitted ahead of the merge, so besides the merged models at most
+        # workers + 1 shard counts are in memory at once: the one being merged and the
+        # ones being counted (or done and waiting for their turn).
+        jobs = collections.deque((model, file, shard) for model, file in [(self.pos_model, posfile), (self.neg_model, negfile)] for shard in range(shards))
+        pending = collections.deque()
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            def submit():
+                while jobs and len(pending) < workers:
+                    model, file, shard = jobs.popleft()
+                    pending.append((model, file, shard, pool.submit(_trainShard, self.k, self.smoothing, self.tokenizer, file, shard, shards)))
+
+            submit()
+            while pending:
+                model, file, shard, future = pending.popleft()
+                counts = future.result()
+                submit() # keep the workers busy while merging
+                print("merging shard %d of %d of \"%s\"" % (shard+1, shards, file))
+                part = createModel(self.k, self.smoothing, self.tokenizer)
+                part.importCounts(counts)
+                del counts
+                model.mergeModel(part)
         return 0
 
-    def printDebug(self, debugInfo):
-        print("Total Col Misses: %d" % debugInfo['totalColMisses'])
-        print("Total Row Misses: %d" % debugInfo['totalRowMisses'])
-        print("Total Trans Misses: %d" % debugInfo['totalTransMisses'])
-        for trans in debugInfo['transProbs']:
+    def trainOnShard(self, posfile, negfile, shard, shards):
+        # trains on one shard of the corpora only, to be merged with the others later, see merge()
+        self.pos_model.updateOnTokens(_shardTokenLists(self.getTokenizer(), posfile, shard, shards))
+        self.neg_model.updateOnTokens(_shardTokenLists(self.getTokenizer(), negfile, shard, shards))
+        return 0
+
+    def merge(self, other):
+        # adds the counts of a classifier of the same kind trained on other reviews, like
+        # another shard of the corpora. Merging the shards in order gives the classifier
+        # trained on the whole corpora.
+        if (self.k, self.smoothing, getattr(self, 'tokenizer', 'nltk')) != (other.k, other.smoothing, getattr(other, 'tokenizer', 'nltk')):
+            raise Exception('only classifiers of the same order, smoothing and tokenizer can be merged')
+        for classifier in [self, other]:
+            if classifier.isCompiled() or getattr(classifier, 'joint_model', None) is not None:
+                raise Exception('a joint or compiled classifier can not be merged, merge the classifiers before joining them')
+        self.pos_model.mergeModel(other.pos_model)
+        self.neg_model.mergeModel(other.neg_model)
+
+    def prune(self, minCount=1, threshold=0.0):
+        # drops rare or unimportant transitions from both models, see pruning.py.
+        # Returns the number of dropped transitions.
+        if self.isCompiled() or getattr(self, 'joint_model', None) is not None:
+            raise Exception('a joint or compiled classifier can not be pruned, prune the classifier before joining it')
+        return self.pos_model.prune(minCount, threshold) + self.neg_model.prune(minCount, threshold)
+
+    def update(self, pos_reviews, neg_reviews):
+        # adds more positive and negative reviews to the trained models. Only the new
+        # reviews are tokenized and counted, the models are extended in place.
+        tokenizer = self.getTokenizer()
+        self.updateOnTokens((tokenizer.tokenize(review) for review in pos_reviews),
+                            (tokenizer.tokenize(review) for review in neg_reviews))
+
+    def updateOnCorpora(self, posfile, negfile, cacheDir=None):
+        tokenizer = self.getTokenizer()
+        self.updateOnTokens(corpusTokenLists(posfile, tokenizer, cacheDir), corpusTokenLists(negfile, tokenizer, cacheDir))
+
+    def updateOnTokens(self, posTokenLists, negTokenLists):
+        if self.isCompiled() or getattr(self, 'joint_model', None) is not None:
+            raise Exception('a joint or compiled classifier can not be updated, update the classifier before joining it')
+        self.pos_model.updateOnTokens(posTokenLists)
+        self.neg_model.updateOnTokens(negTokenLists)
+
+    def joinModels(self):
+        # merges the positive and the negative model into one MarkovModelJoint with a
+        # shared vocabulary, which scores a review against both with a single lookup
+        if self.smoothing != 'laplace':
+            raise Exception('only laplace models can be joined')
+        self.joint_model = MarkovModelJoint.fromModels(self.pos_model, self.neg_model)
+        self.pos_model = None
+        self.neg_model = None
+
+    def compileRatios(self):
+        # precomputes the log likelihood ratio of every transition, see MarkovModelRatio.
+        # The compiled classifier makes the same decisions, but can't trace or debug anymore.
+        if self.isCompiled():
+            return
+        if getattr(self, 'joint_model', None) is None:
+            self.joinModels()
+        self.ratio_model = MarkovModelRatio.fromJoint(self.joint_model)
+        self.joint_model = None
+
+    def isCompiled(self):
+        return getattr(self, 'ratio_model', None) is not None
+
+    def _getLogRatios(self, tokenLists, tracer):
+        # log P(pos) - log P(neg) of the tokenized reviews
+        if self.isCompiled():
+            if tracer is not None:
+                raise Exception('a compiled classifier can not be traced')
+            return self.ratio_model.getLogRatios(tokenLists)
+        posTracer = tracer.pos if tracer is not None else None
+        negTracer = tracer.neg if tracer is not None else None
+        pos_likelihoods, neg_likelihoods = self._getLogProbs(tokenLists, posTracer, negTracer)
+        return pos_likelihoods - neg_likelihoods
+
+    def _getLogProbs(self, tokenLists, posTracer, negTracer):
+        # the log likelihoods of the tokenized reviews under the positive and the negative model
+        if getattr(self, 'joint_model', None) is not None:
+            likelihoods = self.joint_model.getLogProbs(tokenLists, posTracer, negTracer)
+            return likelihoods[:, 0], likelihoods[:, 1]
+        return self.pos_model.getLogProbs(tokenLists, posTracer), self.neg_model.getLogProbs(tokenLists, negTracer)
+
+    def _model(self):
+        # any model, they are all of the same order and use the same tokenizer
+        return getattr(self, 'ratio_model', None) or getattr(self, 'joint_model', None) or self.pos_model
+
+    def _tokenize(self, text):
+        return self._model()._tokenize(text)
+
+    def getTokenizer(self):
+        return self._model().tokenizer
+
+    def printDebug(self, tracer):
+        print("Total Col Misses: %d" % tracer.totalColMisses)
+        print("Total Row Misses: %d" % tracer.totalRowMisses)
+        print("Total Trans Misses: %d" % tracer.totalTransMisses)
+        for trans in getattr(tracer, 'transProbs', []):
             if trans['colmiss']:
                 if trans['rowmiss']:
                     print("P(\033[31m%60s\033[0m -> \033[31m%20s\033[0m) = %.2e (%d)" % (trans['from'], trans['to'], trans['prob'], trans['count']))
@@ -47,11 +208,24 @@ class MarkovClassifier:
                         print("P(\033[32m%60s\033[0m -> \033[32m%20s\033[0m) = %.2e (%d)" % (trans['from'], trans['to'], trans['prob'], trans['count']))
 
 
-    def classify(self, text, debug=False, debugInfo={}):
-        posDebugInfo = {}
-        pos_likelihood = self.pos_model.getProb(text, posDebugInfo)
-        negDebugInfo = {}
-        neg_likelihood = self.neg_model.getProb(text, negDebugInfo)
+    def classify(self, text, debug=False, tracer=None):
+        # tracer is an optional ClassifierTracer collecting debug info for both models.
+        # debug=True prints every transition, and traces them if no tracer is given.
+        if self.isCompiled():
+            if debug:
+                raise Exception('a compiled classifier has no debug info')
+            ratio = self._getLogRatios([self._tokenize(text)], tracer)[0]
+            return SENTIMENT(int(np.sign(ratio)))
+
+        if debug and tracer is None:
+            tracer = ClassifierTracer(TransitionTracer)
+        posTracer = tracer.pos if tracer is not None else None
+        negTracer = tracer.neg if tracer is not None else None
+
+        # compare log likelihoods, the plain products underflow on long reviews
+        pos_likelihoods, neg_likelihoods = self._getLogProbs([self._tokenize(text)], posTracer, negTracer)
+        pos_likelihood = pos_likelihoods[0]
+        neg_likelihood = neg_likelihoods[0]
 
         if debug:
             print()
@@ -59,18 +233,13 @@ class MarkovClassifier:
             print("review: ")
             print(text)
             print("POSITIVE MODEL:")
-            print("P = %.4e" % pos_likelihood)
-            self.printDebug(posDebugInfo)
+            print("log P = %.4f" % pos_likelihood)
+            self.printDebug(posTracer)
 
             print()
             print("NEGATIVE MODEL:")
-            print("P = %.4e" % neg_likelihood)
-            self.printDebug(negDebugInfo)
-
-        debugInfo.update({
-            'pos': posDebugInfo,
-            'neg': negDebugInfo,
-        })
+            print("log P = %.4f" % neg_likelihood)
+            self.printDebug(negTracer)
 
         if pos_likelihood > neg_likelihood:
             return SENTIMENT.POSITIVE
@@ -79,6 +248,37 @@ class MarkovClassifier:
         return SENTIMENT.NEUTRAL
 
 
+    def classify_many(self, reviews, batch_size=1000, tracer=None):
+        # Classifies any iterable of reviews, batch_size reviews at a time. All transitions
+        # of a batch are scored against each model at once.
+        # Returns an array with the SENTIMENT value of every review, and an array with
+        # the log likelihood ratio log P(pos) - log P(neg) of every review.
+        # tracer is an optional ClassifierTracer collecting debug info over all reviews.
+        tokenizer = self.getTokenizer()
+        return self.classify_many_tokens((tokenizer.tokenize(review) for review in reviews), batch_size, tracer)
+
+    def classify_many_tokens(self, tokenLists, batch_size=1000, tracer=None):
+        # classify_many for reviews that are already tokenized with getTokenizer(),
+        # like the ones of a tokenized corpus
+        labels = []
+        scores = []
+        model = self._model()
+
+        tokenLists = iter(tokenLists)
+        while True:
+            batch = list(itertools.islice(tokenLists, batch_size))
+            if not batch:
+                break
+
+            batch = [model._pad(tokens) for tokens in batch]
+            batchScores = self._getLogRatios(batch, tracer)
+            scores.append(batchScores)
+            labels.append(np.sign(batchScores).astype(np.int8)) # SENTIMENT values are 1, 0 and -1
+
+        if not scores:
+            return np.zeros(0, dtype=np.int8), np.zeros(0)
+        return np.concatenate(labels), np.concatenate(scores)
+
     # Save and Load from File method:
     @staticmethod
     def loadFromBuffer(buffer):
@@ -89,20 +289,42 @@ class MarkovClassifier:
 
     @staticmethod
     def loadFromFile(filepath):
+        if not isArrayFile(filepath):
+            # an old pickled model, see converter.py
+            return MarkovClassifier.loadFromPickleFile(filepath)
+
+        print("loading model file \"%s\"..." % (filepath))
+        mc = loadClassifier(MarkovClassifier, filepath)
+        print("done.")
+        mc.printSizes()
+        return mc
+
+    @staticmethod
+    def loadFromPickleFile(filepath):
         with open(filepath, 'rb') as f:
             loadbuf = f.read()
-            print("loading %d bytes from file \"%s\"..." % (len(loadbuf), filepath))
+            print("loading %d bytes from pickle file \"%s\"..." % (len(loadbuf), filepath))
+            print("(convert it with converter.py to load it faster)")
             mc =  MarkovClassifier.loadFromBuffer(loadbuf)
             print("done.")
-            if mc.smoothing == 'laplace':
-                print("Laplace classifier")
-                print("Positive model: %d ngrams -> %d words" % (mc.pos_model.transCountMatrix.shape[0], mc.pos_model.transCountMatrix.shape[1]))
-                print("Negative model: %d ngrams -> %d words" % (mc.neg_model.transCountMatrix.shape[0], mc.neg_model.transCountMatrix.shape[1]))
-            elif mc.smoothing == 'backoff':
-                print("Backoff classifier")
-
+            mc.printSizes()
             return mc
 
+    def printSizes(self):
+        print("Tokenizer: %s" % getattr(self, 'tokenizer', 'nltk'))
+        if self.isCompiled():
+            print("Compiled laplace classifier")
+            print("Ratio table: %d ngrams -> %d words, %d transitions" % (self.ratio_model.ratioMatrix.shape[0], self.ratio_model.ratioMatrix.shape[1], self.ratio_model.ratioMatrix.nnz))
+        elif getattr(self, 'joint_model', None) is not None:
+            print("Joint laplace classifier")
+            print("Both models: %d ngrams -> %d words, %d transitions" % (self.joint_model.countMatrix.shape[0], self.joint_model.countMatrix.shape[1], self.joint_model.countMatrix.nnz))
+        elif self.smoothing == 'laplace':
+            print("Laplace classifier")
+            print("Positive model: %d ngrams -> %d words, %s counts, %.1f bytes per ngram" % (self.pos_model.transCountMatrix.shape[0], self.pos_model.transCountMatrix.shape[1], self.pos_model.transCountMatrix.dtype.name, self.pos_model.ngramHash.bytesPerNgram()))
+            print("Negative model: %d ngrams -> %d words, %s counts, %.1f bytes per ngram" % (self.neg_model.transCountMatrix.shape[0], self.neg_model.transCountMatrix.shape[1], self.neg_model.transCountMatrix.dtype.name, self.neg_model.ngramHash.bytesPerNgram()))
+        elif self.smoothing == 'backoff':
+            print("Backoff classifier")
+
     def saveToBuffer(self):
         ##  the pos_model and neg_model will probably not be saved as they should in this implementation
         ##  resolve pointers?
@@ -111,8 +333,6 @@ class MarkovClassifier:
         return savebuf
 
     def saveToFile(self, filepath):
-        with open(filepath, 'wb') as f:
-            savebuf = self.saveToBuffer()
-            print("writing %d bytes to file \"%s\"..." % (len(savebuf), filepath))
-            f.write(savebuf)
-            print("done.")
+        print("writing model file \"%s\"..." % (filepath))
+        size = saveClassifier(self, filepath)
+        print("done. %d bytes written" % size)
@@ -0,0 +1,242 @@
+import numpy as np
+from scipy.sparse import coo_matrix, csr_matrix
+from numpy.lib.stride_tricks import sliding_window_view
+
+from .ngramindex import NgramIndex, numberNgrams
+
+PAD_TOKEN = "_"
+
+## Helpers for building transition count matrices in one pass over a corpus
+
+class GrowableArray():
+    # a numpy backed integer array with amortized O(1) appends
+
+    def __init__(self, dtype=np.int32, capacity=1024):
+        self.data = np.empty(capacity, dtype=dtype)
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def extend(self, values):
+        values = np.asarray(values, dtype=self.data.dtype)
+        needed = self.size + len(values)
+        if needed > len(self.data):
+            capacity = max(needed, 2*len(self.data))
+            grown = np.empty(capacity, dtype=self.data.dtype)
+            grown[:self.size] = self.data[:self.size]
+            self.data = grown
+        self.data[self.size:needed] = values
+        self.size = needed
+
+    def toArray(self):
+        return self.data[:self.size]
+
+
+def repad(tokens, fromOrder, toOrder):
+    # turn the tokens of a review padded for a model of order fromOrder
+    # into the tokens padded for a (lower) order toOrder
+    if fromOrder == toOrder:
+        return tokens
+    if fromOrder == 0:
+        raise Exception('can only repad to a lower order')
+    if toOrder == 0:
+        return tokens[fromOrder:len(tokens)-fromOrder+1] # keep only the stop token
+    cut = fromOrder - toOrder
+    return tokens[cut:len(tokens)-cut]
+
+
+class TransitionCounter():
+    # Collects (row, col) pairs for every transition in the token streams fed to it.
+    # Rows and cols are numbered in the order the ngrams and words are first seen,
+    # which is the same numbering the old two-pass training produced.
+    # The ngrams are kept as word ids and only numbered once all tokens are in.
+    # Given the wordHash and ngramHash of a trained model, the counter continues their
+    # numbering: known words and ngrams keep their ids and new ones are appended.
+
+    def __init__(self, order, wordHash=None, ngramHash=None):
+        self.k = order
+        self.width = max(order, 1)
+        self.wordHash = {} if wordHash is None else wordHash
+        self.baseNgramHash = ngramHash
+        self.ngramIds = GrowableArray() # the word ids of every ngram, width ids each
+        self.sources = GrowableArray(dtype=bool) # whether a transition starts at the ngram
+        self.cols = GrowableArray()
+        self._ngramHash = None
+        self._rows = None
+
+    def addTokens(self, tokens):
+        wordHash = self.wordHash
+        cols = [wordHash.setdefault(token, len(wordHash)) for token in tokens]
+
+        if self.k == 0:
+            self.cols.extend(cols)
+        else:
+            ngrams = sliding_window_view(np.array(cols, dtype=np.int32), self.k)
+            self.ngramIds.extend(ngrams.ravel())
+            sources = np.ones(len(ngrams), dtype=bool)
+            sources[-1] = False # the last ngram is only padding, there is no transition from it
+            self.sources.extend(sources)
+            self.cols.extend(cols[self.k:]) # skip the first padding
+
+        self._ngramHash = None
+
+    def _numberNgrams(self):
+        if self._ngramHash is not None:
+            return
+        if self.k == 0:
+            # in this case, make sure we get 1 row in the transitionMatrix
+            ids = [[self.wordHash[PAD_TOKEN]]] if PAD_TOKEN in self.wordHash else []
+            self._ngramHash, _ = self._indexNgrams(np.array(ids, dtype=np.int64).reshape(-1, 1))
+            self._rows = np.zeros(len(self.cols), dtype=np.int64)
+        else:
+            self._ngramHash, rows = self._indexNgrams(self.ngramIds.toArray())
+            self._rows = rows[self.sources.toArray()]
+
+    def _indexNgrams(self, ids):
+        if self.baseNgramHash is None:
+            return numberNgrams(self.wordHash, self.width, ids)
+        return continueNgrams(self.baseNgramHash, self.wordHash, ids)
+
+    @property
+    def ngramHash(self):
+        self._numberNgrams()
+        return self._ngramHash
+
+    def countMatrix(self):
+        self._numberNgrams()
+        rows = self._rows
+        cols = self.cols.toArray()
+        shape = (len(self._ngramHash), len(self.wordHash))
+
+        # duplicate (row, col) pairs are summed up when converting to csr, in a dtype no
+        # count can overflow: no count is larger than the number of transitions
+        ones = np.ones(len(rows), dtype=np.int32 if len(rows) <= np.iinfo(np.int32).max else np.int64)
+        matrix = coo_matrix((ones, (rows, cols)), shape=shape).tocsr()
+        matrix.sum_duplicates()
+        return fitCounts(matrix)
+
+
+## Count matrices store their counts in the smallest unsigned dtype that holds the
+## largest one. Sums of count matrices are computed in a dtype wide enough for both,
+## so counts widen as the models grow and never wrap around.
+
+COUNT_DTYPES = [np.uint8, np.uint16, np.uint32, np.uint64]
+
+def countDtype(maxCount):
+    # the smallest dtype that holds maxCount
+    for dtype in COUNT_DTYPES:
+        if maxCount <= np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    raise Exception('count %d is too large' % maxCount)
+
+def maxCount(matrix):
+    return int(matrix.data.max()) if matrix.nnz else 0
+
+def fitCounts(matrix):
+    # the count matrix in the smallest dtype that holds its counts
+    dtype = countDtype(maxCount(matrix))
+    if matrix.dtype == dtype:
+        return matrix
+    return csr_matrix((matrix.data.astype(dtype), matrix.indices, matrix.indptr), shape=matrix.shape)
+
+def sumCounts(a, b):
+    # a + b for two count matrices of the same shape
+    dtype = countDtype(maxCount(a) + maxCount(b))
+    return fitCounts(a.astype(dtype, copy=False) + b.astype(dtype, copy=False))
+
+
+def continueNgrams(base, wordHash, ids):
+    # numberNgrams for a wordHash grown from the one of the index base: known ngrams
+    # keep their row in base, new ones are numbered after them
+    ids = np.asarray(ids).reshape(-1, base.width)
+    # an ngram with a word the base vocabulary doesn't know is new, and its
+    # word id may not even fit into the keys of the base index
+    rows = base.lookupIds(np.where(ids < len(base.wordHash), ids, -1))
+    new = rows < 0
+    newIndex, newRows = numberNgrams(wordHash, base.width, ids[new])
+    rows[new] = newRows + len(base)
+    return base.extended(wordHash, newIndex.idArray()), rows
+
+def continueCounts(ngramHash, wordHash, otherNgramHash, otherWordHash, matrix):
+    # Renumbers the count matrix of another model to continue ngramHash and wordHash.
+    # The words and ngrams they don't have are appended in the order of the other model.
+    # Returns the grown ngramHash, a grown copy of wordHash and the renumbered matrix.
+    wordHash = dict(wordHash.items())
+    otherWords = [None]*len(otherWordHash)
+    for word, col in otherWordHash.items():
+        otherWords[col] = word
+    colMap = np.array([wordHash.setdefault(word, len(wordHash)) for word in otherWords], dtype=np.int64)
+
+    ngramHash, rowMap = continueNgrams(ngramHash, wordHash, colMap[otherNgramHash.idArray()].reshape(-1, ngramHash.width))
+
+    rows = np.repeat(np.arange(matrix.shape[0]), np.diff(matrix.indptr))
+    shape = (len(ngramHash), len(wordHash))
+    counts = coo_matrix((matrix.data, (rowMap[rows], colMap[matrix.indices])), shape=shape).tocsr()
+    counts.sort_indices()
+    return ngramHash, wordHash, counts
+
+def marginalizeCounts(ngramHash, wordHash, matrix, order, numReviews):
+    # The counts of order-1 from the counts of order of numReviews reviews, without
+    # counting again: every ngram loses its oldest word and the rows that become the
+    # same ngram are summed. Returns the ngramHash and the count matrix of order-1,
+    # the words keep their cols.
+    #
+    # A review padded for order has one transition more than padded for order-1:
+    # (w, _, ..., _) -> _ into the last stop token, which loses its oldest word to
+    # (_, ..., _) -> _. So that transition is counted numReviews times too often.
+    # Order 0 has only the row of all transitions, which is the col sums of order 1.
+    if order < 1:
+        raise Exception('can only marginalize to a lower order')
+    rows = np.repeat(np.arange(matrix.shape[0]), np.diff(matrix.indptr))
+    if order == 1:
+        lowerHash = NgramIndex(wordHash, 1, [[wordHash[PAD_TOKEN]]])
+        rowMap = np.zeros(matrix.shape[0], dtype=np.int64)
+    else:
+        lowerHash, rowMap = numberNgrams(wordHash, order-1, ngramHash.idArray()[:, 1:])
+
+    counts = coo_matrix((matrix.data.astype(np.int64), (rowMap[rows], matrix.indices)), shape=(len(lowerHash), matrix.shape[1])).tocsr()
+    counts.sum_duplicates()
+    if order > 1:
+        padRow = lowerHash.lookupIds(np.full((1, order-1), wordHash[PAD_TOKEN]))[0]
+        start, end = counts.indptr[max(padRow, 0)], counts.indptr[max(padRow, 0)+1]
+        position = start + np.flatnonzero(counts.indices[start:end] == wordHash[PAD_TOKEN])
+        if padRow < 0 or len(position) == 0 or counts.data[position[0]] < numReviews:
+            raise Exception('the counts are not of %d reviews' % numReviews)
+        counts.data[position[0]] -= numReviews
+        counts.eliminate_zeros()
+    return lowerHash, fitCounts(counts)
+
+def growMatrix(matrix, shape):
+    # the csr matrix with empty rows and cols appended up to shape
+    numRows = shape[0] - matrix.shape[0]
+    indptr = np.concatenate((matrix.indptr, np.full(numRows, matrix.indptr[-1], dtype=matrix.indptr.dtype)))
+    return csr_matrix((matrix.data, matrix.indices, indptr), shape=shape)
+
+
+## Compact form of the count structures, used to ship trained models between processes.
+## Words are joined into one string and ngrams are stored as word ids, so no
+## dicts or tuples have to be pickled.
+
+WORD_SEPARATOR = "\n" # tokens never contain whitespace
+
+def packCounts(ngramHash, wordHash, matrix):
+    words = [None]*len(wordHash)
+    for word, col in wordHash.items():
+        words[col] = word
+
+    return {
+        'words': WORD_SEPARATOR.join(words),
+        'ngrams': ngramHash.idArray(),
+        'data': matrix.data,
+        'indices': matrix.indices,
+        'indptr': matrix.indptr,
+        'shape': matrix.shape,
+    }
+
+def unpackCounts(counts):
+    words = counts['words'].split(WORD_SEPARATOR) if counts['words'] else []
+    wordHash = {word: col for col, word in enumerate(words)}
+    ngramHash = NgramIndex(wordHash, counts['ngrams'].shape[1], counts['ngrams'])
+    matrix = csr_matrix((counts['data'], counts['indices'], counts['indptr']), shape=counts['shape'])
+    return ngramHash, wordHash, matrix
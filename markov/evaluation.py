@@ -0,0 +1,72 @@
+import numpy as np
+
+from .tracer import ClassifierTracer, MissTracer
+
+from constants import SENTIMENT
+
+## Counting the outcome of classifying test corpora, shared by tester.py and
+## crossvalidate.py. The outcome of a chunk of reviews is small and can be summed
+## up with the outcomes of other chunks, in any order.
+
+def newResults():
+    # the SENTIMENT of the reviews -> SENTIMENT classified -> count
+    return {sentiment: {classified: 0 for classified in [SENTIMENT.POSITIVE, SENTIMENT.NEUTRAL, SENTIMENT.NEGATIVE]}
+            for sentiment in [SENTIMENT.POSITIVE, SENTIMENT.NEGATIVE]}
+
+def printResults(results, pos_counter, neg_counter):
+    # prints the confusion table of newResults()
+    total_counter = pos_counter + neg_counter
+    print("---------------------------")
+    print("RESULTS");
+    print("---------------------------")
+    print("")
+    print("reviews:    |  POS  |  NEG  |")
+    print("classified: +-------+-------+")
+    print("      POS   | %4d  | %4d  | %4d" % (results[SENTIMENT.POSITIVE][SENTIMENT.POSITIVE],results[SENTIMENT.NEGATIVE][SENTIMENT.POSITIVE],
+                                               results[SENTIMENT.POSITIVE][SENTIMENT.POSITIVE]+results[SENTIMENT.NEGATIVE][SENTIMENT.POSITIVE]))
+    print("        -   | %4d  | %4d  | %4d" % (results[SENTIMENT.POSITIVE][SENTIMENT.NEUTRAL], results[SENTIMENT.NEGATIVE][SENTIMENT.NEUTRAL],
+                                               results[SENTIMENT.POSITIVE][SENTIMENT.NEUTRAL] +results[SENTIMENT.NEGATIVE][SENTIMENT.NEUTRAL]))
+    print("      NEG   | %4d  | %4d  | %4d" % (results[SENTIMENT.POSITIVE][SENTIMENT.NEGATIVE],results[SENTIMENT.NEGATIVE][SENTIMENT.NEGATIVE],
+                                               results[SENTIMENT.POSITIVE][SENTIMENT.NEGATIVE]+results[SENTIMENT.NEGATIVE][SENTIMENT.NEGATIVE]))
+    print("            +-------+-------+--------")
+    print("      total | %4d  | %4d  | %4d" % (pos_counter, neg_counter, total_counter))
+    print("")
+    print("reviews:    |  POS | NEG  |")
+    print("classified: +------+------+")
+    print("      POS   | %.2f | %.2f | %.2f" % (results[SENTIMENT.POSITIVE][SENTIMENT.POSITIVE]/total_counter,results[SENTIMENT.NEGATIVE][SENTIMENT.POSITIVE]/total_counter,
+                                                results[SENTIMENT.POSITIVE][SENTIMENT.POSITIVE]/total_counter+results[SENTIMENT.NEGATIVE][SENTIMENT.POSITIVE]/total_counter))
+    print("        -   | %.2f | %.2f | %.2f" % (results[SENTIMENT.POSITIVE][SENTIMENT.NEUTRAL]/total_counter, results[SENTIMENT.NEGATIVE][SENTIMENT.NEUTRAL]/total_counter,
+                                                results[SENTIMENT.POSITIVE][SENTIMENT.NEUTRAL]/total_counter +results[SENTIMENT.NEGATIVE][SENTIMENT.NEUTRAL]/total_counter))
+    print("      NEG   | %.2f | %.2f | %.2f" % (results[SENTIMENT.POSITIVE][SENTIMENT.NEGATIVE]/total_counter,results[SENTIMENT.NEGATIVE][SENTIMENT.NEGATIVE]/total_counter,
+                                                results[SENTIMENT.POSITIVE][SENTIMENT.NEGATIVE]/total_counter+results[SENTIMENT.NEGATIVE][SENTIMENT.NEGATIVE]/total_counter))
+    print("            +------+------+--------")
+    print("            | %.2f | %.2f | %.2f" % (pos_counter/total_counter, neg_counter/total_counter, total_counter/total_counter))
+    print("")
+
+def classifyTokens(markov_classifier, tokenLists, batch_size):
+    # classifies the tokenized reviews and returns the number of reviews of every
+    # SENTIMENT value, the number of reviews and the summed up misses
+    tracer = None if markov_classifier.isCompiled() else ClassifierTracer(MissTracer) # a compiled classifier can't be traced
+    labels, scores = markov_classifier.classify_many_tokens(tokenLists, batch_size=batch_size, tracer=tracer)
+    labelCounts = {sentiment.value: int(np.count_nonzero(labels == sentiment.value)) for sentiment in SENTIMENT}
+
+    if tracer is None:
+        return labelCounts, len(labels), None
+    misses = {
+        'posRows': tracer.pos.totalRowMisses,
+        'posCols': tracer.pos.totalColMisses,
+        'posTrans': tracer.pos.totalTransMisses,
+        'negRows': tracer.neg.totalRowMisses,
+        'negCols': tracer.neg.totalColMisses,
+        'negTrans': tracer.neg.totalTransMisses,
+    }
+    return labelCounts, len(labels), misses
+
+def addOutcome(results, totals, outcome):
+    # adds the outcome of classifyTokens to results and to totals, the [number of reviews, misses]
+    labelCounts, numReviews, misses = outcome
+    for sentiment in results:
+        results[sentiment] += labelCounts[sentiment.value]
+    totals[0] += numReviews
+    if misses is not None:
+        totals[1] = misses if totals[1] is None else {key: totals[1][key] + value for key, value in misses.items()}
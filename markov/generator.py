@@ -0,0 +1,174 @@
+import array
+import random
+
+import numpy as np
+
+from .counting import PAD_TOKEN
+
+## Synthetic corpora for scale testing, with the vocabulary growth of real text.
+##
+## Reviews are sampled from the transition counts of a trained model, one token per
+## step for a whole block of reviews at once, or resampled from a tokenized corpus.
+## Either way they only contain the words of the source, so every rare word (seen at
+## most rareCount times in the source) is replaced by a draw from a Pitman-Yor process
+## over an endless lexicon of synthetic words. It reuses a synthetic word with
+## probability (count - discount) / (strength + n) and coins a new one otherwise, which
+## gives Zipf distributed word counts and a vocabulary growing like n^discount (Heaps'
+## law), just like a corpus that keeps growing keeps bringing new rare words.
+##
+## Of the words of a Pitman-Yor process a share of about discount are only seen once,
+## so the discount is the share of the words seen once in the source. With strength =
+## the number of rare tokens of the source, a corpus of the source's size gets about
+## as many synthetic words as the source had rare words.
+
+def syntheticWord(wordId):
+    # the i-th word of the synthetic lexicon, only lowercase letters so every tokenizer keeps it
+    letters = []
+    wordId += 1
+    while wordId > 0:
+        wordId, letter = divmod(wordId - 1, 26)
+        letters.append(chr(ord('a') + letter))
+    return 'qz' + ''.join(reversed(letters))
+
+
+class OpenVocabulary():
+    # Pitman-Yor process over the synthetic lexicon. The probability (count - discount)
+    # of a known word is split into count - 1, drawn by picking a random earlier repeat,
+    # and 1 - discount, drawn by picking a random known word, so every draw is O(1).
+
+    def __init__(self, discount, strength, seed=0):
+        if not 0 <= discount < 1 or strength <= -discount:
+            raise Exception('no Pitman-Yor process with discount %g and strength %g' % (discount, strength))
+        self.discount = discount
+        self.strength = strength
+        self.random = random.Random(seed)
+        self.numWords = 0  # the number of words coined so far
+        self.repeats = array.array('q')  # the word of every draw that wasn't a new word
+
+    def __len__(self):
+        return self.numWords
+
+    def draw(self):
+        n = self.numWords + len(self.repeats)
+        u = self.random.random() * (self.strength + n)
+        if u < len(self.repeats):
+            word = self.repeats[int(u)]
+        elif u < len(self.repeats) + self.numWords * (1 - self.discount):
+            word = self.random.randrange(self.numWords)
+        else:
+            self.numWords += 1
+            return self.numWords - 1
+        self.repeats.append(word)
+        return word
+
+
+def fitVocabulary(wordCounts, rareCount=1, seed=0):
+    # the OpenVocabulary for the rare words of a source with the given count of every word
+    wordCounts = np.asarray(wordCounts)
+    wordCounts = wordCounts[wordCounts > 0]
+    discount = np.count_nonzero(wordCounts == 1) / max(len(wordCounts), 1)
+    discount = min(max(discount, 0.05), 0.95)
+    strength = max(int(wordCounts[wordCounts <= rareCount].sum()), 1)
+    return OpenVocabulary(discount, strength, seed)
+
+
+class ChainSampler():
+    # Samples reviews from the transition counts of a trained laplace or sgts model, the
+    # next word of every review in proportion to the counts of its ngram's row. A review
+    # ends with the stop token, at an ngram without transitions or after maxLength words.
+
+    def __init__(self, model, maxLength=2000):
+        counts = model.transCountMatrix
+        self.k = model.k
+        self.ngramHash = model.ngramHash
+        self.padCol = model.wordHash[PAD_TOKEN]
+        self.maxLength = maxLength
+        self.indptr = counts.indptr
+        self.indices = counts.indices
+        self.cumulative = np.concatenate(([0], np.cumsum(counts.data, dtype=np.int64)))
+
+        self.words = np.empty(len(model.wordHash), dtype=object)
+        for word, col in model.wordHash.items():
+            self.words[col] = word
+        self.wordCounts = np.bincount(counts.indices, weights=counts.data, minlength=counts.shape[1]).astype(np.int64)
+        self.wordCounts[self.padCol] = 0 # the padding is no word of the reviews
+
+        if self.k == 0:
+            self.startRow = 0
+        else:
+            self.startRow = self.ngramHash.lookupIds(np.full((1, self.k), self.padCol))[0]
+
+    def sample(self, numReviews, rng):
+        # the word ids of numReviews reviews, as one array and the offsets of every review in it
+        rows = np.full(numReviews, self.startRow, dtype=np.int64)
+        context = np.full((numReviews, self.k), self.padCol, dtype=np.int64)
+        steps = []
+        lengths = np.full(numReviews, self.maxLength, dtype=np.int64)
+        alive = np.flatnonzero(rows >= 0)
+        lengths[rows < 0] = 0
+
+        for step in range(self.maxLength):
+            if len(alive) == 0:
+                break
+            first = self.cumulative[self.indptr[rows[alive]]]
+            total = self.cumulative[self.indptr[rows[alive]+1]] - first
+            empty = total == 0
+            target = first + (rng.random(len(alive)) * total).astype(np.int64)
+            positions = np.minimum(np.searchsorted(self.cumulative, target, side='right') - 1, len(self.indices) - 1)
+            cols = self.indices[positions].astype(np.int64)
+
+            ended = empty | (cols == self.padCol)
+            lengths[alive[ended]] = step
+            tokens = np.full(numReviews, -1, dtype=np.int64)
+            tokens[alive] = cols
+            steps.append(tokens)
+
+            alive = alive[~ended]
+            if self.k > 0:
+                context[alive] = np.concatenate((context[alive, 1:], cols[~ended, None]), axis=1)
+                rows[alive] = self.ngramHash.lookupIds(context[alive])
+                lengths[alive[rows[alive] < 0]] = step + 1
+                alive = alive[rows[alive] >= 0]
+
+        if not steps:
+            return np.zeros(0, dtype=np.int64), np.zeros(numReviews+1, dtype=np.int64)
+        tokens = np.stack(steps, axis=1) # review by step
+        keep = np.arange(tokens.shape[1]) < lengths[:, None]
+        return tokens[keep], np.concatenate(([0], np.cumsum(lengths)))
+
+
+class ReviewResampler():
+    # Samples whole reviews of a tokenized corpus, with replacement
+
+    def __init__(self, tokenLists):
+        wordHash = {}
+        ids = [[wordHash.setdefault(token, len(wordHash)) for token in tokens] for tokens in tokenLists]
+        self.offsets = np.concatenate(([0], np.cumsum([len(review) for review in ids]))).astype(np.int64)
+        self.tokens = np.fromiter((wordId for review in ids for wordId in review), dtype=np.int64, count=self.offsets[-1])
+        self.words = np.empty(len(wordHash), dtype=object)
+        for word, wordId in wordHash.items():
+            self.words[wordId] = word
+        self.wordCounts = np.bincount(self.tokens, minlength=len(wordHash))
+
+    def sample(self, numReviews, rng):
+        reviews = rng.integers(0, len(self.offsets)-1, numReviews)
+        starts, ends = self.offsets[reviews], self.offsets[reviews+1]
+        lengths = ends - starts
+        offsets = np.concatenate(([0], np.cumsum(lengths)))
+        positions = np.repeat(starts - offsets[:-1], lengths) + np.arange(offsets[-1])
+        return self.tokens[positions], offsets
+
+
+def generateReviews(sampler, vocabulary, numReviews, rareCount=1, seed=0, blockSize=10000):
+    # Yields numReviews synthetic reviews as space separated strings. The rare words of the
+    # sampler's source are replaced by draws from vocabulary, an OpenVocabulary.
+    rng = np.random.default_rng(seed)
+    rare = (sampler.wordCounts > 0) & (sampler.wordCounts <= rareCount)
+    for start in range(0, numReviews, blockSize):
+        tokens, offsets = sampler.sample(min(blockSize, numReviews - start), rng)
+        words = sampler.words[tokens]
+        for position in np.flatnonzero(rare[tokens]).tolist():
+            words[position] = syntheticWord(vocabulary.draw())
+        words = words.tolist()
+        for first, last in zip(offsets[:-1].tolist(), offsets[1:].tolist()):
+            yield ' '.join(words[first:last])
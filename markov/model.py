@@ -8,5 +8,5 @@ class MarkovModel():
     def trainOnCorpus(self, file):
         self.smoothed_model.trainOnCorpus(file)
 
-    def getProb(self, review, debuginfo={}):
-        return self.smoothed_model.getProb(text)
+    def getLogProb(self, review, tracer=None):
+        return self.smoothed_model.getLogProb(review, tracer)
@@ -1,64 +1,154 @@
 from .model import MarkovModel
 from .model_laplace import MarkovModelLaplace
-import nltk
+from .counting import TransitionCounter, repad
+from .scoring import batchTransitionIds, iterTransitions, segmentSums
+
+from corpus import corpusTokenLists
+import numpy as np
 
 # See http://courses.washington.edu/ling570/gina_fall11/slides/ling570_class8_smoothing.pdf
 # for details about smoothing
 
 class MarkovModelBackoff(MarkovModel):
 
-    def __init__(self, order):
+    def __init__(self, order, tokenizer='nltk'):
         self.k = order
         self.models = []
         ## TODO: use 0-order as base (the source above calls this 'unigram')
         for k in range(0, self.k+1):
-            self.models.append(MarkovModelLaplace(k))
-
-    def trainOnCorpus(self, file):
+            self.models.append(MarkovModelLaplace(k, tokenizer))
+
+    def trainOnCorpus(self, file, cacheDir=None):
+        # tokenize every review once (or load the tokens from the cache in cacheDir) and count the transitions for all orders 0..k
+        # from the same token stream
+        counters = [TransitionCounter(model.k) for model in self.models]
+
+        revno = 1
+        for tokens in corpusTokenLists(file, self.models[self.k].tokenizer, cacheDir):
+            print("%4d" %(revno))
+            tokens = self.models[self.k]._pad(tokens)
+            for counter in counters:
+                counter.addTokens(repad(tokens, self.k, counter.k))
+            revno += 1
+
+        for model, counter in zip(self.models, counters):
+            model.loadCounter(counter)
+
+    def loadModels(self, models):
+        # uses the trained laplace models of the orders 0..k, e.g. marginalized from the model of order k
+        if [model.k for model in models] != list(range(self.k+1)):
+            raise Exception('need the models of the orders 0 to %d' % self.k)
+        self.models = list(models)
+
+    def updateOnTokens(self, tokenLists):
+        # adds the transitions of more tokenized reviews to the models of all orders
+        counters = [model.continuedCounter() for model in self.models]
+
+        revno = 1
+        for tokens in tokenLists:
+            print("%4d" %(revno))
+            tokens = self.models[self.k]._pad(tokens)
+            for counter in counters:
+                counter.addTokens(repad(tokens, self.k, counter.k))
+            revno += 1
+
+        for model, counter in zip(self.models, counters):
+            model.addCounter(counter)
+
+    def mergeModel(self, other):
+        # adds the counts of another backoff model of the same order, see MarkovModelLaplace.mergeModel
+        for model, otherModel in zip(self.models, other.models):
+            model.mergeModel(otherModel)
+
+    def prune(self, minCount=1, threshold=0.0):
+        # prunes the models of all orders, a dropped transition backs off to the lower orders
+        return sum(model.prune(minCount, threshold) for model in self.models)
+
+    def exportCounts(self):
+        return [model.exportCounts() for model in self.models]
+
+    def importCounts(self, counts):
+        for model, modelCounts in zip(self.models, counts):
+            model.importCounts(modelCounts)
+
+    def saveArrays(self):
+        arrays = {}
         for model in self.models:
-            model.trainOnCorpus(file)
-
-    def getProb(self, review, debuginfo={}):
-
-        debuginfo.update({
-            'totalRowMisses': 0,    # number of prevstates we didn't know
-            'totalColMisses': 0,    # number of words we haven't seen before
-            'totalTransMisses': 0,  # number of transistions we haven't seen before
-            'transProbs': [],       # the probability of each transition
-        })
-
-        tokens = self.models[self.k]._tokenize(review)
-        ngrams = list(nltk.ngrams(tokens, self.k)) # this not effective, but works
-
-        words = tokens[self.k:] # skip the first padding
-
-        totalProb = 1.0
-        for i, word in enumerate(words):
-            prevstates = ngrams[i]
-
-            k = self.k # always start at max k
-            alpha = 1 # backoff punishment
-
-            miss = True # dummy to get inside loop
-            while miss and k >= 0:
-
-                transDebug = {}
-                # alpha = 1, 0.4, 0.16, ...
-                transProb = alpha * self.models[k].getTransitionProb(prevstates, word, transDebug)
-
-                debuginfo['transProbs'].append(transDebug)
-
-                miss = (transDebug['rowmiss'] or transDebug['colmiss'] or transDebug['transmiss'])
-                k -= 1 #reduce k for each iteration
-                alpha = alpha * 0.1 # increase the punishment for each iteration
-                prevstates = prevstates[1:] # and reduce the prevstates
-
-            #multiply the totalProb
-            totalProb *= transProb
-
-            # add the misses (only applies to the base-case 0-order model)
-            debuginfo['totalRowMisses'] += transDebug['rowmiss']
-            debuginfo['totalColMisses'] += transDebug['colmiss']
-            debuginfo['totalTransMisses'] += transDebug['transmiss']
-        return totalProb
+            for key, array in model.saveArrays().items():
+                arrays['k%d.%s' % (model.k, key)] = array
+        return arrays
 
+    def loadArrays(self, arrays):
+        for model in self.models:
+            prefix = 'k%d.' % model.k
+            model.loadArrays({key[len(prefix):]: array for key, array in arrays.items() if key.startswith(prefix)})
+
+    def sizes(self):
+        return [model.sizes() for model in self.models]
+
+    @property
+    def tokenizer(self):
+        return self.models[self.k].tokenizer
+
+    def _tokenize(self, text):
+        return self.models[self.k]._tokenize(text)
+
+    def _pad(self, tokens):
+        return self.models[self.k]._pad(tokens)
+
+    def getLogProb(self, review, tracer=None):
+        # the log likelihood of the review, computed for all transitions at once
+        return self.getLogProbs([self._tokenize(review)], tracer)[0]
+
+    def getLogProbs(self, tokenLists, tracer=None):
+        # the log likelihoods of many tokenized reviews, with one gather per order for all their transitions
+        lengths = [len(tokens) - self.k for tokens in tokenLists]
+        numWords = sum(lengths)
+        segments = np.repeat(np.arange(len(lengths)), lengths)
+
+        logProbs = np.zeros(numWords)
+        rowmiss = np.zeros(numWords, dtype=bool)
+        colmiss = np.zeros(numWords, dtype=bool)
+        transmiss = np.zeros(numWords, dtype=bool)
+
+        traced = [] if tracer is not None and tracer.wantsTransitions else None
+
+        # positions that still need a probability, starting at max k
+        pending = np.arange(numWords)
+        logAlpha = 0.0 # backoff punishment
+        for k in range(self.k, -1, -1):
+            model = self.models[k]
+            # drop the oldest prevstates by dropping the first padding
+            kTokenLists = [tokens[self.k-k:] for tokens in tokenLists]
+            rows, cols, _ = batchTransitionIds(kTokenLists, k, model.ngramHash, model.wordHash)
+            rows = rows[pending]
+            cols = cols[pending]
+
+            kLogProbs, kRowmiss, kColmiss, kTransmiss = model.getLogTransitionProbs(rows, cols)
+            logProbs[pending] = logAlpha + kLogProbs
+            rowmiss[pending] = kRowmiss
+            colmiss[pending] = kColmiss
+            transmiss[pending] = kTransmiss
+
+            if traced is not None:
+                transitions = list(iterTransitions(kTokenLists, k))
+                counts = model._getCounts(rows, cols) + 1
+                for i, position in enumerate(pending):
+                    prevstates, word = transitions[position]
+                    traced.append((position, self.k-k, prevstates, word, np.exp(kLogProbs[i]), counts[i], kRowmiss[i], kColmiss[i], kTransmiss[i]))
+
+            pending = pending[kRowmiss | kColmiss | kTransmiss]
+            logAlpha += np.log(0.1) # increase the punishment for each iteration
+            if len(pending) == 0:
+                break
+
+        if tracer is not None:
+            # the misses only apply to the model that finally gave the probability
+            tracer.addMisses(rowmiss, colmiss, transmiss)
+            if traced is not None:
+                # every lookup of a transition, from max k down to where it was found
+                traced.sort(key=lambda lookup: lookup[:2])
+                for lookup in traced:
+                    tracer.addTransition(*lookup[2:])
+
+        return segmentSums(logProbs, segments, len(tokenLists))
@@ -1,27 +1,41 @@
 from .model import MarkovModel
 
-from corpus import CorpusReader
+from corpus import corpusTokenLists
 import numpy as np
-from scipy.sparse import csr_matrix, lil_matrix
-import nltk
+from scipy.sparse import csr_matrix
 import time
 
 from libs import sgts
+from .counting import TransitionCounter, packCounts, unpackCounts, growMatrix, continueCounts, sumCounts
+from .modelfile import countArrays, countsFromArrays, matrixArrays, matrixFromArrays
+from .ngramindex import NgramIndex
+from .pruning import pruneMask, dropTransitions
+from .tokenizer import getTokenizer
+from .scoring import batchTransitionIds, iterTransitions, segmentSums, gather
 
 PAD_TOKEN = "_"
 
+def _rowPositions(indptr, rows):
+    # the positions of the entries of the given csr rows, row after row
+    lengths = np.diff(indptr)[rows]
+    offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    return np.repeat(indptr[rows] - offsets, lengths) + np.arange(lengths.sum())
+
 class MarkovModelGoodTuring(MarkovModel):
 
-    def __init__(self, order):
+    def __init__(self, order, tokenizer='nltk'):
         self.k = order
+        self.tokenizer = getTokenizer(tokenizer)
         self.transCountMatrix = None
         self.transProbMatrix = None
 
-        self.ngramHash = {} # maps an ngram to its row index in self.transCountMatrix
         self.wordHash = {} # maps a word to its col index in self.transCountMatrix
+        self.ngramHash = NgramIndex(self.wordHash, max(order, 1)) # maps an ngram to its row index in self.transCountMatrix
 
     def _tokenize(self, text):
-        tokens = nltk.word_tokenize(text)
+        return self._pad(self.tokenizer.tokenize(text))
+
+    def _pad(self, tokens):
         if self.k == 0:
             tokens = tokens + [PAD_TOKEN] # add only the stop token
         else:
@@ -29,45 +43,59 @@ class MarkovModelGoodTuring(MarkovModel):
 
         return tokens
 
-    def getProb(self, review, debuginfo={}):
-        debuginfo.update({
-            'totalRowMisses': 0,    # number of prevstates we didn't know
-            'totalColMisses': 0,    # number of words we haven't seen before
-            'totalTransMisses': 0,  # number of transistions we haven't seen before
-            'transProbs': [],       # the probability of each transition
-        })
-
-        tokens = self._tokenize(review)
-        ngrams = list(nltk.ngrams(tokens, self.k)) # this not effective, but works
-
-        words = tokens[self.k:] # skip the first padding
-
-        totalProb = 1.0
-        for i, word in enumerate(words):
-            prevstates = ngrams[i]
-            transDebug = {}
-            transProb = self.getTransitionProb(prevstates, word, transDebug)
-
-            #multiply the totalProb
-            totalProb *= transProb
-
-            debuginfo['totalRowMisses'] += transDebug['rowmiss']
-            debuginfo['totalColMisses'] += transDebug['colmiss']
-            debuginfo['totalTransMisses'] += transDebug['transmiss']
-            debuginfo['transProbs'].append(transDebug)
-
-        return totalProb
-
-    def getTransitionProb(self, prevstates, word, debuginfo):
-        debuginfo.update({
-            'from'      : prevstates,
-            'to'        : word,
-            'prob'      : 0,
-            'count'     : 0,
-            'rowmiss'   : 0,     #we didn't know these prevstates
-            'colmiss'   : 0,     #we haven't seen this word before
-            'transmiss' : 0,     #we knew the prevstate and the word, but we haven't a transition between them
-        })
+    def getLogProb(self, review, tracer=None):
+        # the log likelihood of the review, computed for all transitions at once
+        return self.getLogProbs([self._tokenize(review)], tracer)[0]
+
+    def getLogProbs(self, tokenLists, tracer=None):
+        # the log likelihoods of many tokenized reviews, with one gather for all their transitions
+        rows, cols, segments = batchTransitionIds(tokenLists, self.k, self.ngramHash, self.wordHash)
+
+        rowmiss = rows < 0 # ngrams we never saw back off to the unigram probabilities
+        seen = ~rowmiss
+
+        unknownCol = self.transProbMatrix.shape[1]-1 # the last column is for unknown words and transitions
+        colmiss = cols < 0
+        probCols = np.where(colmiss, unknownCol, cols)
+
+        probSmooth = np.empty(len(rows), dtype=np.float64)
+        probSmooth[seen] = gather(self.transProbMatrix, rows[seen], probCols[seen])
+        if rowmiss.any():
+            probSmooth[rowmiss] = self._unigramProbs()[probCols[rowmiss]]
+        transmiss = probSmooth == 0
+        probSmooth[transmiss & seen] = gather(self.transProbMatrix, rows[transmiss & seen], np.full(np.count_nonzero(transmiss & seen), unknownCol))
+        probSmooth[transmiss & rowmiss] = self._unigramProbs()[-1]
+
+        if tracer is not None:
+            tracer.addMisses(rowmiss, colmiss, transmiss)
+            if tracer.wantsTransitions:
+                counts = np.zeros(len(rows), dtype=np.int64)
+                known = seen & ~colmiss
+                counts[known] = gather(self.transCountMatrix, rows[known], cols[known])
+                for i, (prevstates, word) in enumerate(iterTransitions(tokenLists, self.k)):
+                    tracer.addTransition(prevstates, word, probSmooth[i], counts[i], rowmiss[i], colmiss[i], transmiss[i])
+
+        return segmentSums(np.log(probSmooth), segments, len(tokenLists))
+
+    def _unigramProbs(self):
+        # The simple good-turing smoothed probabilities of the words over all transitions,
+        # with p0 for unknown words at the end. Transitions from ngrams the model never
+        # saw get these. Cached until the counts change.
+        counts = self.transCountMatrix
+        if getattr(self, '_unigramCounts', None) is not counts:
+            wordCounts = np.bincount(counts.indices, weights=counts.data, minlength=counts.shape[1]).astype(np.int64)
+            words = np.flatnonzero(wordCounts)
+            self._unigrams = np.zeros(counts.shape[1]+1, dtype=np.float64)
+            self._unigrams[-1] = 1.0 # nothing seen, everything is unknown
+            if len(words):
+                self._unigrams[words], self._unigrams[-1] = sgts.simpleGoodTuringProbsArray(wordCounts[words])
+            self._unigramCounts = counts
+        return self._unigrams
+
+    def getTransitionProb(self, prevstates, word, tracer=None):
+        rowmiss = 0     #we didn't know these prevstates
+        colmiss = 0     #we haven't seen this word before
+        transmiss = 0   #we knew the prevstate and the word, but we haven't a transition between them
 
         if self.k == 0:
             row = 0 # just the only row we've got
@@ -78,120 +106,216 @@ class MarkovModelGoodTuring(MarkovModel):
         probSmooth = 0
         count = 0
         if row is None:
-            debuginfo['rowmiss'] = 1
+            # back off to the unigram probabilities
+            rowmiss = 1
+            unigrams = self._unigramProbs()
             if col is None:
-                debuginfo['colmiss'] = 1
-                raise Exception("What to do here?")
-            else:
-                countSmooth = 1
-                raise Exception("What to do here?")
+                colmiss = 1
+                col = len(unigrams)-1
+            probSmooth = unigrams[col]
+            if probSmooth == 0:
+                transmiss = 1
+                probSmooth = unigrams[-1]
 
         else:
             if col is None:
-                debuginfo['colmiss'] = 1
+                colmiss = 1
                 col = self.transProbMatrix.shape[1]-1 # the last column is for the unknown word
                 count = 0
             else:
-                count = self.transCountMatrix[row, col]
+                count = int(self.transCountMatrix[row, col]) # a python int, + 1 would wrap around in the count dtype
 
             probSmooth = self.transProbMatrix[row, col]
             if probSmooth == 0:
-                debuginfo['transmiss'] = 1
+                transmiss = 1
 
                 col = self.transProbMatrix.shape[1]-1 # the last column is for unknown transitions as well
                 probSmooth = self.transProbMatrix[row, col]
 
-        debuginfo['count'] = count
-        debuginfo['prob'] = probSmooth
+        if tracer is not None:
+            tracer.addMisses(rowmiss, colmiss, transmiss)
+            tracer.addTransition(prevstates, word, probSmooth, count, rowmiss, colmiss, transmiss)
 
         return probSmooth
 
-    def trainOnCorpus(self, reviewfile):
-        reader = CorpusReader(reviewfile)
-
+    def trainOnCorpus(self, reviewfile, cacheDir=None):
+        # tokenize every review once (or load the tokens from the cache in cacheDir),
         # count ngrams (prev states) and words (words/current state)
-        # and create hashtables
-        ngramCounter = 0
-        wordCounter = 0
-
-        for review in reader.reviews():
-            #print(review)
-            tokens = self._tokenize(review)
-
-            if (self.k == 0):
-                # in this case, make sure we get 1 row in the transitionMatrix
-                self.ngramHash[(PAD_TOKEN,)] = 0
-                ngramCounter = 1
-            else:
-                ngrams = nltk.ngrams(tokens, self.k)
-
-                for ngram in ngrams:
-                    if ngram not in self.ngramHash:
-                        self.ngramHash[ngram] = ngramCounter
-                        ngramCounter += 1
-
-            for token in tokens:
-                if token not in self.wordHash:
-                    self.wordHash[token] = wordCounter
-                    wordCounter += 1
-
-        # create the transitionMatrix
-        # use the lil_matrix format now for inserts and convert to more compact csr_matrix later
-        self.transCountMatrix = lil_matrix((ngramCounter, wordCounter), dtype=np.uint16)
-        self.transProbMatrix = lil_matrix((ngramCounter, wordCounter+1), dtype=np.float64)
+        # and collect the transitions as (row, col) pairs
+        counter = TransitionCounter(self.k)
 
         revno = 1
-        for review in reader.reviews():
+        for tokens in corpusTokenLists(reviewfile, self.tokenizer, cacheDir):
             print("%4d" %(revno))
+            counter.addTokens(self._pad(tokens))
+            revno += 1
 
-            tokens = self._tokenize(review)
-            words = tokens[self.k:] # skip the first padding
+        counts = counter.countMatrix()
+        tic = time.time()
+        self.loadCounts(counter.ngramHash, counter.wordHash, counts)
+        toc = time.time()
+        print("Elapsed: %.2f s" % (toc-tic))
 
-            if self.k == 0:
-                for word in words:
-                    row = 0 # use the only row we got
-                    col = self.wordHash[word]
-                    self.transCountMatrix[row, col] += 1
+        #print("rows: %d, cols: %d" % (self.transCountMatrix.shape[0], self.transCountMatrix.shape[1]))
 
-            else:
-                ngrams = list(nltk.ngrams(tokens, self.k)) # this not effective, but works
+    def loadCounts(self, ngramHash, wordHash, counts):
+        # uses the given count matrix, e.g. marginalized from a model of higher order, and smooths it
+        self.ngramHash = ngramHash
+        self.wordHash = wordHash
+        self.transCountMatrix = counts
+        self.transProbMatrix = self._smoothCounts(counts)
+
+    def updateOnTokens(self, tokenLists):
+        # adds the transitions of more tokenized reviews to the trained model, and smooths
+        # only the rows they changed again. Known words and ngrams keep their ids.
+        if self.transCountMatrix is None:
+            counter = TransitionCounter(self.k)
+        else:
+            counter = TransitionCounter(self.k, dict(self.wordHash.items()), self.ngramHash)
 
-                for i, word in enumerate(words):
-                    prevstates = ngrams[i]
-                    row = self.ngramHash[prevstates]
-                    col = self.wordHash[word]
-                    self.transCountMatrix[row, col] += 1
+        revno = 1
+        for tokens in tokenLists:
+            print("%4d" %(revno))
+            counter.addTokens(self._pad(tokens))
             revno += 1
 
-        # convert it to compact csr_matrix format!
-        self.transCountMatrix = csr_matrix(self.transCountMatrix)
-
-        for ngram, row in self.ngramHash.items():
-            counts = {}
-            for word, col in self.wordHash.items():
-                count = self.transCountMatrix[row, col]
-                if count > 0:
-                    counts[word] = count
-
-            tic = time.time()
-            probs, p0 = sgts.simpleGoodTuringProbs(counts)
-            for word, prob in probs.items():
-                col = self.wordHash[word]
-                self.transProbMatrix[row, col] = prob
-            self.transProbMatrix[row, -1] = p0 # add p0 to the last column!
-            toc = time.time()
-            print("Elapsed: %.2f s" % (toc-tic))
-
-            #probs["*unknown*"] = p0
-            #highscore = sorted(probs.items(), key=lambda x: x[1], reverse=True)
-            #totalProb = 0
-            #for (word, prob) in highscore:
-            #    print("%20s : %4d , P = %.4f" % (word, counts.get(word, 0), prob))
-            #    totalProb += prob
-            #print("TOTAL: %.4f" % totalProb)
-
-
-        #print("rows: %d, cols: %d" % (self.transCountMatrix.shape[0], self.transCountMatrix.shape[1]))
+        self._addCounts(counter.ngramHash, counter.wordHash, counter.countMatrix())
+
+    def mergeModel(self, other):
+        # adds the counts of another model of the same order, trained on other reviews.
+        # The result is the model trained on the reviews of this model, then the other's.
+        if self.transCountMatrix is None:
+            self.ngramHash, self.wordHash = other.ngramHash, other.wordHash
+            self.transCountMatrix, self.transProbMatrix = other.transCountMatrix, other.transProbMatrix
+            return
+        self._addCounts(*continueCounts(self.ngramHash, self.wordHash, other.ngramHash, other.wordHash, other.transCountMatrix))
+
+    def _addCounts(self, ngramHash, wordHash, batch):
+        # adds the counts of batch, numbered in an ngramHash and wordHash that continue the
+        # model's, and smooths the rows they changed again
+        if self.transCountMatrix is None:
+            counts = batch
+        else:
+            counts = sumCounts(growMatrix(self.transCountMatrix, batch.shape), batch)
+        self.ngramHash = ngramHash
+        self.wordHash = wordHash
+
+        # the rows with new counts, and the new rows that have none and need their p0 = 1
+        oldRows = 0 if self.transProbMatrix is None else self.transProbMatrix.shape[0]
+        rows = np.union1d(np.flatnonzero(np.diff(batch.indptr)), np.arange(oldRows, batch.shape[0]))
+
+        tic = time.time()
+        self.transProbMatrix = self._resmoothRows(counts, rows)
+        self.transCountMatrix = counts
+        toc = time.time()
+        print("Elapsed: %.2f s" % (toc-tic))
+
+    def _resmoothRows(self, counts, rows):
+        # _smoothCounts for the given rows of the grown count matrix. The other rows keep
+        # their probabilities, only their p0 moves to the new last column.
+        numRows, numCols = counts.shape
+        if self.transProbMatrix is None:
+            return self._smoothCounts(counts)
+
+        probs = self.transProbMatrix
+        indices = np.where(probs.indices == probs.shape[1]-1, numCols, probs.indices).astype(probs.indices.dtype)
+        probs = growMatrix(csr_matrix((probs.data, indices, probs.indptr), shape=(probs.shape[0], numCols+1)), (numRows, numCols+1))
+
+        smoothed = self._smoothCounts(counts[rows])
+
+        # take every row from either matrix, keeping the stored zeros of both
+        kept = np.setdiff1d(np.arange(numRows), rows)
+        lengths = np.diff(probs.indptr)
+        lengths[rows] = np.diff(smoothed.indptr)
+        indptr = np.concatenate(([0], np.cumsum(lengths))).astype(probs.indptr.dtype)
+        data = np.empty(indptr[-1], dtype=np.float64)
+        indices = np.empty(indptr[-1], dtype=probs.indices.dtype)
+        for source, sourceRows, positions in [(probs, kept, _rowPositions(probs.indptr, kept)), (smoothed, rows, slice(None))]:
+            targets = _rowPositions(indptr, sourceRows)
+            data[targets] = source.data[positions]
+            indices[targets] = source.indices[positions]
+        return csr_matrix((data, indices, indptr), shape=(numRows, numCols+1))
+
+    def _smoothCounts(self, counts):
+        # Smooth every row of the count matrix with simple good-turing.
+        # The probabilities are written to the same positions of a csr matrix with
+        # one extra column at the end holding p0 for unknown words/transitions.
+        numRows, numCols = counts.shape
+        indptr = counts.indptr
+        probs, p0s = sgts.simpleGoodTuringBatch(counts.data, indptr)
+
+        rowOffsets = np.arange(numRows+1)
+        probIndptr = indptr + rowOffsets # one extra entry (p0) per row
+        probIndices = np.empty(probIndptr[-1], dtype=counts.indices.dtype)
+        probData = np.empty(probIndptr[-1], dtype=np.float64)
+
+        # every nonzero moves one position further per preceding row
+        positions = np.arange(counts.nnz) + np.repeat(rowOffsets[:-1], np.diff(indptr))
+        probData[positions] = probs
+        probIndices[positions] = counts.indices
+
+        p0positions = probIndptr[1:] - 1
+        probData[p0positions] = p0s # add p0 to the last column!
+        probIndices[p0positions] = numCols
+
+        return csr_matrix((probData, probIndices, probIndptr), shape=(numRows, numCols+1))
+
+    def prune(self, minCount=1, threshold=0.0):
+        # drops the transitions seen less than minCount times and smooths the counts again.
+        # The rows are kept, so a row left without counts gets p0 for every word, while an
+        # ngram the model never saw backs off to the unigram probabilities, see _unigramProbs.
+        nnz = self.transCountMatrix.nnz
+        self.transCountMatrix = dropTransitions(self.transCountMatrix, pruneMask(self.transCountMatrix, minCount, threshold, entropies=False))
+        self.transProbMatrix = self._smoothCounts(self.transCountMatrix)
+        return nnz - self.transCountMatrix.nnz
+
+    def exportCounts(self):
+        counts = packCounts(self.ngramHash, self.wordHash, self.transCountMatrix)
+        probs = csr_matrix(self.transProbMatrix)
+        counts.update({
+            'probData': probs.data,
+            'probIndices': probs.indices,
+            'probIndptr': probs.indptr,
+            'probShape': probs.shape,
+        })
+        return counts
+
+    def importCounts(self, counts):
+        self.ngramHash, self.wordHash, self.transCountMatrix = unpackCounts(counts)
+        self.transProbMatrix = csr_matrix((counts['probData'], counts['probIndices'], counts['probIndptr']), shape=counts['probShape'])
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for key in ['_unigrams', '_unigramCounts']:
+            state.pop(key, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if 'tokenizer' not in state: # old pickles were always tokenized with nltk
+            self.tokenizer = getTokenizer('nltk')
+        if isinstance(self.ngramHash, dict): # old pickles have a tuple keyed dict
+            self.ngramHash = NgramIndex.fromDict(self.ngramHash, self.wordHash, max(self.k, 1))
+        # old pickles have the probabilities in a lil_matrix
+        if self.transProbMatrix is not None:
+            self.transProbMatrix = csr_matrix(self.transProbMatrix)
+
+    def saveArrays(self):
+        arrays = countArrays(self.ngramHash, self.wordHash, self.transCountMatrix)
+        arrays.update(matrixArrays(self.transProbMatrix, 'probs'))
+        return arrays
+
+    def loadArrays(self, arrays):
+        self.ngramHash, self.wordHash, self.transCountMatrix = countsFromArrays(arrays)
+        self.transProbMatrix = matrixFromArrays(arrays, 'probs')
+
+    def sizes(self):
+        return {
+            'ngrams': self.transCountMatrix.shape[0],
+            'words': self.transCountMatrix.shape[1],
+            'transitions': self.transCountMatrix.nnz,
+            'ngramIndexBytes': self.ngramHash.nbytes(),
+        }
 
     def debugMatrix(self):
         print("%15s | " % (""), end="")
@@ -0,0 +1,156 @@
+from .model import MarkovModel
+from .model_laplace import MarkovModelLaplace
+from .modelfile import countArrays, countsFromArrays
+from .counting import countDtype, maxCount
+from .tokenizer import getTokenizer
+from .ngramindex import NgramIndex, numberNgrams
+from .scoring import batchTransitionIds, iterTransitions, segmentSums, gather, rowSums
+
+import sys
+import numpy as np
+from scipy.sparse import csr_matrix
+
+POS = 0
+NEG = 1
+
+## A positive and a negative laplace model sharing one vocabulary and one ngram index.
+##
+## Every (ngram, word) cell that either class has seen is stored once in
+## countMatrix, with the positive count in the high and the negative count in the
+## low half of its value, so one lookup per transition gives both counts.
+##
+## The probabilities are exactly those of the two separate laplace models: a class
+## that hasn't seen a word counts 0 for it, and a class that hasn't seen an ngram
+## has a row sum of 0 for it, which is what laplace smoothing does for misses.
+
+def packCellCounts(counts, dtype):
+    # packs (cells, 2) counts of dtype into one unsigned int of twice the width
+    bits = 8*np.dtype(dtype).itemsize
+    packed = counts.astype('u%d' % (2*bits//8))
+    return (packed[:, POS] << bits) | packed[:, NEG]
+
+def unpackCellCounts(packed):
+    bits = 4*packed.dtype.itemsize
+    packed = packed.astype(np.uint64)
+    counts = np.empty((len(packed), 2), dtype=np.int64)
+    counts[:, POS] = packed >> np.uint64(bits)
+    counts[:, NEG] = packed & np.uint64((1 << bits) - 1)
+    return counts
+
+
+class MarkovModelJoint(MarkovModel):
+
+    def __init__(self, order, tokenizer='nltk'):
+        self.k = order
+        self.tokenizer = getTokenizer(tokenizer)
+        self.countMatrix = None
+        self.rowSums = None     # (rows, 2)
+        self.numCols = None     # (2,): the number of words each class has seen
+        self.wordKnown = None   # (cols, 2): whether a class has seen the word
+
+        self.wordHash = {} # maps a word to its col index in countMatrix
+        self.ngramHash = NgramIndex(self.wordHash, max(order, 1)) # maps an ngram to its row index in countMatrix
+
+    def _tokenize(self, text):
+        return MarkovModelLaplace._tokenize(self, text)
+
+    def _pad(self, tokens):
+        return MarkovModelLaplace._pad(self, tokens)
+
+    @staticmethod
+    def fromModels(posModel, negModel):
+        joint = MarkovModelJoint(posModel.k, posModel.tokenizer.name)
+        models = [posModel, negModel]
+
+        # intern the union of both vocabularies, and join both ngram indexes
+        colMaps = [joint._joinHash(joint.wordHash, model.wordHash, sys.intern) for model in models]
+        width = max(joint.k, 1)
+        ids = np.concatenate([colMap[model.ngramHash.idArray()] for model, colMap in zip(models, colMaps)])
+        joint.ngramHash, rows = numberNgrams(joint.wordHash, width, ids)
+        rowMaps = np.split(rows, [len(posModel.ngramHash)])
+        numRows = len(joint.ngramHash)
+        numCols = len(joint.wordHash)
+
+        # the cells of both classes in the joint index, as row*numCols+col keys
+        keys = []
+        for model, rowMap, colMap in zip(models, rowMaps, colMaps):
+            matrix = model.transCountMatrix
+            rows = np.repeat(np.arange(matrix.shape[0]), np.diff(matrix.indptr))
+            keys.append(rowMap[rows] * numCols + colMap[matrix.indices])
+        cells = np.unique(np.concatenate(keys))
+
+        # both counts of a cell in the dtype of the larger one, packed into twice its width
+        dtype = countDtype(max(maxCount(model.transCountMatrix) for model in models))
+        if dtype.itemsize > 4:
+            raise Exception('the counts are too large to pack both into one value')
+        counts = np.zeros((len(cells), 2), dtype=dtype)
+        joint.rowSums = np.zeros((numRows, 2), dtype=np.int64)
+        joint.wordKnown = np.zeros((numCols, 2), dtype=bool)
+        for c, (model, rowMap, colMap) in enumerate(zip(models, rowMaps, colMaps)):
+            counts[np.searchsorted(cells, keys[c]), c] = model.transCountMatrix.data
+            joint.rowSums[rowMap, c] = rowSums(model.transCountMatrix)
+            joint.wordKnown[colMap, c] = True
+        joint.numCols = np.array([model.transCountMatrix.shape[1] for model in models], dtype=np.int64)
+
+        cellRows = cells // numCols
+        indptr = np.concatenate(([0], np.cumsum(np.bincount(cellRows, minlength=numRows))))
+        joint.countMatrix = csr_matrix((packCellCounts(counts, dtype), (cells % numCols).astype(np.int32), indptr), shape=(numRows, numCols))
+        return joint
+
+    def _joinHash(self, jointHash, hash, intern):
+        # adds the keys of hash to jointHash, returns the joint index of every index of hash
+        indexMap = np.zeros(len(hash), dtype=np.int64)
+        for key, index in hash.items():
+            indexMap[index] = jointHash.setdefault(intern(key), len(jointHash))
+        return indexMap
+
+    def getLogProbs(self, tokenLists, posTracer=None, negTracer=None):
+        # the log likelihoods of many tokenized reviews under both classes, as a (reviews, 2) array
+        rows, cols, segments = batchTransitionIds(tokenLists, self.k, self.ngramHash, self.wordHash)
+
+        known = (rows >= 0) & (cols >= 0)
+        counts = np.zeros((len(rows), 2), dtype=np.int64)
+        counts[known] = unpackCellCounts(gather(self.countMatrix, rows[known], cols[known])) # one lookup for both counts
+
+        rowSumSmooth = np.zeros((len(rows), 2), dtype=np.int64)
+        rowSumSmooth[rows >= 0] = self.rowSums[rows[rows >= 0]]
+        rowSumSmooth += self.numCols + 1 # add 1 for each word and 1 for the *unknown* word
+
+        logProbs = np.log(counts + 1) - np.log(rowSumSmooth)
+
+        for c, tracer in [(POS, posTracer), (NEG, negTracer)]:
+            if tracer is None:
+                continue
+            rowmiss = rowSumSmooth[:, c] == self.numCols[c] + 1
+            colmiss = np.ones(len(cols), dtype=bool)
+            colmiss[cols >= 0] = ~self.wordKnown[cols[cols >= 0], c]
+            transmiss = ~(rowmiss | colmiss) & (counts[:, c] == 0)
+            tracer.addMisses(rowmiss, colmiss, transmiss)
+            if tracer.wantsTransitions:
+                for i, (prevstates, word) in enumerate(iterTransitions(tokenLists, self.k)):
+                    tracer.addTransition(prevstates, word, np.exp(logProbs[i, c]), counts[i, c] + 1, rowmiss[i], colmiss[i], transmiss[i])
+
+        return np.stack([segmentSums(logProbs[:, c], segments, len(tokenLists)) for c in [POS, NEG]], axis=1)
+
+    def saveArrays(self):
+        arrays = countArrays(self.ngramHash, self.wordHash, self.countMatrix)
+        arrays.update({
+            'rowSums': self.rowSums,
+            'numCols': self.numCols,
+            'wordKnown': self.wordKnown,
+        })
+        return arrays
+
+    def loadArrays(self, arrays):
+        self.ngramHash, self.wordHash, self.countMatrix = countsFromArrays(arrays)
+        self.rowSums = arrays['rowSums']
+        self.numCols = arrays['numCols']
+        self.wordKnown = arrays['wordKnown']
+
+    def sizes(self):
+        return {
+            'ngrams': self.countMatrix.shape[0],
+            'words': self.countMatrix.shape[1],
+            'transitions': self.countMatrix.nnz,
+            'ngramIndexBytes': self.ngramHash.nbytes(),
+        }
@@ -1,25 +1,33 @@
 from .model import MarkovModel
-
-from corpus import CorpusReader
+from .counting import TransitionCounter, packCounts, unpackCounts, growMatrix, continueCounts, sumCounts, marginalizeCounts
+from .modelfile import countArrays, countsFromArrays
+from .ngramindex import NgramIndex
+from .pruning import pruneMask, dropTransitions, dropEmptyRows
+from .tokenizer import getTokenizer
+from .scoring import batchTransitionIds, iterTransitions, segmentSums, gather, rowSums
+
+from corpus import corpusTokenLists
 import numpy as np
-from scipy.sparse import csr_matrix, lil_matrix
-import nltk
 
 PAD_TOKEN = "_"
 
 class MarkovModelLaplace(MarkovModel):
 
-    def __init__(self, order):
+    def __init__(self, order, tokenizer='nltk'):
         self.k = order
+        self.tokenizer = getTokenizer(tokenizer)
         self.set_of_words = set()
         self.transCountMatrix = None
-        self.rowSums = {}
+        self.rowSums = None # the sum of every row in transCountMatrix
+        self.rowSumsSmooth = None # the smoothed denominator of every row
 
-        self.ngramHash = {} # maps an ngram to its row index in transCountMatrix
         self.wordHash = {} # maps a word to its col index in transCountMatrix
+        self.ngramHash = NgramIndex(self.wordHash, max(order, 1)) # maps an ngram to its row index in transCountMatrix
 
     def _tokenize(self, text):
-        tokens = nltk.word_tokenize(text)
+        return self._pad(self.tokenizer.tokenize(text))
+
+    def _pad(self, tokens):
         if self.k == 0:
             tokens = tokens + [PAD_TOKEN] # add only the stop token
         else:
@@ -27,46 +35,68 @@ class MarkovModelLaplace(MarkovModel):
 
         return tokens
 
-    def getProb(self, review, debuginfo={}):
-        debuginfo.update({
-            'totalRowMisses': 0,    # number of prevstates we didn't know
-            'totalColMisses': 0,    # number of words we haven't seen before
-            'totalTransMisses': 0,  # number of transistions we haven't seen before
-            'transProbs': [],       # the probability of each transition
-        })
-
-        tokens = self._tokenize(review)
-        ngrams = list(nltk.ngrams(tokens, self.k)) # this not effective, but works
-
-        words = tokens[self.k:] # skip the first padding
-
-        totalProb = 1.0
-        for i, word in enumerate(words):
-            prevstates = ngrams[i]
-            transDebug = {}
-            transProb = self.getTransitionProb(prevstates, word, transDebug)
-
-            #multiply the totalProb
-            totalProb *= transProb
-
-            debuginfo['totalRowMisses'] += transDebug['rowmiss']
-            debuginfo['totalColMisses'] += transDebug['colmiss']
-            debuginfo['totalTransMisses'] += transDebug['transmiss']
-            debuginfo['transProbs'].append(transDebug)
-
-        return totalProb
-
-    def getTransitionProb(self, prevstates, word, debuginfo):
-        debuginfo.update({
-            'from'      : prevstates,
-            'to'        : word,
-            'prob'      : 0,
-            'count'     : 0,
-            'rowsum'    : 0,
-            'rowmiss'   : 0,     #we didn't know these prevstates
-            'colmiss'   : 0,     #we haven't seen this word before
-            'transmiss' : 0,     #we knew the prevstate and the word, but we haven't a transition between them
-        })
+    def getLogProb(self, review, tracer=None):
+        # the log likelihood of the review, computed for all transitions at once
+        return self.getLogProbs([self._tokenize(review)], tracer)[0]
+
+    def getLogProbs(self, tokenLists, tracer=None):
+        # the log likelihoods of many tokenized reviews, with one gather for all their transitions
+        rows, cols, segments = batchTransitionIds(tokenLists, self.k, self.ngramHash, self.wordHash)
+        logProbs, rowmiss, colmiss, transmiss = self.getLogTransitionProbs(rows, cols)
+
+        if tracer is not None:
+            tracer.addMisses(rowmiss, colmiss, transmiss)
+            if tracer.wantsTransitions:
+                counts = self._getCounts(rows, cols) + 1
+                for i, (prevstates, word) in enumerate(iterTransitions(tokenLists, self.k)):
+                    tracer.addTransition(prevstates, word, np.exp(logProbs[i]), counts[i], rowmiss[i], colmiss[i], transmiss[i])
+
+        return segmentSums(logProbs, segments, len(tokenLists))
+
+    def getLogTransitionProbs(self, rows, cols):
+        # log P for the transitions rows[i] -> cols[i], where unknown ngrams and words have id -1.
+        # Also returns the row, col and transition miss masks.
+        numCols = self.transCountMatrix.shape[1]
+
+        rowmiss = rows < 0
+        colmiss = cols < 0
+        counts = self._getCounts(rows, cols)
+        transmiss = ~(rowmiss | colmiss) & (counts == 0)
+
+        rowSumSmooth = np.full(len(rows), numCols + 1, dtype=np.int64) # add 1 for each word and 1 for the *unknown* word
+        rowSumSmooth[~rowmiss] = self.rowSumsSmooth[rows[~rowmiss]]
+
+        logProbs = np.log(counts + 1) - np.log(rowSumSmooth)
+        return logProbs, rowmiss, colmiss, transmiss
+
+    def _getCounts(self, rows, cols):
+        # the counts of the transitions, 0 for unknown ngrams and words
+        known = (rows >= 0) & (cols >= 0)
+        counts = np.zeros(len(rows), dtype=np.int64)
+        counts[known] = gather(self.transCountMatrix, rows[known], cols[known])
+        return counts
+
+    def updateRowSums(self):
+        # sum all rows in one pass over the count matrix, needs to be done
+        # whenever transCountMatrix changes
+        numCols = self.transCountMatrix.shape[1]
+        self.rowSums = rowSums(self.transCountMatrix)
+        self.rowSumsSmooth = self.rowSums + (numCols + 1) # add 1 for each word and 1 for the *unknown* word
+
+    def getTransitionProb(self, prevstates, word, tracer=None):
+        Ptrans, countSmooth, rowmiss, colmiss, transmiss = self.lookupTransition(prevstates, word)
+
+        if tracer is not None:
+            tracer.addMisses(rowmiss, colmiss, transmiss)
+            tracer.addTransition(prevstates, word, Ptrans, countSmooth, rowmiss, colmiss, transmiss)
+
+        return Ptrans
+
+    def lookupTransition(self, prevstates, word):
+        # returns P, the smoothed count and the row, col and transition miss flags
+        rowmiss = 0     #we didn't know these prevstates
+        colmiss = 0     #we haven't seen this word before
+        transmiss = 0   #we knew the prevstate and the word, but we haven't a transition between them
 
         numCols = self.transCountMatrix.shape[1]
         #print("numcols: %d" % numCols)
@@ -77,108 +107,163 @@ class MarkovModelLaplace(MarkovModel):
             row = self.ngramHash.get(prevstates, None)
         col = self.wordHash.get(word, None)
 
-        rowSumSmooth = numCols + 1 # add 1 for each word and 1 for the *unknown* word
         if row is None:
-            debuginfo['rowmiss'] = 1
+            rowmiss = 1
+            rowSumSmooth = numCols + 1 # add 1 for each word and 1 for the *unknown* word
             if col is None:
-                debuginfo['colmiss'] = 1
+                colmiss = 1
                 countSmooth = 1
             else:
                 countSmooth = 1
 
         else:
-            ######### rowSum = self.transCountMatrix.todense().sum(axis=1)[row]
-            # sum() does not work correctly, need to do this by our selves (the result is cached)
-            rowSums = getattr(self, 'rowSums', None)
-            if not rowSums:
-                self.rowSums = {}
-            rowSum = self.rowSums.get(row, None)
-            if not rowSum:
-                rowSum = self.transCountMatrix[row, :].todense().sum()
-                self.rowSums[row] = rowSum
-
-            rowSumSmooth += rowSum # add it to the default smooth value
-
-            #print("rowsum: %d" % rowSum)
-            #print("smooth sum: %d" % rowSumSmooth)
+            rowSumSmooth = self.rowSumsSmooth[row] # precomputed by updateRowSums
 
             if col is None:
-                debuginfo['colmiss'] = 1
+                colmiss = 1
                 countSmooth = 1
             else:
                 # everything ok
-                countSmooth = self.transCountMatrix[row, col] + 1
-                if self.transCountMatrix[row, col] == 0:
-                    debuginfo['transmiss'] = 1
+                count = int(self.transCountMatrix[row, col]) # a python int, + 1 would wrap around in the count dtype
+                countSmooth = count + 1
+                if count == 0:
+                    transmiss = 1
 
         Ptrans = countSmooth / rowSumSmooth
 
-        debuginfo['count'] = countSmooth
-        debuginfo['rowsum'] = rowSumSmooth
-        debuginfo['prob'] = Ptrans
-
-        return Ptrans
-
-    def trainOnCorpus(self, reviewfile):
-        reader = CorpusReader(reviewfile)
+        return Ptrans, countSmooth, rowmiss, colmiss, transmiss
 
+    def trainOnCorpus(self, reviewfile, cacheDir=None):
+        # tokenize every review once (or load the tokens from the cache in cacheDir),
         # count ngrams (prev states) and words (words/current state)
-        # and create hashtables
-        ngramCounter = 0
-        wordCounter = 0
-
-        for review in reader.reviews():
-            #print(review)
-            tokens = self._tokenize(review)
-
-            if (self.k == 0):
-                # in this case, make sure we get 1 row in the transitionMatrix
-                self.ngramHash[(PAD_TOKEN,)] = 0
-                ngramCounter = 1
-            else:
-                ngrams = nltk.ngrams(tokens, self.k)
-
-                for ngram in ngrams:
-                    if ngram not in self.ngramHash:
-                        self.ngramHash[ngram] = ngramCounter
-                        ngramCounter += 1
-
-            for token in tokens:
-                if token not in self.wordHash:
-                    self.wordHash[token] = wordCounter
-                    wordCounter += 1
-
-        # create the transitionMatrix
-        # use the lil_matrix format now for inserts and convert to more compact csr_matrix later
-        self.transCountMatrix = lil_matrix((ngramCounter, wordCounter), dtype=np.uint16)
+        # and collect the transitions as (row, col) pairs
+        counter = TransitionCounter(self.k)
 
         revno = 1
-        for review in reader.reviews():
+        for tokens in corpusTokenLists(reviewfile, self.tokenizer, cacheDir):
             print("%4d" %(revno))
+            counter.addTokens(self._pad(tokens))
+            revno += 1
 
-            tokens = self._tokenize(review)
-            words = tokens[self.k:] # skip the first padding
+        self.loadCounter(counter)
 
-            if self.k == 0:
-                for word in words:
-                    row = 0 # use the only row we got
-                    col = self.wordHash[word]
-                    self.transCountMatrix[row, col] += 1
+        #print("rows: %d, cols: %d" % (self.transCountMatrix.shape[0], self.transCountMatrix.shape[1]))
 
-            else:
-                ngrams = list(nltk.ngrams(tokens, self.k)) # this not effective, but works
+    def loadCounter(self, counter):
+        self.ngramHash = counter.ngramHash
+        self.wordHash = counter.wordHash
 
-                for i, word in enumerate(words):
-                    prevstates = ngrams[i]
-                    row = self.ngramHash[prevstates]
-                    col = self.wordHash[word]
-                    self.transCountMatrix[row, col] += 1
-            revno += 1
+        # build the compact csr_matrix in one go
+        self.transCountMatrix = counter.countMatrix()
+        self.updateRowSums()
 
-        # convert it to compact csr_matrix format!
-        self.transCountMatrix = csr_matrix(self.transCountMatrix)
+    def updateOnTokens(self, tokenLists):
+        # adds the transitions of more tokenized reviews to the trained model. Only the
+        # new reviews are counted, known words and ngrams keep their ids.
+        counter = self.continuedCounter()
 
-        #print("rows: %d, cols: %d" % (self.transCountMatrix.shape[0], self.transCountMatrix.shape[1]))
+        revno = 1
+        for tokens in tokenLists:
+            print("%4d" %(revno))
+            counter.addTokens(self._pad(tokens))
+            revno += 1
+
+        self.addCounter(counter)
+
+    def continuedCounter(self):
+        # a TransitionCounter numbering new words and ngrams after the ones of the model
+        if self.transCountMatrix is None:
+            return TransitionCounter(self.k)
+        return TransitionCounter(self.k, dict(self.wordHash.items()), self.ngramHash)
+
+    def addCounter(self, counter):
+        # adds the counts of a continuedCounter() to the model
+        if self.transCountMatrix is None:
+            return self.loadCounter(counter)
+        self.addCounts(counter.ngramHash, counter.wordHash, counter.countMatrix())
+
+    def mergeModel(self, other):
+        # adds the counts of another model of the same order, trained on other reviews.
+        # The result is the model trained on the reviews of this model, then the other's.
+        if self.transCountMatrix is None:
+            self.ngramHash, self.wordHash, self.transCountMatrix = other.ngramHash, other.wordHash, other.transCountMatrix
+            self.updateRowSums()
+            return
+        self.addCounts(*continueCounts(self.ngramHash, self.wordHash, other.ngramHash, other.wordHash, other.transCountMatrix))
+
+    def marginalized(self, numReviews):
+        # the model of order k-1 of the same numReviews reviews, from the counts of this
+        # one without counting again, see counting.marginalizeCounts. It shares the wordHash.
+        model = MarkovModelLaplace(self.k-1, self.tokenizer.name)
+        model.wordHash = self.wordHash
+        model.ngramHash, model.transCountMatrix = marginalizeCounts(self.ngramHash, self.wordHash, self.transCountMatrix, self.k, numReviews)
+        model.updateRowSums()
+        return model
+
+    def addCounts(self, ngramHash, wordHash, batch):
+        # adds the counts of batch, numbered in an ngramHash and wordHash that continue the model's
+        self.ngramHash = ngramHash
+        self.wordHash = wordHash
+        self.transCountMatrix = sumCounts(growMatrix(self.transCountMatrix, batch.shape), batch)
+
+        # only the rows of the batch change their sum, but the number of words smooths all of them
+        newRows = np.zeros(batch.shape[0] - len(self.rowSums), dtype=np.int64)
+        self.rowSums = np.concatenate((self.rowSums, newRows)) + rowSums(batch)
+        self.rowSumsSmooth = self.rowSums + (batch.shape[1] + 1) # add 1 for each word and 1 for the *unknown* word
+
+    def prune(self, minCount=1, threshold=0.0):
+        # drops the transitions seen less than minCount times and those with a relative
+        # entropy below threshold, see pruning.py. Returns the number of dropped transitions.
+        nnz = self.transCountMatrix.nnz
+        self.transCountMatrix = dropTransitions(self.transCountMatrix, pruneMask(self.transCountMatrix, minCount, threshold))
+        if self.k > 0: # the only row of order 0 is always looked up
+            self.ngramHash, self.transCountMatrix = dropEmptyRows(self.ngramHash, self.transCountMatrix)
+        self.updateRowSums()
+        return nnz - self.transCountMatrix.nnz
+
+    def exportCounts(self):
+        return packCounts(self.ngramHash, self.wordHash, self.transCountMatrix)
+
+    def importCounts(self, counts):
+        self.ngramHash, self.wordHash, self.transCountMatrix = unpackCounts(counts)
+        self.updateRowSums()
+
+    def saveArrays(self):
+        arrays = countArrays(self.ngramHash, self.wordHash, self.transCountMatrix)
+        arrays['rowSums'] = self.rowSums
+        arrays['rowSumsSmooth'] = self.rowSumsSmooth
+        return arrays
+
+    def loadArrays(self, arrays):
+        self.ngramHash, self.wordHash, self.transCountMatrix = countsFromArrays(arrays)
+        self.rowSums = arrays['rowSums']
+        self.rowSumsSmooth = arrays['rowSumsSmooth']
+
+    def sizes(self):
+        return {
+            'ngrams': self.transCountMatrix.shape[0],
+            'words': self.transCountMatrix.shape[1],
+            'transitions': self.transCountMatrix.nnz,
+            'ngramIndexBytes': self.ngramHash.nbytes(),
+        }
+
+    # the row sums are not pickled, they are recomputed when the model is loaded
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for key in ['rowSums', 'rowSumsSmooth']:
+            state.pop(key, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if 'tokenizer' not in state: # old pickles were always tokenized with nltk
+            self.tokenizer = getTokenizer('nltk')
+        if isinstance(self.ngramHash, dict): # old pickles have a tuple keyed dict
+            self.ngramHash = NgramIndex.fromDict(self.ngramHash, self.wordHash, max(self.k, 1))
+        self.rowSums = None
+        self.rowSumsSmooth = None
+        if self.transCountMatrix is not None:
+            self.updateRowSums()
 
     def debugMatrix(self):
         print("%15s | " % (""), end="")
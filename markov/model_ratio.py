@@ -0,0 +1,86 @@
+from .model import MarkovModel
+from .model_laplace import MarkovModelLaplace
+from .model_joint import POS, NEG, unpackCellCounts
+from .modelfile import countArrays, countsFromArrays
+from .tokenizer import getTokenizer
+from .ngramindex import NgramIndex
+from .scoring import batchTransitionIds, segmentSums, gather
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+## The log likelihood ratio log P(pos) - log P(neg) of every transition of a joint laplace model.
+##
+## With laplace smoothing the ratio of a transition is
+##   log(posCount+1) - log(negCount+1) + log(negRowSumSmooth) - log(posRowSumSmooth)
+## The first half only depends on the cell and is stored in ratioMatrix, the second half
+## only depends on the row and is stored in rowRatios. An unknown word or an unseen
+## transition has the cell part 0, so they just get the ratio of their row, and an
+## unknown ngram gets missRatio. Classifying a review then takes one lookup and one
+## add per transition.
+
+class MarkovModelRatio(MarkovModel):
+
+    def __init__(self, order, tokenizer='nltk'):
+        self.k = order
+        self.tokenizer = getTokenizer(tokenizer)
+        self.ratioMatrix = None
+        self.rowRatios = None # the ratio of an unknown word or unseen transition after every ngram
+        self.missRatio = 0.0  # the ratio of any transition after an unknown ngram
+
+        self.wordHash = {} # maps a word to its col index in ratioMatrix
+        self.ngramHash = NgramIndex(self.wordHash, max(order, 1)) # maps an ngram to its row index in ratioMatrix
+
+    def _tokenize(self, text):
+        return MarkovModelLaplace._tokenize(self, text)
+
+    def _pad(self, tokens):
+        return MarkovModelLaplace._pad(self, tokens)
+
+    @staticmethod
+    def fromJoint(joint):
+        model = MarkovModelRatio(joint.k, joint.tokenizer.name)
+        model.ngramHash = joint.ngramHash
+        model.wordHash = joint.wordHash
+
+        counts = unpackCellCounts(joint.countMatrix.data)
+        cellRatios = np.log(counts[:, POS] + 1) - np.log(counts[:, NEG] + 1)
+        model.ratioMatrix = csr_matrix((cellRatios, joint.countMatrix.indices, joint.countMatrix.indptr), shape=joint.countMatrix.shape)
+
+        numColsSmooth = joint.numCols + 1 # add 1 for each word and 1 for the *unknown* word
+        rowSumsSmooth = joint.rowSums + numColsSmooth
+        model.rowRatios = np.log(rowSumsSmooth[:, NEG]) - np.log(rowSumsSmooth[:, POS])
+        model.missRatio = float(np.log(numColsSmooth[NEG]) - np.log(numColsSmooth[POS]))
+        return model
+
+    def getLogRatios(self, tokenLists):
+        # log P(pos) - log P(neg) of many tokenized reviews
+        rows, cols, segments = batchTransitionIds(tokenLists, self.k, self.ngramHash, self.wordHash)
+
+        ratios = np.full(len(rows), self.missRatio)
+        knownRows = rows >= 0
+        ratios[knownRows] = self.rowRatios[rows[knownRows]]
+
+        known = knownRows & (cols >= 0)
+        ratios[known] += gather(self.ratioMatrix, rows[known], cols[known])
+
+        return segmentSums(ratios, segments, len(tokenLists))
+
+    def saveArrays(self):
+        arrays = countArrays(self.ngramHash, self.wordHash, self.ratioMatrix)
+        arrays['rowRatios'] = self.rowRatios
+        arrays['missRatio'] = np.array([self.missRatio])
+        return arrays
+
+    def loadArrays(self, arrays):
+        self.ngramHash, self.wordHash, self.ratioMatrix = countsFromArrays(arrays)
+        self.rowRatios = arrays['rowRatios']
+        self.missRatio = float(arrays['missRatio'][0])
+
+    def sizes(self):
+        return {
+            'ngrams': self.ratioMatrix.shape[0],
+            'words': self.ratioMatrix.shape[1],
+            'transitions': self.ratioMatrix.nnz,
+            'ngramIndexBytes': self.ngramHash.nbytes(),
+        }
@@ -0,0 +1,176 @@
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from storage import writeArrayFile, readArrayFile
+from .counting import WORD_SEPARATOR
+from .ngramindex import NgramIndex
+
+## The binary model file format.
+##
+## Every model is stored as plain arrays: the csr arrays of its matrices, its row
+## sums and its vocabulary as one sorted, newline separated utf-8 blob. The ngrams
+## are stored as the sorted keys and rows of their NgramIndex, so loading adopts them
+## as they are, or as rows of word ids if their keys don't fit into an int64 (and in
+## files of version 1). The header records k, smoothing, the tokenizer and the sizes.
+## Loading memory maps the arrays, the word hash table is only built on first use.
+
+FORMAT = 'markov-classifier'
+FORMAT_VERSION = 2
+READ_VERSIONS = [1, 2]
+
+
+class LazyDict():
+    # A read-only mapping that builds its dict on first use.
+    # After that, get() is the bound get() of the dict, so lookups cost the same as a dict's.
+
+    def __init__(self, build, size):
+        self._build = build
+        self._size = size
+        self._dict = None
+
+    def _load(self):
+        if self._dict is None:
+            self._dict = self._build()
+            self.get = self._dict.get
+        return self._dict
+
+    def get(self, key, default=None):
+        return self._load().get(key, default)
+
+    def __getitem__(self, key):
+        return self._load()[key]
+
+    def __contains__(self, key):
+        return key in self._load()
+
+    def __iter__(self):
+        return iter(self._load())
+
+    def __len__(self):
+        return self._size
+
+    def __eq__(self, other):
+        return self._load() == other
+
+    def keys(self):
+        return self._load().keys()
+
+    def values(self):
+        return self._load().values()
+
+    def items(self):
+        return self._load().items()
+
+    def __reduce__(self):
+        # pickles as a plain dict
+        return (dict, (self._load(),))
+
+
+def vocabularyArrays(wordHash):
+    words = sorted(wordHash.keys())
+    blob = np.frombuffer(WORD_SEPARATOR.join(words).encode('utf-8'), dtype=np.uint8)
+    cols = np.array([wordHash[word] for word in words], dtype=np.int32)
+    return blob, cols
+
+def _wordsByCol(blob, cols):
+    words = bytes(blob).decode('utf-8').split(WORD_SEPARATOR) if len(cols) else []
+    wordsByCol = [None]*len(cols)
+    for word, col in zip(words, cols.tolist()):
+        wordsByCol[col] = word
+    return wordsByCol
+
+def countArrays(ngramHash, wordHash, matrix):
+    blob, cols = vocabularyArrays(wordHash)
+    arrays = {
+        'vocabulary': blob,
+        'vocabularyCols': cols,
+    }
+    if ngramHash.isWide(): # python int keys, no array to store them in
+        arrays['ngrams'] = ngramHash.idArray()
+    else:
+        arrays['ngramKeys'] = ngramHash.ngramKeys
+        arrays['ngramRows'] = ngramHash.ngramRows
+        arrays['ngramWidth'] = np.array([ngramHash.width], dtype=np.int64)
+    arrays.update(matrixArrays(matrix, 'counts'))
+    return arrays
+
+def countsFromArrays(arrays):
+    blob = arrays['vocabulary']
+    cols = arrays['vocabularyCols']
+
+    def buildWordHash():
+        return {word: col for col, word in enumerate(_wordsByCol(blob, cols))}
+
+    wordHash = LazyDict(buildWordHash, len(cols))
+    # neither needs the words themselves
+    if 'ngramKeys' in arrays:
+        ngramHash = NgramIndex.fromSorted(wordHash, int(arrays['ngramWidth'][0]), arrays['ngramKeys'], arrays['ngramRows'])
+    else:
+        ngrams = arrays['ngrams']
+        ngramHash = NgramIndex(wordHash, ngrams.shape[1], ngrams)
+    return ngramHash, wordHash, matrixFromArrays(arrays, 'counts')
+
+def matrixArrays(matrix, name):
+    return {
+        name + '.data': matrix.data,
+        name + '.indices': matrix.indices,
+        name + '.indptr': matrix.indptr,
+        name + '.shape': np.array(matrix.shape, dtype=np.int64),
+    }
+
+def matrixFromArrays(arrays, name):
+    shape = tuple(int(n) for n in arrays[name + '.shape'])
+    return csr_matrix((arrays[name + '.data'], arrays[name + '.indices'], arrays[name + '.indptr']), shape=shape, copy=False)
+
+
+def _namedModels(classifier):
+    if getattr(classifier, 'ratio_model', None) is not None:
+        return [('ratio', classifier.ratio_model)]
+    if getattr(classifier, 'joint_model', None) is not None:
+        return [('joint', classifier.joint_model)]
+    return [('pos', classifier.pos_model), ('neg', classifier.neg_model)]
+
+def saveClassifier(classifier, filepath):
+    arrays = {}
+    sizes = {}
+    for name, model in _namedModels(classifier):
+        modelArrays = model.saveArrays()
+        for key, array in modelArrays.items():
+            arrays[name + '.' + key] = array
+        sizes[name] = model.sizes()
+
+    meta = {
+        'format': FORMAT,
+        'version': FORMAT_VERSION,
+        'k': classifier.k,
+        'smoothing': classifier.smoothing,
+        'tokenizer': getattr(classifier, 'tokenizer', 'nltk'),
+        'joint': getattr(classifier, 'joint_model', None) is not None,
+        'compiled': getattr(classifier, 'ratio_model', None) is not None,
+        'sizes': sizes,
+    }
+    return writeArrayFile(filepath, meta, arrays)
+
+def loadClassifier(classifierClass, filepath, mmap=True):
+    meta, arrays = readArrayFile(filepath, mmap)
+    if meta.get('format') != FORMAT:
+        raise Exception('not a markov classifier file: %s' % filepath)
+    if meta['version'] not in READ_VERSIONS:
+        raise Exception('unsupported model file version %d' % meta['version'])
+
+    tokenizer = meta.get('tokenizer', 'nltk')
+    classifier = classifierClass(order=meta['k'], smoothing=meta['smoothing'], tokenizer=tokenizer)
+    if meta.get('joint'):
+        from .model_joint import MarkovModelJoint # model_joint imports this module
+        classifier.joint_model = MarkovModelJoint(meta['k'], tokenizer)
+        classifier.pos_model = None
+        classifier.neg_model = None
+    elif meta.get('compiled'):
+        from .model_ratio import MarkovModelRatio
+        classifier.ratio_model = MarkovModelRatio(meta['k'], tokenizer)
+        classifier.pos_model = None
+        classifier.neg_model = None
+    for name, model in _namedModels(classifier):
+        prefix = name + '.'
+        model.loadArrays({key[len(prefix):]: array for key, array in arrays.items() if key.startswith(prefix)})
+    return classifier
@@ -0,0 +1,98 @@
+import numpy as np
+
+from .scoring import rowSums, segmentSums
+
+## Read-only statistics of the count matrix of a trained laplace or sgts model.
+##
+## Everything works on the csr arrays of the count matrix, nothing is densified and
+## the model is never changed. The words and ngrams of rows and cols are looked up
+## in reverse vocabulary arrays, built once per ModelStatistics.
+
+class ModelStatistics():
+
+    def __init__(self, model):
+        self.model = model
+        self.counts = model.transCountMatrix
+        self._words = None  # the word of every col
+        self._ngrams = None # the word ids of the ngram of every row
+
+    def words(self):
+        if self._words is None:
+            self._words = np.empty(len(self.model.wordHash), dtype=object)
+            for word, col in self.model.wordHash.items():
+                self._words[col] = word
+        return self._words
+
+    def word(self, col):
+        return self.words()[col]
+
+    def ngram(self, row):
+        if self.model.k == 0:
+            return () # the only row follows any ngram
+        if self._ngrams is None:
+            self._ngrams = self.model.ngramHash.idArray()
+        return tuple(self.words()[self._ngrams[row]])
+
+    def _rows(self):
+        # the row of every entry of counts.data
+        return np.repeat(np.arange(self.counts.shape[0]), np.diff(self.counts.indptr))
+
+    def topTransitions(self, num):
+        # the num most frequent transitions, most frequent first
+        data = self.counts.data
+        num = min(num, len(data))
+        if num == 0:
+            return []
+        top = np.argpartition(data, len(data)-num)[len(data)-num:]
+        top = top[np.argsort(data[top], kind='stable')[::-1]]
+        rows = np.searchsorted(self.counts.indptr, top, side='right') - 1
+
+        transitions = []
+        for position, row in zip(top.tolist(), rows.tolist()):
+            col = int(self.counts.indices[position])
+            transitions.append({
+                'r': row,
+                'c': col,
+                'count': int(data[position]),
+                'ngram': self.ngram(row),
+                'word': self.word(col),
+            })
+        return transitions
+
+    def countsOfCounts(self):
+        # the distinct counts and how many transitions have each
+        return np.unique(self.counts.data, return_counts=True)
+
+    def numTransitionsWithCount(self, count):
+        return int(np.count_nonzero(self.counts.data == count))
+
+    def singletons(self):
+        return self.numTransitionsWithCount(1)
+
+    def doubletons(self):
+        return self.numTransitionsWithCount(2)
+
+    def total(self):
+        # the number of transitions seen in training
+        return int(self.counts.data.sum(dtype=np.int64))
+
+    def unique(self):
+        # the number of distinct transitions
+        return self.counts.nnz
+
+    def rowEntropies(self):
+        # the entropy in bits of the maximum likelihood distribution of every row,
+        # H = log S - sum(n log n) / S. Rows without transitions have 0.
+        sums = rowSums(self.counts)
+        n = self.counts.data.astype(np.float64)
+        nLogN = segmentSums(n * np.log2(n), self._rows(), self.counts.shape[0])
+        entropies = np.zeros(len(sums))
+        seen = sums > 0
+        entropies[seen] = np.log2(sums[seen]) - nLogN[seen] / sums[seen]
+        return entropies
+
+    def meanRowEntropy(self):
+        # the row entropies weighted by how often each row is seen, the conditional
+        # entropy of the next word given the ngram
+        sums = rowSums(self.counts)
+        return float((self.rowEntropies() * sums).sum() / max(sums.sum(), 1))
@@ -0,0 +1,169 @@
+import sys
+import numpy as np
+
+## A compact replacement for a dict mapping ngram tuples to row ids.
+##
+## Every ngram is encoded as the col ids of its words (in the wordHash of its model),
+## packed into one integer key of width*bits bits. The keys are kept sorted next to the
+## row of each, so a whole batch of ngrams is looked up with one searchsorted and
+## there are no tuples or per-ngram python objects. If the keys don't fit into 63 bits,
+## they are python ints in an object array, which works the same, only slower.
+
+KEY_BITS = 63
+
+class NgramIndex():
+
+    def __init__(self, wordHash, width, ids=None):
+        # ids holds the word ids of the ngram with row index r in row r
+        self.wordHash = wordHash
+        self.width = width
+        self.bits = max(int(len(wordHash)).bit_length(), 1)
+        self._words = None # words by col, for turning ids back into tuples
+
+        if ids is None:
+            ids = np.zeros((0, width), dtype=np.int64)
+        keys = self.encode(ids)
+        self.ngramRows = np.argsort(keys, kind='stable').astype(np.int32)
+        self.ngramKeys = keys[self.ngramRows] # sorted
+
+    @staticmethod
+    def fromSorted(wordHash, width, ngramKeys, ngramRows):
+        # adopts the sorted keys and rows of an index (e.g. memory mapped from a model file)
+        # without encoding and sorting the ngrams again
+        index = NgramIndex(wordHash, width)
+        index.ngramKeys = ngramKeys
+        index.ngramRows = ngramRows
+        return index
+
+    @staticmethod
+    def fromDict(ngramHash, wordHash, width):
+        # builds the index of an old tuple keyed ngramHash
+        ids = np.zeros((len(ngramHash), width), dtype=np.int64)
+        for ngram, row in ngramHash.items():
+            ids[row] = [wordHash[word] for word in ngram]
+        return NgramIndex(wordHash, width, ids)
+
+    def isWide(self):
+        return self.width * self.bits > KEY_BITS
+
+    def encode(self, ids):
+        # packs the (n, width) word ids into n keys. Rows with an unknown (-1) word get the key -1.
+        ids = np.asarray(ids)
+        if self.isWide():
+            ids = ids.astype(object)
+            keys = np.zeros(len(ids), dtype=object)
+        else:
+            ids = ids.astype(np.int64)
+            keys = np.zeros(len(ids), dtype=np.int64)
+        for i in range(self.width):
+            keys = (keys << self.bits) | ids[:, i]
+        keys[(ids < 0).any(axis=1)] = -1
+        return keys
+
+    def decode(self, keys):
+        ids = np.zeros((len(keys), self.width), dtype=np.int64)
+        mask = (1 << self.bits) - 1
+        for i in range(self.width-1, -1, -1):
+            ids[:, i] = (keys & mask).astype(np.int64)
+            keys = keys >> self.bits
+        return ids
+
+    def lookupIds(self, ids):
+        # the rows of the (n, width) word ids, -1 for ngrams that aren't in the index
+        keys = self.encode(ids)
+        if len(self.ngramKeys) == 0:
+            return np.full(len(keys), -1, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(self.ngramKeys, keys), len(self.ngramKeys)-1)
+        found = (self.ngramKeys[positions] == keys) & (keys >= 0)
+        return np.where(found, self.ngramRows[positions], -1).astype(np.int64)
+
+    def idArray(self):
+        # the word ids of every ngram, ordered by row
+        ids = np.zeros((len(self.ngramKeys), self.width), dtype=np.int32)
+        ids[self.ngramRows] = self.decode(self.ngramKeys)
+        return ids
+
+    def extended(self, wordHash, ids):
+        # A new index with the ngrams of the (n, width) word ids appended as rows len(self)...,
+        # for a wordHash that has grown from the one of this index. The new keys are merged
+        # into the sorted ones, unless the grown vocabulary needs more bits per word.
+        ids = np.asarray(ids).reshape(-1, self.width)
+        index = NgramIndex(wordHash, self.width)
+        if index.bits != self.bits:
+            return NgramIndex(wordHash, self.width, np.concatenate((self.idArray(), ids)))
+        keys = index.encode(ids)
+        order = np.argsort(keys, kind='stable')
+        positions = np.searchsorted(self.ngramKeys, keys[order])
+        index.ngramKeys = np.insert(self.ngramKeys, positions, keys[order])
+        index.ngramRows = np.insert(self.ngramRows, positions, (len(self) + order).astype(np.int32))
+        return index
+
+    def nbytes(self):
+        size = self.ngramKeys.nbytes + self.ngramRows.nbytes
+        if self.isWide():
+            size += sum(sys.getsizeof(key) for key in self.ngramKeys) # the python ints
+        return size
+
+    def bytesPerNgram(self):
+        return self.nbytes() / max(len(self), 1)
+
+    # read-only dict interface, for single lookups and for debugging
+
+    def get(self, ngram, default=None):
+        ids = [self.wordHash.get(word, -1) for word in ngram]
+        if len(ids) != self.width:
+            return default
+        row = self.lookupIds(np.array([ids]))[0]
+        return default if row < 0 else int(row)
+
+    def __getitem__(self, ngram):
+        row = self.get(ngram)
+        if row is None:
+            raise KeyError(ngram)
+        return row
+
+    def __contains__(self, ngram):
+        return self.get(ngram) is not None
+
+    def __len__(self):
+        return len(self.ngramKeys)
+
+    def items(self):
+        if self._words is None:
+            self._words = [None]*len(self.wordHash)
+            for word, col in self.wordHash.items():
+                self._words[col] = word
+        words = self._words
+        for row, ids in enumerate(self.idArray().tolist()):
+            yield tuple(words[i] for i in ids), row
+
+    def keys(self):
+        for ngram, row in self.items():
+            yield ngram
+
+    def values(self):
+        return range(len(self))
+
+    def __iter__(self):
+        return self.keys()
+
+    def __eq__(self, other):
+        return dict(self.items()) == dict(other.items())
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_words'] = None
+        return state
+
+
+def numberNgrams(wordHash, width, ids):
+    # Numbers the ngrams of the (n, width) word ids in the order they are first seen,
+    # like repeated setdefault calls on a dict would. Returns the index of the
+    # distinct ngrams and the row of every one of the n ngrams.
+    ids = np.asarray(ids).reshape(-1, width)
+    keys = NgramIndex(wordHash, width).encode(ids)
+    _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    order = np.argsort(first, kind='stable')
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+    return NgramIndex(wordHash, width, ids[first[order]]), rank[inverse.ravel()]
@@ -0,0 +1,62 @@
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from .counting import fitCounts
+from .ngramindex import NgramIndex
+from .scoring import rowSums
+
+## Pruning drops transitions from a trained count matrix, to get smaller and faster models.
+##
+##   min count         drops the transitions seen less than minCount times. Most
+##                     transitions are only seen once.
+##   relative entropy  drops the transitions whose removal changes the probabilities of
+##                     the model the least (Stolcke, "Entropy-based pruning of backoff
+##                     language models", 1998).
+##
+## For a laplace row with row sum S over V words, a transition seen n times has
+## P = (n+1)/(S+V+1). Without it, its row sum is S-n and every other word of the row
+## gets the probability divided by rho = (S-n+V+1)/(S+V+1), so the relative entropy of the
+## row before and after is
+##   D = log(rho) + P log(n+1)
+## Weighted by how often the row is seen, S / (sum of all S), it tells how much the
+## transition adds to the model. Every transition is judged on its own.
+
+def relativeEntropies(counts):
+    # the weighted relative entropy of removing every transition of the laplace count matrix,
+    # in the order of counts.data
+    numCols = counts.shape[1]
+    sums = rowSums(counts)
+    rows = np.repeat(np.arange(counts.shape[0]), np.diff(counts.indptr))
+    n = counts.data.astype(np.float64)
+    rowSum = sums[rows].astype(np.float64)
+
+    rowSumSmooth = rowSum + numCols + 1 # add 1 for each word and 1 for the *unknown* word
+    logRho = np.log(rowSumSmooth - n) - np.log(rowSumSmooth)
+    entropies = logRho + (n + 1) / rowSumSmooth * np.log(n + 1)
+    return rowSum / max(sums.sum(), 1) * entropies
+
+def pruneMask(counts, minCount=1, threshold=0.0, entropies=True):
+    # which transitions of the count matrix to keep. entropies=False only applies minCount,
+    # for models that don't use laplace smoothing
+    keep = counts.data >= minCount
+    if threshold > 0:
+        if not entropies:
+            raise Exception('relative entropy pruning needs laplace counts')
+        keep &= relativeEntropies(counts) >= threshold
+    return keep
+
+def dropTransitions(counts, keep):
+    # the count matrix with only the transitions where keep is set
+    rows = np.repeat(np.arange(counts.shape[0]), np.diff(counts.indptr))
+    indptr = np.concatenate(([0], np.cumsum(np.bincount(rows[keep], minlength=counts.shape[0]))))
+    pruned = csr_matrix((counts.data[keep], counts.indices[keep], indptr.astype(counts.indptr.dtype)), shape=counts.shape)
+    return fitCounts(pruned)
+
+def dropEmptyRows(ngramHash, counts):
+    # Drops the ngrams without any transition from the index and the matrix. For laplace
+    # models they have the probabilities of unknown ngrams anyway.
+    rows = np.flatnonzero(np.diff(counts.indptr))
+    if len(rows) == counts.shape[0]:
+        return ngramHash, counts
+    index = NgramIndex(ngramHash.wordHash, ngramHash.width, ngramHash.idArray()[rows])
+    return index, counts[rows]
@@ -0,0 +1,59 @@
+import numpy as np
+import itertools
+import nltk
+
+## Vectorized helpers for scoring reviews against a trained count matrix
+
+def transitionIds(tokens, order, ngramHash, wordHash):
+    # Maps the transitions of a tokenized review to (row, col) id arrays.
+    # Unknown ngrams and words get the id -1.
+    rows, cols, _ = batchTransitionIds([tokens], order, ngramHash, wordHash)
+    return rows, cols
+
+def batchTransitionIds(tokenLists, order, ngramHash, wordHash):
+    # transitionIds for many reviews, concatenated. Also returns the index of
+    # the review every transition belongs to, for summing per review.
+    # Every token is looked up once in wordHash, the ngrams are then looked up
+    # by their word ids in the NgramIndex ngramHash, all at once.
+    tokenCounts = np.array([len(tokens) for tokens in tokenLists], dtype=np.int64)
+    ids = np.fromiter((wordHash.get(token, -1) for token in itertools.chain.from_iterable(tokenLists)),
+                      dtype=np.int64, count=int(tokenCounts.sum()))
+
+    # the position of the first token of every transition's ngram
+    lengths = tokenCounts - order
+    segments = np.repeat(np.arange(len(lengths)), lengths)
+    firsts = np.concatenate(([0], np.cumsum(tokenCounts)[:-1]))[segments]
+    firsts += np.arange(len(segments)) - np.concatenate(([0], np.cumsum(lengths)[:-1]))[segments]
+
+    cols = ids[firsts + order] # skip the first padding
+    if order == 0:
+        rows = np.zeros(len(cols), dtype=np.int64) # just the only row we've got
+    else:
+        rows = ngramHash.lookupIds(ids[firsts[:, None] + np.arange(order)])
+    return rows, cols, segments
+
+def iterTransitions(tokenLists, order):
+    # yields (prevstates, word) for every transition, in the order of batchTransitionIds
+    for tokens in tokenLists:
+        words = tokens[order:] # skip the first padding
+        if order == 0:
+            ngrams = [()]*len(words)
+        else:
+            ngrams = nltk.ngrams(tokens[:-1], order) # the last ngram is only padding
+        for ngram, word in zip(ngrams, words):
+            yield ngram, word
+
+def segmentSums(values, segments, numSegments):
+    return np.bincount(segments, weights=values, minlength=numSegments)
+
+def gather(matrix, rows, cols):
+    # looks up matrix[rows[i], cols[i]] for all i at once
+    if len(rows) == 0:
+        return np.zeros(0, dtype=matrix.dtype)
+    return np.asarray(matrix[rows, cols]).ravel()
+
+def rowSums(matrix):
+    # sum() on the matrix accumulates in its own (small) dtype and overflows,
+    # so sum the csr data in int64
+    sums = np.concatenate(([0], np.cumsum(matrix.data, dtype=np.int64)))
+    return sums[matrix.indptr[1:]] - sums[matrix.indptr[:-1]]
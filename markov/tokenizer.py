@@ -0,0 +1,161 @@
+import re
+import nltk
+
+## Tokenizers turn the text of a review into tokens, before the models add their padding.
+##
+##   nltk       nltk.word_tokenize, what the models always used
+##   regex      the treebank rules of nltk.word_tokenize for text that is already split
+##              by spaces, like the bundled corpora. Every distinct space separated chunk
+##              is split with one compiled regex, and remembered in a bounded memo.
+##   whitespace just splits at whitespace
+##
+## The name of the tokenizer is saved with the model, a model has to classify with
+## the tokenizer it was trained with. benchmarks/tokenizer_parity.py reports where
+## the tokenizers differ from nltk on a corpus.
+
+class Tokenizer():
+    name = None
+    version = 1 # increase it whenever the tokens change, that invalidates the tokenized corpus cache
+
+    def tokenize(self, text):
+        raise Exception('not implemented')
+
+    def identity(self):
+        # changes whenever the tokens may change
+        return '%s-%d' % (self.name, self.version)
+
+    def __reduce__(self):
+        # pickles as its name
+        return (getTokenizer, (self.name,))
+
+
+class NltkTokenizer(Tokenizer):
+    name = 'nltk'
+
+    def tokenize(self, text):
+        return nltk.word_tokenize(text)
+
+    def identity(self):
+        return '%s-%d-%s' % (self.name, self.version, nltk.__version__)
+
+
+class WhitespaceTokenizer(Tokenizer):
+    name = 'whitespace'
+
+    def tokenize(self, text):
+        return text.split()
+
+
+# the symbols nltk.word_tokenize splits off a chunk
+SYMBOL_PATTERN = re.compile(r"""
+      (?<!\w)'(?!(?:re|ve|ll|m|t|s|d|n)\b)(?=\w)  # an opening single quote
+    | [«“‘„»”’]
+    | `+
+    | ''
+    | "
+    | \.{2,}
+    | --
+    | [;@\#$%&*?!]
+    | [\u2012-\u2015]
+    | [\[\](){}<>]
+    | [:,](?!\d)
+""", re.VERBOSE | re.IGNORECASE)
+
+# the final period of a review
+FINAL_PERIOD_PATTERN = re.compile(r"""(?<=[^.])\.(?=[\])}>"']*$)""")
+
+# the clitics nltk.word_tokenize splits off the end of what is left
+CLITIC_PATTERN = re.compile(r"(?<=[^'])(?:'s|'m|'d|'ll|'re|'ve|n't)$", re.IGNORECASE)
+
+# the words nltk.word_tokenize splits in two
+CONTRACTIONS = {
+    'cannot': ['can', 'not'],
+    'gimme': ['gim', 'me'],
+    'gonna': ['gon', 'na'],
+    'gotta': ['got', 'ta'],
+    'lemme': ['lem', 'me'],
+    'wanna': ['wan', 'na'],
+    "more'n": ['more', "'n"],
+    "d'ye": ['d', "'ye"],
+    "'tis": ["'t", 'is'],
+    "'twas": ["'t", 'was'],
+}
+
+# the number of distinct chunks whose tokens RegexTokenizer remembers
+CHUNK_CACHE_SIZE = 1 << 16
+
+class RegexTokenizer(Tokenizer):
+    name = 'regex'
+
+    def __init__(self):
+        self.chunks = {} # the tokens of the chunks seen since the memo was last cleared
+
+    def tokenize(self, text):
+        chunks = self.chunks
+        tokens = []
+        for chunk in text.split():
+            chunkTokens = chunks.get(chunk)
+            if chunkTokens is None:
+                if len(chunks) >= CHUNK_CACHE_SIZE:
+                    # the shared tokenizer sees the chunks of every corpus, however large, so
+                    # start over instead of growing. The frequent chunks are back soon.
+                    chunks.clear()
+                chunkTokens = chunks[chunk] = self._splitChunk(chunk, SYMBOL_PATTERN)
+            tokens.extend(chunkTokens)
+
+        if tokens and '.' in chunk and FINAL_PERIOD_PATTERN.search(chunk):
+            # the period at the very end is split off as well
+            tokens[len(tokens)-len(chunkTokens):] = self._splitChunk(chunk, FINAL_PERIOD_PATTERN, SYMBOL_PATTERN)
+        return tokens
+
+    def _splitChunk(self, chunk, *patterns):
+        # splits off the matches of the first pattern, then of the others, then the clitics
+        if not patterns:
+            return self._splitWord(chunk)
+
+        tokens = []
+        start = 0
+        for match in patterns[0].finditer(chunk):
+            if match.start() > start:
+                tokens.extend(self._splitChunk(chunk[start:match.start()], *patterns[1:]))
+            tokens.append(self._quote(chunk, match))
+            start = match.end()
+        if start < len(chunk):
+            tokens.extend(self._splitChunk(chunk[start:], *patterns[1:]))
+        return tokens
+
+    def _quote(self, chunk, match):
+        # double quotes become `` when they open and '' when they close
+        token = match.group()
+        if token == '"' or token == "''":
+            opening = match.start() == 0 or chunk[match.start()-1] in '([{<'
+            return '``' if opening else "''"
+        return token
+
+    def _splitWord(self, word):
+        contraction = CONTRACTIONS.get(word.lower())
+        if contraction is not None:
+            return contraction
+        if len(word) > 1 and word[-1] == "'" and word[-2] != "'":
+            return self._splitWord(word[:-1]) + ["'"] # a closing single quote
+        clitic = CLITIC_PATTERN.search(word)
+        if clitic is not None:
+            return [word[:clitic.start()], clitic.group()]
+        return [word]
+
+
+TOKENIZERS = {
+    NltkTokenizer.name: NltkTokenizer,
+    RegexTokenizer.name: RegexTokenizer,
+    WhitespaceTokenizer.name: WhitespaceTokenizer,
+}
+
+_instances = {}
+
+def getTokenizer(name):
+    # tokenizers keep no state but caches, so all models share one of each
+    if name not in TOKENIZERS:
+        raise Exception('unknown tokenizer %s' % name)
+    if name not in _instances:
+        _instances[name] = TOKENIZERS[name]()
+    return _instances[name]
@@ -0,0 +1,57 @@
+import numpy as np
+
+## Tracers collect debug information while a model scores reviews.
+## The scoring methods take an optional tracer and record nothing without one,
+## so pass a tracer only when the information is actually needed.
+
+class MissTracer():
+    # only counts the misses
+    wantsTransitions = False
+
+    def __init__(self):
+        self.totalRowMisses = 0    # number of prevstates we didn't know
+        self.totalColMisses = 0    # number of words we haven't seen before
+        self.totalTransMisses = 0  # number of transistions we haven't seen before
+
+    def addMisses(self, rowmiss, colmiss, transmiss):
+        # takes single 0/1 flags or boolean arrays of flags
+        self.totalRowMisses += int(np.sum(rowmiss))
+        self.totalColMisses += int(np.sum(colmiss))
+        self.totalTransMisses += int(np.sum(transmiss))
+
+    def addTransition(self, prevstates, word, prob, count, rowmiss, colmiss, transmiss):
+        pass
+
+    def merge(self, other):
+        self.addMisses(other.totalRowMisses, other.totalColMisses, other.totalTransMisses)
+
+
+class TransitionTracer(MissTracer):
+    # also keeps every transition that was looked up, as printed by MarkovClassifier.printDebug
+    wantsTransitions = True
+
+    def __init__(self):
+        MissTracer.__init__(self)
+        self.transProbs = [] # the probability of each transition
+
+    def addTransition(self, prevstates, word, prob, count, rowmiss, colmiss, transmiss):
+        self.transProbs.append({
+            'from'      : prevstates,
+            'to'        : word,
+            'prob'      : prob,
+            'count'     : count,
+            'rowmiss'   : rowmiss,     #we didn't know these prevstates
+            'colmiss'   : colmiss,     #we haven't seen this word before
+            'transmiss' : transmiss,   #we knew the prevstate and the word, but we haven't a transition between them
+        })
+
+    def merge(self, other):
+        MissTracer.merge(self, other)
+        self.transProbs.extend(getattr(other, 'transProbs', []))
+
+
+class ClassifierTracer():
+    # one tracer for each model of a MarkovClassifier
+    def __init__(self, tracerClass=MissTracer):
+        self.pos = tracerClass()
+        self.neg = tracerClass()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+
+import sys
+import traceback
+import argparse
+from markov import MarkovClassifier
+
+################ CLI App ##################
+def main():
+    parser = argparse.ArgumentParser(prog="merger", description="merges models trained on shards of the corpora into one")
+
+    parser.add_argument('--input', '-i', dest='inputs',
+                        type=str, nargs='+', required=True,
+                        help='model files to merge, in the order of their shards')
+
+    parser.add_argument('--output', '-o', dest='output',
+                        type=str, nargs='?', required=True,
+                        help='save the merged model to this file')
+
+    parser.add_argument('--joint', dest='joint', action='store_true',
+                        help='store both models in one count table with a shared vocabulary. laplace only')
+
+    parser.add_argument('--compile', dest='compile', action='store_true',
+                        help='save only the log likelihood ratio of every transition. classifies faster, but without debug info. laplace only')
+
+    args = parser.parse_args()
+
+    if not args.output:
+        print("no output file given")
+        return 1
+
+    try:
+        markov_classifier = MarkovClassifier.loadFromFile(args.inputs[0])
+        for filepath in args.inputs[1:]:
+            markov_classifier.merge(MarkovClassifier.loadFromFile(filepath))
+        if args.compile:
+            markov_classifier.compileRatios()
+        elif args.joint:
+            markov_classifier.joinModels()
+    except Exception as e:
+        print("Error merging Markov Classifiers")
+        print("%s" % (e))
+        traceback.print_exc()
+        return 1
+    try:
+        markov_classifier.saveToFile(args.output)
+    except Exception as e:
+        print("Error saving Markov Classifier")
+        print("%s" % (e))
+        traceback.print_exc()
+        return 1
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+
+import sys
+import traceback
+import argparse
+from markov import MarkovClassifier
+
+################ CLI App ##################
+def main():
+    parser = argparse.ArgumentParser(prog="pruner", description="drops rare or unimportant transitions from a trained model")
+
+    parser.add_argument('--input', '-i', dest='input',
+                        type=str, nargs='?', required=True,
+                        help='model file to prune')
+
+    parser.add_argument('--output', '-o', dest='output',
+                        type=str, nargs='?', required=True,
+                        help='save the pruned model to this file')
+
+    parser.add_argument('--min-count', '-m', metavar='int', dest='min_count',
+                        type=int, nargs='?', default=1,
+                        help='drop the transitions seen less often. default: 1 (keep all)')
+
+    parser.add_argument('--threshold', '-e', metavar='float', dest='threshold',
+                        type=float, nargs='?', default=0.0,
+                        help='drop the transitions whose removal changes the model by less relative entropy, like 1e-7. laplace and backoff only. default: 0 (keep all)')
+
+    parser.add_argument('--joint', dest='joint', action='store_true',
+                        help='store both models in one count table with a shared vocabulary. laplace only')
+
+    parser.add_argument('--compile', dest='compile', action='store_true',
+                        help='save only the log likelihood ratio of every transition. classifies faster, but without debug info. laplace only')
+
+    args = parser.parse_args()
+
+    if not args.input:
+        print("no input file given")
+        return 1
+
+    if not args.output:
+        print("no output file given")
+        return 1
+
+    try:
+        markov_classifier = MarkovClassifier.loadFromFile(args.input)
+        dropped = markov_classifier.prune(minCount=args.min_count, threshold=args.threshold)
+        print("dropped %d transitions" % dropped)
+        markov_classifier.printSizes()
+        if args.compile:
+            markov_classifier.compileRatios()
+        elif args.joint:
+            markov_classifier.joinModels()
+    except Exception as e:
+        print("Error pruning Markov Classifier")
+        print("%s" % (e))
+        traceback.print_exc()
+        return 1
+    try:
+        markov_classifier.saveToFile(args.output)
+    except Exception as e:
+        print("Error saving Markov Classifier")
+        print("%s" % (e))
+        traceback.print_exc()
+        return 1
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
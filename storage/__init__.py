@@ -0,0 +1 @@
+from .arrayfile import *
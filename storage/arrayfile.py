@@ -0,0 +1,82 @@
+import os
+import json
+import struct
+
+import numpy as np
+
+## A simple versioned container for named numpy arrays.
+##
+## Layout:  magic | version (uint32) | header length (uint32) | json header | arrays
+## The json header holds the caller's meta data and the dtype, shape and offset
+## of every array. Arrays are aligned to ALIGNMENT bytes so they can be opened
+## with numpy.memmap, which lets forked processes share the pages.
+
+MAGIC = b"AIG42ARR"
+VERSION = 1
+ALIGNMENT = 64
+
+_PREFIX = struct.Struct("<8sII")
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+def isArrayFile(filepath):
+    with open(filepath, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+def writeArrayFile(filepath, meta, arrays):
+    arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+
+    # the offsets depend on the header size, so place the arrays relative to 0 first
+    layout = {}
+    offset = 0
+    for name, array in arrays.items():
+        offset = _align(offset)
+        layout[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+        offset += array.nbytes
+
+    header = json.dumps({'meta': meta, 'arrays': layout}).encode('utf-8')
+    dataStart = _align(_PREFIX.size + len(header))
+
+    # write to a temporary file first, so no reader ever sees half a file and the arrays
+    # of a file that is still memory mapped can be written back to it
+    tmppath = '%s.%d.tmp' % (filepath, os.getpid())
+    with open(tmppath, 'wb') as f:
+        f.write(_PREFIX.pack(MAGIC, VERSION, len(header)))
+        f.write(header)
+        for name, array in arrays.items():
+            f.seek(dataStart + layout[name]['offset'])
+            f.write(array.tobytes())
+        f.truncate(dataStart + offset)
+    os.replace(tmppath, filepath)
+
+    return dataStart + offset
+
+def readArrayFile(filepath, mmap=True):
+    # returns the meta data and a dict with all arrays, memory mapped read-only if mmap is set
+    with open(filepath, 'rb') as f:
+        magic, version, headerLength = _PREFIX.unpack(f.read(_PREFIX.size))
+        if magic != MAGIC:
+            raise Exception('not an array file: %s' % filepath)
+        if version != VERSION:
+            raise Exception('unsupported array file version %d' % version)
+        header = json.loads(f.read(headerLength).decode('utf-8'))
+
+        dataStart = _align(_PREFIX.size + headerLength)
+        if mmap:
+            # one mapping of the whole file, every array is a view into it
+            mapped = np.memmap(filepath, dtype=np.uint8, mode='r')
+
+        arrays = {}
+        for name, info in header['arrays'].items():
+            dtype = np.dtype(info['dtype'])
+            shape = tuple(info['shape'])
+            count = int(np.prod(shape))
+            start = dataStart + info['offset']
+            if mmap:
+                arrays[name] = mapped[start:start + count*dtype.itemsize].view(dtype).reshape(shape)
+            else:
+                f.seek(start)
+                arrays[name] = np.fromfile(f, dtype=dtype, count=count).reshape(shape)
+
+    return header['meta'], arrays
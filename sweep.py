@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+
+import os
+import io
+import sys
+import time
+import tempfile
+import traceback
+import argparse
+import contextlib
+
+import numpy as np
+
+from markov import MarkovClassifier, MarkovModelLaplace, MarkovModelBackoff
+from markov.model_goodturing import MarkovModelGoodTuring
+from markov.modelfile import saveClassifier
+from markov.tokenizer import TOKENIZERS, getTokenizer
+from corpus import corpusTokenLists
+
+## Sweeps the orders and smoothings of classifiers over one training and test split.
+## The corpora are tokenized (or loaded from the token cache) and counted once, at the
+## highest order. The counts of every lower order are marginalized from it, see
+## counting.marginalizeCounts, and every smoothing is built from the counts of its order:
+##
+##   laplace  the counts of order k
+##   backoff  the counts of the orders 0..k
+##   sgts     the counts of order k, smoothed
+##
+##   $ ./sweep.py -k 0 1 2 -s laplace backoff -t regex -o results/sweep
+##
+## The training time of a row is what it takes to get its counts from the corpora,
+## tokenizing and counting at the highest order and marginalizing down to the lowest
+## order it needs, plus building its smoothing from them.
+
+SPLIT = 'data/corpora/simple_divide/'
+
+SMOOTHINGS = ['laplace', 'backoff', 'sgts']
+
+def countOrders(order, tokenizer, file, cacheDir):
+    # the laplace models of the orders 0..order of the reviews in file, counted once at order,
+    # and the seconds it took to get the counts of every order
+    tic = time.time()
+    tokenLists = list(corpusTokenLists(file, getTokenizer(tokenizer), cacheDir))
+    model = MarkovModelLaplace(order, tokenizer)
+    with contextlib.redirect_stdout(io.StringIO()): # swallow the progress of every review
+        model.updateOnTokens(tokenLists)
+    models = [model]
+    seconds = [time.time() - tic]
+    while models[0].k > 0:
+        models.insert(0, models[0].marginalized(len(tokenLists)))
+        seconds.insert(0, time.time() - tic)
+    return models, seconds
+
+def countSeconds(seconds, order, smoothing):
+    # the seconds to get the counts a model of order and smoothing is built from
+    return seconds[0] if smoothing == 'backoff' else seconds[order] # backoff needs all orders down to 0
+
+def buildModel(models, order, smoothing, tokenizer):
+    # the model of order and smoothing from the laplace models of countOrders
+    if smoothing == 'laplace':
+        return models[order]
+    elif smoothing == 'backoff':
+        model = MarkovModelBackoff(order, tokenizer)
+        model.loadModels(models[:order+1])
+        return model
+    elif smoothing == 'sgts':
+        model = MarkovModelGoodTuring(order, tokenizer)
+        model.loadCounts(models[order].ngramHash, models[order].wordHash, models[order].transCountMatrix)
+        return model
+    raise Exception('unsupported smoothing')
+
+def fileSize(classifier):
+    with tempfile.TemporaryDirectory() as directory:
+        return saveClassifier(classifier, os.path.join(directory, 'model'))
+
+def evaluate(classifier, posTokens, negTokens, batch_size):
+    # the accuracy on the test reviews and the number of reviews classified per second
+    tic = time.time()
+    posLabels, _ = classifier.classify_many_tokens(posTokens, batch_size=batch_size)
+    negLabels, _ = classifier.classify_many_tokens(negTokens, batch_size=batch_size)
+    toc = time.time()
+    correct = np.count_nonzero(posLabels > 0) + np.count_nonzero(negLabels < 0)
+    numReviews = len(posLabels) + len(negLabels)
+    return correct / numReviews, numReviews / max(toc - tic, 1e-9)
+
+def sweep(orders, smoothings, tokenizer, posfile, negfile, testPosfile, testNegfile, batch_size=1000, cacheDir=None):
+    # yields a row of the results table for every order and smoothing
+    tic = time.time()
+    posModels, posSeconds = countOrders(max(orders), tokenizer, posfile, cacheDir)
+    negModels, negSeconds = countOrders(max(orders), tokenizer, negfile, cacheDir)
+    print("counted the orders 0..%d in %.2f s, shared by all configurations" % (max(orders), time.time() - tic))
+
+    posTokens = list(corpusTokenLists(testPosfile, getTokenizer(tokenizer), cacheDir))
+    negTokens = list(corpusTokenLists(testNegfile, getTokenizer(tokenizer), cacheDir))
+
+    for order in orders:
+        for smoothing in smoothings:
+            row = {'k': order, 'smoothing': smoothing}
+            try:
+                tic = time.time()
+                classifier = MarkovClassifier(order, smoothing, tokenizer)
+                classifier.pos_model = buildModel(posModels, order, smoothing, tokenizer)
+                classifier.neg_model = buildModel(negModels, order, smoothing, tokenizer)
+                row['seconds'] = time.time() - tic + countSeconds(posSeconds, order, smoothing) + countSeconds(negSeconds, order, smoothing)
+                row['bytes'] = fileSize(classifier)
+                row['accuracy'], row['throughput'] = evaluate(classifier, posTokens, negTokens, batch_size)
+            except Exception as e:
+                row['error'] = str(e)
+            yield row
+
+def formatRow(row):
+    if 'error' in row:
+        return "%2d | %-9s | failed: %s" % (row['k'], row['smoothing'], row['error'])
+    return "%2d | %-9s | %7.2f%% | %8.3f | %10d | %10.0f" % (row['k'], row['smoothing'], 100*row['accuracy'],
+                                                          row['seconds'], row['bytes'], row['throughput'])
+
+
+################ CLI App ##################
+def main():
+    parser = argparse.ArgumentParser(prog="sweep", description="trains and tests classifiers of many orders and smoothings, counting the corpora once")
+
+    parser.add_argument('--order','-k',metavar='int', dest='orders',
+                        type=int, nargs='+', default=[0, 1, 2],
+                        help='orders of the markov model. default: 0 1 2')
+
+    parser.add_argument('--smoothing','-s', dest='smoothings',
+                        type=str, nargs='+', default=SMOOTHINGS, choices=SMOOTHINGS,
+                        help='smoothing techniques. default: ' + ' '.join(SMOOTHINGS))
+
+    parser.add_argument('--tokenizer', '-t', dest='tokenizer',
+                        type=str, nargs='?', default='nltk', choices=sorted(TOKENIZERS),
+                        help='tokenizer for the reviews. default: nltk')
+
+    parser.add_argument('--pos', '-p', dest='pos',
+                        type=str, nargs='?', default=SPLIT + 'posrev_train.txt',
+                        help='train with these positive reviews. default: ' + SPLIT + 'posrev_train.txt')
+
+    parser.add_argument('--neg', '-n', dest='neg',
+                        type=str, nargs='?', default=SPLIT + 'negrev_train.txt',
+                        help='train with these negative reviews. default: ' + SPLIT + 'negrev_train.txt')
+
+    parser.add_argument('--test-pos', dest='test_pos',
+                        type=str, nargs='?', default=SPLIT + 'posrev_test.txt',
+                        help='test with these positive reviews. default: ' + SPLIT + 'posrev_test.txt')
+
+    parser.add_argument('--test-neg', dest='test_neg',
+                        type=str, nargs='?', default=SPLIT + 'negrev_test.txt',
+                        help='test with these negative reviews. default: ' + SPLIT + 'negrev_test.txt')
+
+    parser.add_argument('--batch-size', '-b', metavar='int', dest='batch_size',
+                        type=int, nargs='?', default=1000, const=1000,
+                        help='number of reviews classified at once. default: 1000')
+
+    parser.add_argument('--output', '-o', dest='output',
+                        type=str, nargs='?', default=None,
+                        help='also write the results table to this file')
+
+    parser.add_argument('--cache-dir', dest='cache_dir',
+                        type=str, nargs='?', default='cache/tokens',
+                        help='directory to cache the tokenized corpora in. default: cache/tokens')
+
+    parser.add_argument('--no-cache', dest='no_cache', action='store_true',
+                        help='tokenize the corpora again instead of using the cache')
+
+    args = parser.parse_args()
+    cacheDir = None if args.no_cache else args.cache_dir
+
+    if min(args.orders) < 0:
+        print("orders must not be negative")
+        return 1
+
+    lines = [
+        "train: %s, %s; test: %s, %s; tokenizer: %s" % (args.pos, args.neg, args.test_pos, args.test_neg, args.tokenizer),
+        "%2s | %-9s | %8s | %8s | %10s | %10s" % ("k", "smoothing", "accuracy", "train s", "bytes", "reviews/s"),
+    ]
+    try:
+        for row in sweep(sorted(set(args.orders)), args.smoothings, args.tokenizer, args.pos, args.neg,
+                         args.test_pos, args.test_neg, args.batch_size, cacheDir):
+            if len(lines) == 2:
+                print(lines[0])
+                print(lines[1])
+            lines.append(formatRow(row))
+            print(lines[-1])
+    except Exception as e:
+        print("Error while sweeping")
+        print("%s" % (e))
+        traceback.print_exc()
+        return 1
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write("\n".join(lines) + "\n")
+        print("results written to \"%s\"" % args.output)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
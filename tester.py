@@ -1,11 +1,71 @@
 #!/usr/bin/env python3
 
+import io
 import sys
 import traceback
 import argparse
+import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from markov import MarkovClassifier
+from markov.evaluation import classifyTokens, addOutcome, newResults, printResults
 from constants import SENTIMENT
-from corpus import CorpusReader
+from corpus import CorpusReader, corpusTokenLists, loadTokenizedCorpus
+
+CHUNKS_PER_JOB = 4 # chunks of every test corpus per worker, so no worker waits for the last one
+
+def classifyFile(markov_classifier, file, results, batch_size, cacheDir=None):
+    # classifies all reviews in file, adds the outcome to results and
+    # returns the number of reviews and the summed up misses
+    tokenLists = corpusTokenLists(file, markov_classifier.getTokenizer(), cacheDir)
+    totals = [0, None]
+    addOutcome(results, totals, classifyTokens(markov_classifier, tokenLists, batch_size))
+    return totals[0], totals[1]
+
+
+## Parallel testing: every test corpus is split into chunks that are classified in a
+## pool of worker processes. Forked workers share the memory mapped model and tokenized
+## corpora of the parent, other workers load them again, memory mapped as well.
+
+_worker = {} # the classifier and the tokenized test corpora of a worker process
+
+def _initWorker(filepath, testfiles, cacheDir):
+    if 'classifier' in _worker:
+        return # forked, everything is inherited
+    with contextlib.redirect_stdout(io.StringIO()):
+        _worker['classifier'] = MarkovClassifier.loadFromFile(filepath)
+        if cacheDir is not None:
+            tokenizer = _worker['classifier'].getTokenizer()
+            _worker['corpora'] = {file: loadTokenizedCorpus(file, tokenizer, cacheDir) for file in testfiles}
+
+def _classifyChunk(file, chunk, chunks, batch_size):
+    markov_classifier = _worker['classifier']
+    corpus = _worker.get('corpora', {}).get(file)
+    if corpus is not None:
+        tokenLists = corpus.tokenLists(len(corpus) * chunk // chunks, len(corpus) * (chunk+1) // chunks)
+    else:
+        tokenizer = markov_classifier.getTokenizer()
+        tokenLists = (tokenizer.tokenize(review) for review in CorpusReader(file, chunk, chunks).reviews())
+    return classifyTokens(markov_classifier, tokenLists, batch_size)
+
+def classifyFilesParallel(markov_classifier, filepath, files, results, batch_size, jobs, cacheDir=None):
+    # classifyFile for every file in files, with results[i] for files[i], in jobs worker processes.
+    # Returns the number of reviews and the summed up misses of every file.
+    _worker['classifier'] = markov_classifier
+    if cacheDir is not None:
+        tokenizer = markov_classifier.getTokenizer()
+        _worker['corpora'] = {file: loadTokenizedCorpus(file, tokenizer, cacheDir) for file in files}
+    markov_classifier.classify_many(['']) # builds the word hash table before forking
+
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('fork') if 'fork' in methods else None
+    chunks = jobs * CHUNKS_PER_JOB
+    totals = [[0, None] for file in files]
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=context, initializer=_initWorker, initargs=(filepath, files, cacheDir)) as pool:
+        futures = [(i, pool.submit(_classifyChunk, file, chunk, chunks, batch_size)) for i, file in enumerate(files) for chunk in range(chunks)]
+        for i, future in futures:
+            addOutcome(results[i], totals[i], future.result())
+    return totals
 
 ################ CLI App ##################
 def main():
@@ -23,7 +83,23 @@ def main():
                         type=str, nargs='?', required=True,
                         help='test with these negative reviews')
 
+    parser.add_argument('--batch-size', '-b', metavar='int', dest='batch_size',
+                        type=int, nargs='?', default=1000, const=1000,
+                        help='number of reviews classified at once. default: 1000')
+
+    parser.add_argument('--jobs', '-j', metavar='int', dest='jobs',
+                        type=int, nargs='?', default=1, const=2,
+                        help='number of worker processes classifying chunks of the test corpora. default: 1')
+
+    parser.add_argument('--cache-dir', dest='cache_dir',
+                        type=str, nargs='?', default='cache/tokens',
+                        help='directory to cache the tokenized test corpora in. default: cache/tokens')
+
+    parser.add_argument('--no-cache', dest='no_cache', action='store_true',
+                        help='tokenize the test corpora again instead of using the cache')
+
     args = parser.parse_args()
+    cacheDir = None if args.no_cache else args.cache_dir
 
     if not args.file:
         print("no load file given")
@@ -43,125 +119,56 @@ def main():
         traceback.print_exc()
         return 1
 
-    results = {
-            SENTIMENT.POSITIVE: {
-                SENTIMENT.POSITIVE: 0,
-                SENTIMENT.NEUTRAL: 0,
-                SENTIMENT.NEGATIVE: 0,
-            },
-            SENTIMENT.NEGATIVE: {
-                SENTIMENT.POSITIVE: 0,
-                SENTIMENT.NEUTRAL: 0,
-                SENTIMENT.NEGATIVE: 0,
-            },
-    }
-
-    print("testing positive reviews...")
-    pos_counter = 0
-    misses = {
-        'posRows': 0,
-        'posCols': 0,
-        'posTrans': 0,
-        'negRows': 0,
-        'negCols': 0,
-        'negTrans': 0,
-    }
-
-    reader = CorpusReader(args.pos)
-    for review in reader.reviews():
+    results = newResults()
+
+    if args.jobs < 1:
+        print("at least one job needed")
+        return 1
+    if args.jobs > 1:
+        print("testing positive and negative reviews in %d processes..." % args.jobs)
         try:
-            debugInfo = {}
-            sentiment = markov_classifier.classify(review, debug=False, debugInfo=debugInfo)
-            results[SENTIMENT.POSITIVE][sentiment] += 1
-
-            misses['posRows'] += debugInfo['pos']['totalRowMisses']
-            misses['posCols'] += debugInfo['pos']['totalColMisses']
-            misses['posTrans'] += debugInfo['pos']['totalTransMisses']
-            misses['negRows'] += debugInfo['neg']['totalRowMisses']
-            misses['negCols'] += debugInfo['neg']['totalColMisses']
-            misses['negTrans'] += debugInfo['neg']['totalTransMisses']
-
-            #if debugInfo['pos']['totalColMisses'] > 0:
-            #    markov_classifier.classify(review, debug=True)
-
-            pos_counter += 1
-            #print(pos_counter)
+            (pos_counter, pos_misses), (neg_counter, neg_misses) = classifyFilesParallel(markov_classifier, args.file,
+                [args.pos, args.neg], [results[SENTIMENT.POSITIVE], results[SENTIMENT.NEGATIVE]], args.batch_size, args.jobs, cacheDir)
         except Exception as e:
             print("Error while classifying")
             print("%s" % (e))
             traceback.print_exc()
             return 1
-    print("done. %d pos reviews classified" % pos_counter)
-    print(misses)
-
-    print("testing negative reviews...")
-
-    neg_counter = 0
-    misses = {
-        'posRows': 0,
-        'posCols': 0,
-        'posTrans': 0,
-        'negRows': 0,
-        'negCols': 0,
-        'negTrans': 0,
-    }
-
-    reader = CorpusReader(args.neg)
-    for review in reader.reviews():
+        print("done. %d pos reviews classified" % pos_counter)
+        if pos_misses is not None:
+            print(pos_misses)
+        print("done. %d neg reviews classified" % neg_counter)
+        if neg_misses is not None:
+            print(neg_misses)
+    else:
+        print("testing positive reviews...")
+        try:
+            pos_counter, misses = classifyFile(markov_classifier, args.pos, results[SENTIMENT.POSITIVE], args.batch_size, cacheDir)
+        except Exception as e:
+            print("Error while classifying")
+            print("%s" % (e))
+            traceback.print_exc()
+            return 1
+        print("done. %d pos reviews classified" % pos_counter)
+        if misses is not None:
+            print(misses)
+
+        print("testing negative reviews...")
         try:
-            debugInfo = {}
-            sentiment = markov_classifier.classify(review, debug=False, debugInfo=debugInfo)
-            results[SENTIMENT.NEGATIVE][sentiment] += 1
-
-            misses['posRows'] += debugInfo['pos']['totalRowMisses']
-            misses['posCols'] += debugInfo['pos']['totalColMisses']
-            misses['posTrans'] += debugInfo['pos']['totalTransMisses']
-            misses['negRows'] += debugInfo['neg']['totalRowMisses']
-            misses['negCols'] += debugInfo['neg']['totalColMisses']
-            misses['negTrans'] += debugInfo['neg']['totalTransMisses']
-
-            #if debugInfo['neg']['totalColMisses'] > 0:
-            #    markov_classifier.classify(review, debug=True)
-
-            neg_counter += 1
-            #print(neg_counter)
+            neg_counter, misses = classifyFile(markov_classifier, args.neg, results[SENTIMENT.NEGATIVE], args.batch_size, cacheDir)
         except Exception as e:
             print("Error while classifying")
             print("%s" % (e))
             traceback.print_exc()
             return 1
-    print("done. %d neg reviews classified" % neg_counter)
-    print(misses)
+        print("done. %d neg reviews classified" % neg_counter)
+        if misses is not None:
+            print(misses)
 
     total_counter = pos_counter + neg_counter
 
     print("done. In total %d reviews classified" % total_counter)
-    print("---------------------------")
-    print("RESULTS");
-    print("---------------------------")
-    print("")
-    print("reviews:    |  POS  |  NEG  |")
-    print("classified: +-------+-------+")
-    print("      POS   | %4d  | %4d  | %4d" % (results[SENTIMENT.POSITIVE][SENTIMENT.POSITIVE],results[SENTIMENT.NEGATIVE][SENTIMENT.POSITIVE],
-                                               results[SENTIMENT.POSITIVE][SENTIMENT.POSITIVE]+results[SENTIMENT.NEGATIVE][SENTIMENT.POSITIVE]))
-    print("        -   | %4d  | %4d  | %4d" % (results[SENTIMENT.POSITIVE][SENTIMENT.NEUTRAL], results[SENTIMENT.NEGATIVE][SENTIMENT.NEUTRAL],
-                                               results[SENTIMENT.POSITIVE][SENTIMENT.NEUTRAL] +results[SENTIMENT.NEGATIVE][SENTIMENT.NEUTRAL]))
-    print("      NEG   | %4d  | %4d  | %4d" % (results[SENTIMENT.POSITIVE][SENTIMENT.NEGATIVE],results[SENTIMENT.NEGATIVE][SENTIMENT.NEGATIVE],
-                                               results[SENTIMENT.POSITIVE][SENTIMENT.NEGATIVE]+results[SENTIMENT.NEGATIVE][SENTIMENT.NEGATIVE]))
-    print("            +-------+-------+--------")
-    print("      total | %4d  | %4d  | %4d" % (pos_counter, neg_counter, total_counter))
-    print("")
-    print("reviews:    |  POS | NEG  |")
-    print("classified: +------+------+")
-    print("      POS   | %.2f | %.2f | %.2f" % (results[SENTIMENT.POSITIVE][SENTIMENT.POSITIVE]/total_counter,results[SENTIMENT.NEGATIVE][SENTIMENT.POSITIVE]/total_counter,
-                                                results[SENTIMENT.POSITIVE][SENTIMENT.POSITIVE]/total_counter+results[SENTIMENT.NEGATIVE][SENTIMENT.POSITIVE]/total_counter))
-    print("        -   | %.2f | %.2f | %.2f" % (results[SENTIMENT.POSITIVE][SENTIMENT.NEUTRAL]/total_counter, results[SENTIMENT.NEGATIVE][SENTIMENT.NEUTRAL]/total_counter,
-                                                results[SENTIMENT.POSITIVE][SENTIMENT.NEUTRAL]/total_counter +results[SENTIMENT.NEGATIVE][SENTIMENT.NEUTRAL]/total_counter))
-    print("      NEG   | %.2f | %.2f | %.2f" % (results[SENTIMENT.POSITIVE][SENTIMENT.NEGATIVE]/total_counter,results[SENTIMENT.NEGATIVE][SENTIMENT.NEGATIVE]/total_counter,
-                                                results[SENTIMENT.POSITIVE][SENTIMENT.NEGATIVE]/total_counter+results[SENTIMENT.NEGATIVE][SENTIMENT.NEGATIVE]/total_counter))
-    print("            +------+------+--------")
-    print("            | %.2f | %.2f | %.2f" % (pos_counter/total_counter, neg_counter/total_counter, total_counter/total_counter))
-    print("")
+    printResults(results, pos_counter, neg_counter)
     return 0
 
 if __name__ == '__main__':
@@ -4,23 +4,27 @@ import sys
 import traceback
 import argparse
 from markov import MarkovClassifier
+from markov.tokenizer import TOKENIZERS
 
 ################ CLI App ##################
 def main():
     parser = argparse.ArgumentParser(prog="trainer", description="trains a movie review classifier on corpora")
 
     parser.add_argument('--order','-k',metavar='int', dest='order',
-                        type=int, nargs='?', required=True, const='0',
+                        type=int, nargs='?', const='0',
                         help='order of the markov model. default: 0')
 
     parser.add_argument('--smoothing','-s', dest='smoothing',
-                        type=str, nargs='?', required=True, choices=['laplace', 'backoff', 'sgts'],
+                        type=str, nargs='?', choices=['laplace', 'backoff', 'sgts'],
                         help='smoothing technique')
 
     parser.add_argument('--file', '-f', dest='file',
                         type=str, nargs='?', required=True,
                         help='save trained model to this file')
 
+    parser.add_argument('--update', '-u', dest='update', action='store_true',
+                        help='add the reviews of the corpora to the model in --file instead of training a new one. takes the order, smoothing and tokenizer of the model')
+
     parser.add_argument('--pos', '-p', dest='pos',
                         type=str, nargs='?', required=True,
                         help='traing corpus with positive reviews')
@@ -29,6 +33,35 @@ def main():
                         type=str, nargs='?', required=True,
                         help='traing corpus with negative reviews')
 
+    parser.add_argument('--tokenizer', '-t', dest='tokenizer',
+                        type=str, nargs='?', default='nltk', choices=sorted(TOKENIZERS),
+                        help='tokenizer for the reviews, saved with the model. regex and whitespace are faster than nltk on already spaced corpora. default: nltk')
+
+    parser.add_argument('--cache-dir', dest='cache_dir',
+                        type=str, nargs='?', default='cache/tokens',
+                        help='directory to cache the tokenized corpora in. default: cache/tokens')
+
+    parser.add_argument('--no-cache', dest='no_cache', action='store_true',
+                        help='tokenize the corpora again instead of using the cache')
+
+    parser.add_argument('--jobs', '-j', metavar='int', dest='jobs',
+                        type=int, nargs='?', default=1, const=2,
+                        help='number of worker processes. the positive and negative models (or the shards) are trained in parallel when > 1. default: 1')
+
+    parser.add_argument('--shards', metavar='int', dest='shards',
+                        type=int, nargs='?', default=1,
+                        help='count the corpora in this many shards of equal size and merge them, for corpora too large to count at once. the shards are not cached. default: 1')
+
+    parser.add_argument('--shard', metavar='int', dest='shard',
+                        type=int, nargs='?', default=None,
+                        help='train only on shard number SHARD (0 based) of --shards and save the partial model, to be merged with merger.py')
+
+    parser.add_argument('--joint', dest='joint', action='store_true',
+                        help='store both models in one count table with a shared vocabulary. laplace only')
+
+    parser.add_argument('--compile', dest='compile', action='store_true',
+                        help='save only the log likelihood ratio of every transition. classifies faster, but without debug info. laplace only')
+
     args = parser.parse_args()
 
     if not args.file:
@@ -43,9 +76,33 @@ def main():
         print("no negative corpus given")
         return 1
 
-    markov_classifier = MarkovClassifier(order=args.order, smoothing=args.smoothing)
+    if not args.update and args.order is None:
+        print("no order given")
+        return 1
+
+    if not args.update and not args.smoothing:
+        print("no smoothing given")
+        return 1
+
+    if args.shard is not None and (args.update or args.joint or args.compile):
+        print("a shard can only be trained into a plain model, join or compile it when merging")
+        return 1
+
     try:
-        markov_classifier.trainOnCorpora(posfile=args.pos, negfile=args.neg)
+        cacheDir = None if args.no_cache else args.cache_dir
+        if args.update:
+            markov_classifier = MarkovClassifier.loadFromFile(args.file)
+            markov_classifier.updateOnCorpora(posfile=args.pos, negfile=args.neg, cacheDir=cacheDir)
+        else:
+            markov_classifier = MarkovClassifier(order=args.order, smoothing=args.smoothing, tokenizer=args.tokenizer)
+            if args.shard is not None:
+                markov_classifier.trainOnShard(posfile=args.pos, negfile=args.neg, shard=args.shard, shards=args.shards)
+            else:
+                markov_classifier.trainOnCorpora(posfile=args.pos, negfile=args.neg, workers=args.jobs, cacheDir=cacheDir, shards=args.shards)
+        if args.compile:
+            markov_classifier.compileRatios()
+        elif args.joint:
+            markov_classifier.joinModels()
     except Exception as e:
         print("Error training Markov Classifier")
         print("%s" % (e))